@@ -0,0 +1,548 @@
+# api_server.py
+# An HTTP/JSON API over the same data and queries as the Tk application, so that one process can serve many clients.
+# Requests are handled on threads, reads go through a pool of read-only connections and every write goes through one
+# WriteQueue, which serializes and group-commits them.
+#
+# Usage: python api_server.py database.db [--host 127.0.0.1] [--port 8000] [--readers 4]
+#
+# Endpoints (all bodies are JSON, everything except login needs an "Authorization: Bearer <token>" header):
+#   POST   /login                    {"user_id": 1, "password": "..."} -> {"token", "user_id", "name"}
+#   POST   /logout
+#   GET    /feed?page=0&size=5
+#   GET    /search/tweets?q=word,#tag&page=0&size=5
+#   GET    /search/users?q=name&page=0&size=5
+#   GET    /users/<id>               profile summary and the first page of the user's tweets
+#   GET    /users/<id>/tweets?page=0&size=3
+#   GET    /users/<id>/followers?page=0&size=5
+#   POST   /users/<id>/follow
+#   DELETE /users/<id>/follow
+#   GET    /tweets/<id>
+#   POST   /tweets                   {"text": "..."}
+#   POST   /tweets/<id>/replies      {"text": "..."}
+#   POST   /tweets/<id>/retweet
+#
+# The lists answer {"page", "size", "more", "next", "items"}. A list is only read up to the end of the page asked for,
+# and next (null on the last page) can be sent back as after=<next> instead of page to read just the following page,
+# which costs the same however deep it is. The tweets of a user are only paged by number.
+import argparse
+import base64
+import json
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import db
+import queries
+from pool import ConnectionPool
+from write_queue import WriteQueue
+from exceptions import (NonexistentDatabaseException, UnknownProfileException, InvalidHashtagException,
+                        DuplicateHashtagException, PoolTimeoutException)
+
+
+class ApiError(Exception):
+    """
+    An error that is sent back to the client with the given HTTP status.
+    """
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+def encode_cursor(row):
+    """
+    Turns the last row of a page into the cursor that the client sends back as after= for the next page.
+    Inputs:
+        row (tuple): a row of the query of the list.
+    Returns:
+        str: the cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(row).encode("utf-8")).decode("ascii")
+
+
+def page_request(query, default_size=5, position=None):
+    """
+    Reads which page of a list the client asks for.
+    Inputs:
+        query (dict): the parsed query string, "page" (0-based), "size" and "after" are read from it.
+        default_size (int): the page size when the client does not give one.
+        position (function or None): gets where a row goes in the list (such as queries.feed_position), None for the
+        lists that can only be paged by number.
+    Raises:
+        ApiError: If page or size are not valid numbers, or after is not a cursor of this list.
+    Returns:
+        tuple: (page, size, the row to start after or None)
+    """
+    try:
+        page = int(query.get("page", ["0"])[0])
+        size = int(query.get("size", [str(default_size)])[0])
+    except ValueError:
+        raise ApiError(400, "page and size must be numbers")
+    if page < 0 or not 1 <= size <= 100:
+        raise ApiError(400, "page must be 0 or more and size between 1 and 100")
+    if "after" not in query:
+        return page, size, None
+    if position is None:
+        raise ApiError(400, "this list is only paged with page")
+    try:
+        after = tuple(json.loads(base64.urlsafe_b64decode(query["after"][0].encode("ascii"))))
+        position(after)
+    except (ValueError, TypeError, IndexError):
+        raise ApiError(400, "after must be the next cursor of the previous page")
+    return page, size, after
+
+
+def page_of(rows, request, shape, position=None):
+    """
+    Cuts one page out of the rows that were read for it, the same way the screens page through them.
+    Inputs:
+        rows (list of tuple): the rows up to the end of the page, and one more if there is a next page.
+        request (tuple): (page, size, after) as page_request read them, the rows start at the page when after is given.
+        shape (function): turns a row into the JSON object of an item.
+        position (function or None): see page_request, the page gets a next cursor when it is given.
+    Returns:
+        dict: the items of the page along with the page number, the page size, whether there are more and the cursor
+        of the next page.
+    """
+    page, size, after = request
+    start = 0 if after is not None else page * size
+    more = len(rows) > start + size
+    rows = rows[start:start + size]
+    return {"page": page, "size": size, "more": more,
+            "next": encode_cursor(rows[-1]) if more and position is not None else None,
+            "items": [shape(row) for row in rows]}
+
+
+def feed_item(row):
+    """The JSON object of a (tid, text, tdate, ttime, writer_id, name, status) row of the feed."""
+    tid, text, tdate, ttime, writer_id, name, status = row
+    return {"tid": tid, "text": text, "date": tdate, "time": ttime, "user_id": writer_id, "name": name,
+            "status": status}
+
+
+def tweet_item(row):
+    """The JSON object of a (writer_id, tid, text, tdate, ttime) row of a search or of a user's tweets."""
+    writer_id, tid, text, tdate, ttime = row
+    return {"writer_id": writer_id, "tid": tid, "text": text, "date": tdate, "time": ttime}
+
+
+def user_item(row):
+    """The JSON object of a (usr, name) row."""
+    usr, name = row
+    return {"user_id": usr, "name": name}
+
+
+def parse_keywords(query):
+    """
+    Reads the comma-separated keywords of a search, with the same rules as the search screens.
+    Inputs:
+        query (dict): the parsed query string, the keywords are in "q".
+    Raises:
+        ApiError: If there are no keywords, duplicate keywords or a lone '#'.
+    Returns:
+        list of str: the lowercased keywords.
+    """
+    raw_input = query.get("q", [""])[0]
+    keywords = [keyword.lower().strip() for keyword in raw_input.split(",") if keyword.strip()]
+    if not keywords:
+        raise ApiError(400, "Please enter one or more keywords.")
+    if len(keywords) != len(set(keywords)):
+        raise ApiError(400, "Please remove duplicate keyword from search. Search keywords are not case sensitive.")
+    if "#" in keywords:
+        raise ApiError(400, "Please enter keyword after hashtag(#).")
+    return keywords
+
+
+class Api:
+    """
+    The application logic of the server: it owns the reader pool, the write queue and the logged in sessions, and has
+    one method per endpoint. Every method gets the logged in user id (None for login), the id captured from the path
+    (or None), the parsed query string and the JSON body, and returns a (status, JSON-serializable object) pair.
+    """
+
+    def __init__(self, db_name, readers=4, profile="interactive", pool_timeout=5.0):
+        """
+        Opens the writer connection and the reader pool.
+        Inputs:
+            db_name (str): path to the database file.
+            readers (int): the number of pooled reader connections.
+            profile (str): the connection profile of the writer, the readers always use read-only.
+            pool_timeout (float): how long a request waits for a free reader before giving up.
+        Returns:
+            None
+        """
+        # the writer is opened first so that the file is switched to WAL before the read-only connections attach
+        self.write_queue = WriteQueue(db.open_db(db_name, profile, load_extension=False, check_same_thread=False))
+        self.pool = ConnectionPool(db_name, size=readers)
+        self.pool_timeout = pool_timeout
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+        # (method, path pattern, handler, needs a logged in user)
+        self.routes = [
+            ("POST", r"/login", self.login, False),
+            ("POST", r"/logout", self.logout, True),
+            ("GET", r"/feed", self.feed, True),
+            ("GET", r"/search/tweets", self.search_tweets, True),
+            ("GET", r"/search/users", self.search_users, True),
+            ("GET", r"/users/(\d+)", self.profile, True),
+            ("GET", r"/users/(\d+)/tweets", self.user_tweets, True),
+            ("GET", r"/users/(\d+)/followers", self.followers, True),
+            ("POST", r"/users/(\d+)/follow", self.follow, True),
+            ("DELETE", r"/users/(\d+)/follow", self.unfollow, True),
+            ("GET", r"/tweets/(\d+)", self.tweet_detail, True),
+            ("POST", r"/tweets", self.compose, True),
+            ("POST", r"/tweets/(\d+)/replies", self.reply, True),
+            ("POST", r"/tweets/(\d+)/retweet", self.retweet, True),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler, auth)
+                       for method, pattern, handler, auth in self.routes]
+
+    def close(self):
+        """
+        Commits the pending writes and closes every connection.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.write_queue.close()
+        self.pool.close()
+
+    def dispatch(self, method, path, query, body, token):
+        """
+        Finds the handler of a request and runs it, turning database errors into HTTP statuses.
+        Inputs:
+            method (str): the HTTP method.
+            path (str): the path of the URL.
+            query (dict): the parsed query string.
+            body (dict): the parsed JSON body, empty when there is none.
+            token (str or None): the bearer token of the request.
+        Returns:
+            tuple: (status, JSON-serializable object)
+        """
+        path_matched = False
+        for route_method, pattern, handler, needs_user in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+            user_id = None
+            if needs_user:
+                with self.sessions_lock:
+                    user_id = self.sessions.get(token)
+                if user_id is None:
+                    return 401, {"error": "Please log in first."}
+            target = int(match.group(1)) if match.groups() else None
+            try:
+                return handler(user_id, target, query, body, token)
+            except ApiError as e:
+                return e.status, {"error": e.message}
+            except (InvalidHashtagException, DuplicateHashtagException) as e:
+                return 400, {"error": e.message}
+            except PoolTimeoutException as e:
+                return 503, {"error": e.message}
+            except sqlite3.IntegrityError as e:
+                return 409, {"error": str(e)}
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e):
+                    return 503, {"error": "The database is busy, please try again."}
+                return self.server_error(method, path, e)
+            except ValueError as e:
+                # such as a number in the query string that does not parse
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return self.server_error(method, path, e)
+        if path_matched:
+            return 405, {"error": f"{method} is not allowed on {path}"}
+        return 404, {"error": f"No such endpoint: {path}"}
+
+    def server_error(self, method, path, error):
+        """
+        Answers a request whose handler failed unexpectedly, so that the client still gets a response. The traceback
+        goes to stderr.
+        Inputs:
+            method (str): the HTTP method.
+            path (str): the path of the URL.
+            error (Exception): what the handler raised.
+        Returns:
+            tuple: (500, JSON-serializable object)
+        """
+        print(f"{method} {path} failed:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+        return 500, {"error": f"The server could not handle the request: {error}"}
+
+    def read(self, query_function, *args):
+        """
+        Runs a read function from queries on a pooled reader connection.
+        Inputs:
+            query_function (function): called as query_function(conn, *args).
+        Returns:
+            object: whatever the function returned.
+        """
+        with self.pool.connection(self.pool_timeout) as conn:
+            return query_function(conn, *args)
+
+    def read_page(self, query_function, args, query, shape, default_size=5, position=None):
+        """
+        Reads one page of a list, passing the query a limit (and the row to start after) so that only the rows up to
+        the end of the page are read.
+        Inputs:
+            query_function (function): called as query_function(conn, *args, limit) or, with an after= cursor,
+            query_function(conn, *args, limit, after).
+            args (tuple): the arguments of the query before the limit.
+            query (dict): the parsed query string, see page_request.
+            shape (function): turns a row into the JSON object of an item.
+            default_size (int): the page size when the client does not give one.
+            position (function or None): see page_request.
+        Raises:
+            ApiError: If the page asked for is not valid.
+        Returns:
+            dict: the page, see page_of.
+        """
+        request = page_request(query, default_size, position)
+        page, size, after = request
+        if after is None:
+            rows = self.read(query_function, *args, (page + 1) * size + 1)
+        else:
+            rows = self.read(query_function, *args, size + 1, after)
+        return page_of(rows, request, shape, position)
+
+    # Endpoints
+    def login(self, user_id, target, query, body, token):
+        """Checks the credentials and starts a session, like LoginScreen.attempt_login."""
+        try:
+            login_id = int(body.get("user_id"))
+        except (TypeError, ValueError):
+            raise ApiError(400, "User ID must be a number.")
+        user = self.read(queries.authenticate, login_id, str(body.get("password", "")))
+        if not user:
+            raise ApiError(401, "Invalid User ID or Password")
+        new_token = secrets.token_urlsafe(24)
+        with self.sessions_lock:
+            self.sessions[new_token] = login_id
+        return 200, {"token": new_token, "user_id": login_id, "name": user[1]}
+
+    def logout(self, user_id, target, query, body, token):
+        """Ends the session of the token."""
+        with self.sessions_lock:
+            self.sessions.pop(token, None)
+        return 200, {}
+
+    def feed(self, user_id, target, query, body, token):
+        """A page of the logged in user's feed, like FeedScreen."""
+        return 200, self.read_page(queries.load_feed, (user_id,), query, feed_item, position=queries.feed_position)
+
+    def search_tweets(self, user_id, target, query, body, token):
+        """A page of tweets matching the keywords, like SearchTweetsScreen."""
+        return 200, self.read_page(queries.search_tweets, (parse_keywords(query),), query, tweet_item,
+                                   position=queries.search_position)
+
+    def search_users(self, user_id, target, query, body, token):
+        """A page of users whose name matches the keywords, like SearchUsersScreen."""
+        return 200, self.read_page(queries.search_users, (parse_keywords(query),), query, user_item,
+                                   position=queries.user_search_position)
+
+    def profile(self, user_id, target, query, body, token):
+        """The profile summary of a user and the first page of their tweets, like UserProfileScreen."""
+        with self.pool.connection(self.pool_timeout) as conn:
+            summary = queries.get_profile_summary(conn, target)
+            if summary is None:
+                raise ApiError(404, "User not found.")
+            following = queries.is_following(conn, user_id, target)
+            tweets = queries.get_user_tweets(conn, target, 4)
+        name, num_posts, num_following, num_followers = summary
+        return 200, {"user_id": target, "name": name, "posts": num_posts, "following": num_following,
+                     "followers": num_followers, "is_following": following,
+                     "tweets": page_of(tweets, (0, 3, None), tweet_item)}
+
+    def user_tweets(self, user_id, target, query, body, token):
+        """A page of a user's tweets."""
+        return 200, self.read_page(queries.get_user_tweets, (target,), query, tweet_item, default_size=3)
+
+    def followers(self, user_id, target, query, body, token):
+        """A page of a user's followers, like ListFollowersScreen."""
+        return 200, self.read_page(queries.list_followers, (target,), query, user_item,
+                                   position=queries.follower_position)
+
+    def follow(self, user_id, target, query, body, token):
+        """Follows a user, like UserProfileScreen.follow_user."""
+        if target == user_id:
+            raise ApiError(400, "You cannot follow yourself.")
+        self.write_queue.execute(queries.follow_user, user_id, target)
+        return 201, {}
+
+    def unfollow(self, user_id, target, query, body, token):
+        """Unfollows a user, like UserProfileScreen.unfollow_user."""
+        self.write_queue.execute(queries.unfollow_user, user_id, target)
+        return 200, {}
+
+    def tweet_detail(self, user_id, target, query, body, token):
+        """A tweet and its counters, like TweetDetailScreen."""
+        with self.pool.connection(self.pool_timeout) as conn:
+            tweet = queries.get_tweet(conn, target)
+            if tweet is None:
+                raise ApiError(404, "Tweet not found.")
+            is_retweet, num_retweets, num_spams, num_replies = queries.get_tweet_stats(conn, target, user_id)
+        text, tdate, ttime, writer_id = tweet
+        return 200, {"tid": target, "type": "Retweet" if is_retweet else "Tweet", "date": tdate, "time": ttime,
+                     "text": text, "writer_id": writer_id, "retweets": num_retweets, "spams": num_spams,
+                     "replies": num_replies}
+
+    def compose(self, user_id, target, query, body, token):
+        """Posts a tweet, like ComposeTweetScreen.submit_tweet."""
+        text = str(body.get("text", "")).strip()
+        if not text:
+            raise ApiError(400, "Tweet cannot be empty")
+        tid = self.write_queue.execute(queries.post_tweet, user_id, text, queries.extract_hashtags(text))
+        return 201, {"tid": tid}
+
+    def reply(self, user_id, target, query, body, token):
+        """Posts a reply to a tweet, like ReplyTweetScreen.post_reply."""
+        text = str(body.get("text", "")).strip()
+        if not text:
+            raise ApiError(400, "Reply cannot be empty.")
+        if self.read(queries.get_tweet, target) is None:
+            raise ApiError(404, "Tweet not found.")
+        tid = self.write_queue.execute(queries.post_tweet, user_id, text, queries.extract_hashtags(text),
+                                       replyto_tid=target)
+        return 201, {"tid": tid}
+
+    def retweet(self, user_id, target, query, body, token):
+        """Retweets a tweet, like TweetDetailScreen.retweet."""
+        tweet = self.read(queries.get_tweet, target)
+        if tweet is None:
+            raise ApiError(404, "Tweet not found.")
+        self.write_queue.execute(queries.retweet, target, user_id, tweet[3])
+        return 201, {}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Turns HTTP requests into calls to the Api object of the server, and its answers into JSON responses.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self, method):
+        """
+        Parses the request, dispatches it and writes the response.
+        Inputs:
+            method (str): the HTTP method.
+        Returns:
+            None
+        """
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            if not isinstance(body, dict):
+                raise ValueError
+        except ValueError:
+            self.send_json(400, {"error": "The body must be a JSON object"})
+            return
+
+        authorization = self.headers.get("Authorization", "")
+        token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+        status, payload = self.server.api.dispatch(method, url.path.rstrip("/") or "/", parse_qs(url.query), body,
+                                                   token)
+        self.send_json(status, payload)
+
+    def send_json(self, status, payload):
+        """
+        Writes a JSON response.
+        Inputs:
+            status (int): the HTTP status.
+            payload (object): the JSON-serializable response body.
+        Returns:
+            None
+        """
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def log_message(self, format, *args):
+        # the access log is only printed when --verbose is given, it costs a lot under load
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiHttpServer(ThreadingHTTPServer):
+    """
+    The threaded HTTP server, with a listen backlog that is large enough for many clients connecting at once.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(api, host="127.0.0.1", port=8000, verbose=False):
+    """
+    Creates the threaded HTTP server for an Api object, without starting it.
+    Inputs:
+        api (Api): the application logic.
+        host (str), port (int): where to listen, port 0 picks a free port.
+        verbose (bool): whether to print an access log line for every request.
+    Returns:
+        ApiHttpServer: the server, call serve_forever on it.
+    """
+    server = ApiHttpServer((host, port), RequestHandler)
+    server.api = api
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    """
+    Parses the command line and serves until interrupted.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Serve the application's data as an HTTP/JSON API.")
+    parser.add_argument("database", help="the database file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--readers", type=int, default=4, help="pooled reader connections (default 4)")
+    parser.add_argument("--profile", default=db.DEFAULT_PROFILE, help="connection profile of the writer")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every request")
+    args = parser.parse_args(argv)
+
+    try:
+        api = Api(args.database, readers=args.readers, profile=args.profile)
+    except (NonexistentDatabaseException, UnknownProfileException, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    server = make_server(api, args.host, args.port, args.verbose)
+    print(f"Serving {args.database} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
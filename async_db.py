@@ -0,0 +1,193 @@
+# async_db.py
+# asyncio versions of the queries behind the feed, search, profile and tweet detail screens and of the write actions.
+# sqlite3 calls block, so every read runs on a small thread pool where each thread has its own pooled connection, and
+# every write goes through a WriteQueue. Cancelling the awaiting task also stops the query it started: a progress
+# handler on the connection aborts the statement the next time SQLite checks in.
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import queries
+from pool import ConnectionPool
+from write_queue import WriteQueue
+
+# how many SQLite virtual machine instructions run between two checks for cancellation
+CANCEL_CHECK_INSTRUCTIONS = 1000
+
+
+class _Call:
+    """
+    The state that a read shares between the event loop (which may cancel it) and the worker thread running it.
+    """
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+
+class AsyncDatabase:
+    """
+    A bounded, executor-backed data access object for asyncio code. At most `readers` queries run at once, further
+    reads wait for a free worker.
+    """
+
+    def __init__(self, db_name, readers=4, profile=db.DEFAULT_PROFILE, write_queue=None):
+        """
+        Opens the reader connections, and a writer unless an existing write queue is given.
+        Inputs:
+            db_name (str): path to the database file.
+            readers (int): the number of reader threads and connections.
+            profile (str): the connection profile of the writer, the readers always use read-only.
+            write_queue (WriteQueue or None): a queue to share with other code, a new one is made when None.
+        Returns:
+            None
+        """
+        self.owns_write_queue = write_queue is None
+        if write_queue is None:
+            write_queue = WriteQueue(db.open_db(db_name, profile, load_extension=False, check_same_thread=False))
+        self.write_queue = write_queue
+        self.pool = ConnectionPool(db_name, size=readers)
+        self.executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="async-db")
+
+    def close(self):
+        """
+        Waits for the running reads, commits the pending writes and closes every connection.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+        if self.owns_write_queue:
+            self.write_queue.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+        return False
+
+    def _run_read(self, call, query_function, args):
+        """
+        Runs on a worker thread: borrows a connection and runs the query function on it, unless the call was cancelled
+        while it was waiting for the worker.
+        Inputs:
+            call (_Call): the shared state of the call.
+            query_function (function): called as query_function(conn, *args).
+            args (tuple): the other arguments of the query function.
+        Raises:
+            asyncio.CancelledError: If the call was cancelled before or while it ran.
+        Returns:
+            object: whatever the query function returned.
+        """
+        if call.cancelled.is_set():
+            raise asyncio.CancelledError()
+        with self.pool.connection() as conn:
+            # a non-zero return value from the handler makes SQLite abort the running statement
+            conn.set_progress_handler(call.cancelled.is_set, CANCEL_CHECK_INSTRUCTIONS)
+            try:
+                return query_function(conn, *args)
+            except sqlite3.OperationalError:
+                if call.cancelled.is_set():
+                    raise asyncio.CancelledError()
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+
+    async def read(self, query_function, *args):
+        """
+        Runs any read function from queries without blocking the event loop.
+        Inputs:
+            query_function (function): called as query_function(conn, *args) on a pooled connection.
+        Returns:
+            object: whatever the query function returned.
+        """
+        call = _Call()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self._run_read, call, query_function, args)
+        except asyncio.CancelledError:
+            call.cancelled.set()
+            raise
+
+    async def write(self, operation, *args, **kwargs):
+        """
+        Runs a write function from queries through the write queue and waits for its commit. Cancelling it only helps
+        while the write is still queued, once its batch has started it will be committed.
+        Inputs:
+            operation (function): called as operation(conn, *args, **kwargs) by the writer.
+        Returns:
+            object: whatever the operation returned.
+        """
+        return await asyncio.wrap_future(self.write_queue.submit(operation, *args, **kwargs))
+
+    # Reads, named after the functions in queries that they run
+    async def authenticate(self, user_id, password):
+        """See queries.authenticate."""
+        return await self.read(queries.authenticate, user_id, password)
+
+    async def load_feed(self, user_id, limit=None, after=None):
+        """The rows of FeedScreen, see queries.load_feed, limit and after page through them."""
+        return await self.read(queries.load_feed, user_id, limit, after)
+
+    async def search_tweets(self, keywords, limit=None, after=None):
+        """The rows of SearchTweetsScreen, see queries.search_tweets, limit and after page through them."""
+        return await self.read(queries.search_tweets, keywords, limit, after)
+
+    async def search_users(self, keywords, limit=None, after=None):
+        """The rows of SearchUsersScreen, see queries.search_users, limit and after page through them."""
+        return await self.read(queries.search_users, keywords, limit, after)
+
+    async def get_profile_summary(self, user_id):
+        """The counters at the top of UserProfileScreen, see queries.get_profile_summary."""
+        return await self.read(queries.get_profile_summary, user_id)
+
+    async def is_following(self, follower_id, followee_id):
+        """See queries.is_following."""
+        return await self.read(queries.is_following, follower_id, followee_id)
+
+    async def get_user_tweets(self, user_id, limit=None):
+        """The "Recent Tweets" of UserProfileScreen, see queries.get_user_tweets."""
+        return await self.read(queries.get_user_tweets, user_id, limit)
+
+    async def list_followers(self, user_id, limit=None, after=None):
+        """The rows of ListFollowersScreen, see queries.list_followers, limit and after page through them."""
+        return await self.read(queries.list_followers, user_id, limit, after)
+
+    async def get_tweet(self, tweet_id):
+        """The tweet shown by TweetDetailScreen, see queries.get_tweet."""
+        return await self.read(queries.get_tweet, tweet_id)
+
+    async def get_tweet_stats(self, tweet_id, user_id):
+        """The counters of TweetDetailScreen, see queries.get_tweet_stats."""
+        return await self.read(queries.get_tweet_stats, tweet_id, user_id)
+
+    # Writes
+    async def post_tweet(self, writer_id, text, replyto_tid=None):
+        """
+        Posts a tweet or a reply, like ComposeTweetScreen and ReplyTweetScreen.
+        Inputs:
+            writer_id (int): the id of the writer.
+            text (str): the text of the tweet.
+            replyto_tid (int or None): the tweet being replied to.
+        Raises:
+            InvalidHashtagException, DuplicateHashtagException: If the hashtags break the compose rules.
+        Returns:
+            int: the id of the new tweet.
+        """
+        hashtags = queries.extract_hashtags(text)
+        return await self.write(queries.post_tweet, writer_id, text, hashtags, replyto_tid=replyto_tid)
+
+    async def retweet(self, tweet_id, retweeter_id, writer_id):
+        """See queries.retweet."""
+        return await self.write(queries.retweet, tweet_id, retweeter_id, writer_id)
+
+    async def follow_user(self, follower_id, followee_id):
+        """See queries.follow_user."""
+        return await self.write(queries.follow_user, follower_id, followee_id)
+
+    async def unfollow_user(self, follower_id, followee_id):
+        """See queries.unfollow_user."""
+        return await self.write(queries.unfollow_user, follower_id, followee_id)
@@ -0,0 +1,116 @@
+# autocomplete.py
+# Suggests hashtags while they are being typed. The distinct terms of hashtag_mentions are kept in a sorted list, so the
+# terms that start with what has been typed so far are one contiguous slice of it that two bisections find. The slice
+# is ranked by how many times each term has been mentioned. Short prefixes ("#", "#a") cover most of the list, so their
+# top suggestions are cached, and a cached prefix is forgotten again as soon as one of its terms is mentioned.
+#
+# The counts are read once in full and then caught up incrementally: only the mentions of tweets with a higher id than
+# the last one read are counted, right after something is posted and otherwise every few seconds.
+import bisect
+import heapq
+import time
+
+# a prefix whose slice holds more terms than this gets its suggestions cached
+CACHE_ABOVE = 64
+# how many suggestions are cached per prefix, the most that suggest can return for such a prefix
+CACHED_SUGGESTIONS = 10
+# the highest character, every term with a prefix sorts below prefix + LAST_CHARACTER
+LAST_CHARACTER = chr(0x10FFFF)
+
+
+class HashtagCompleter:
+    """
+    The terms that have been mentioned and how often, with the lookups that the suggestions need. It is only used from
+    the thread of the interface.
+    """
+
+    def __init__(self, read_counts, refresh_seconds=5.0):
+        """
+        Creates an empty completer, it reads the counts the first time it is asked for suggestions.
+        Inputs:
+            read_counts (function): called as read_counts(after_tid), returns (term, mentions, highest tid) rows for the
+            mentions of the tweets with an id above after_tid (see queries.get_hashtag_counts).
+            refresh_seconds (float): how old the counts can get before suggest catches up on its own.
+        Returns:
+            None
+        """
+        self.read_counts = read_counts
+        self.refresh_seconds = refresh_seconds
+        self.terms = []
+        self.counts = {}
+        # prefix -> its top CACHED_SUGGESTIONS terms
+        self.cache = {}
+        self.last_tid = None
+        self.refreshed_at = 0.0
+
+    def add(self, rows):
+        """
+        Counts mentions.
+        Inputs:
+            rows (iterable of tuple): (term, mentions, highest tid) rows, see read_counts.
+        Returns:
+            None
+        """
+        for term, mentions, last_tid in rows:
+            if term not in self.counts:
+                bisect.insort(self.terms, term)
+                self.counts[term] = 0
+            self.counts[term] += mentions
+            self.last_tid = max(self.last_tid, last_tid)
+            for end in range(1, len(term) + 1):
+                self.cache.pop(term[:end], None)
+
+    def refresh(self):
+        """
+        Counts the mentions posted since the last refresh, or all of them the first time.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        first = self.last_tid is None
+        rows = self.read_counts(-1 if first else self.last_tid)
+        if first:
+            # one sort instead of an insertion per term
+            self.counts = {term: mentions for term, mentions, last_tid in rows}
+            self.terms = sorted(self.counts)
+            self.cache = {}
+            self.last_tid = max((last_tid for term, mentions, last_tid in rows), default=-1)
+        else:
+            self.add(rows)
+        self.refreshed_at = time.monotonic()
+
+    def _rank(self, low, high, limit):
+        """
+        Gets the most mentioned terms of a slice of the sorted terms.
+        Inputs:
+            low (int), high (int): the slice.
+            limit (int): the number of terms.
+        Returns:
+            list of str: the terms, the most mentioned first and alphabetically on a tie.
+        """
+        counts = self.counts
+        return heapq.nsmallest(limit, self.terms[low:high], key=lambda term: (-counts[term], term))
+
+    def suggest(self, prefix, limit=5):
+        """
+        Gets the hashtags that start with a prefix, the most mentioned first.
+        Inputs:
+            prefix (str): what has been typed so far, starting with '#'.
+            limit (int): the number of suggestions, at most CACHED_SUGGESTIONS.
+        Returns:
+            list of str: the hashtags.
+        """
+        if self.last_tid is None or time.monotonic() - self.refreshed_at > self.refresh_seconds:
+            self.refresh()
+        prefix = prefix.lower()
+        cached = self.cache.get(prefix)
+        if cached is not None:
+            return cached[:limit]
+        low = bisect.bisect_left(self.terms, prefix)
+        high = bisect.bisect_left(self.terms, prefix + LAST_CHARACTER, low)
+        if high - low <= CACHE_ABOVE:
+            return self._rank(low, high, limit)
+        suggestions = self._rank(low, high, CACHED_SUGGESTIONS)
+        self.cache[prefix] = suggestions
+        return suggestions[:limit]
@@ -0,0 +1,422 @@
+# benchmarks.py
+# Offline benchmarks of the parts of the app that do not need a window.
+#
+#   cache - replays navigation traces through the lookup cache (see cache.py) with every eviction policy and a few
+#           sizes, and reports the hit rates and the time spent in the lookups next to the same trace run uncached.
+#           Only the screens that read are timed.
+#   memory - loads the biggest feed, profile, search results and follower list of the database and compares the memory
+#            that they take as lists of tuples, as the queries return them, and as the CompactRows that the screens
+#            keep (see compact_rows.py).
+#
+# A navigation trace is a JSON-lines file with one screen per line, in the order a user saw them:
+#   {"screen": "tweet_detail", "user_id": 12, "target": 345, "seconds": 4.0}
+# where target is the tweet or the user that the screen is about, and seconds is how long the user stayed before the
+# next step. Going back shows the previous screen again, so it is written as that screen once more. The screens that
+# write (follow, unfollow, post) are run in a transaction that is rolled back, the database is left as it was.
+# The session traces that the app records (see session_trace.py) can be replayed too, their steps that the cache does
+# not take part in, such as the searches, are left out.
+# Without --trace, random sessions are generated from the database, and --save-trace keeps them for later runs.
+#
+# Usage: python benchmarks.py cache database.db [--trace trace.jsonl | --sessions 200 --steps 40 --seed 0]
+#                                               [--save-trace trace.jsonl] [--entries 100,1000,10000]
+#                                               [--max-bytes N] [--ttl 60] [--repeat 3]
+#        python benchmarks.py memory database.db
+import argparse
+import gc
+import json
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import db
+import queries
+from cache import Cache, CachedQueries, POLICIES, TTLPolicy
+from compact_rows import CompactRows, FEED_ROW, TWEET_ROW, USER_ROW
+from exceptions import NonexistentDatabaseException
+
+
+def show_main_menu(conn, lookups, step):
+    lookups.get_user_name(conn, step["user_id"])
+
+
+def show_feed(conn, lookups, step):
+    lookups.get_followed_users(conn, step["user_id"])
+
+
+def show_tweet_detail(conn, lookups, step):
+    lookups.get_tweet(conn, step["target"])
+
+
+def show_user_profile(conn, lookups, step):
+    lookups.is_following(conn, step["user_id"], step["target"])
+
+
+def show_user_tweets(conn, lookups, step):
+    lookups.get_user_name(conn, step["target"])
+
+
+def follow(conn, lookups, step):
+    lookups.follow_user(conn, step["user_id"], step["target"])
+
+
+def unfollow(conn, lookups, step):
+    lookups.unfollow_user(conn, step["user_id"], step["target"])
+
+
+def post(conn, lookups, step):
+    lookups.post_tweet(conn, step["user_id"], "benchmark tweet", [])
+
+
+# screen -> what it asks of the cached lookups, the same calls as the screen of the app makes
+SCREENS = {
+    "main_menu": show_main_menu,
+    "feed": show_feed,
+    "tweet_detail": show_tweet_detail,
+    "user_profile": show_user_profile,
+    "user_tweets": show_user_tweets,
+    "follow": follow,
+    "unfollow": unfollow,
+    "post": post,
+}
+# the screens that write, their time is left out since the cache does not change it
+WRITES = {"follow", "unfollow", "post"}
+
+
+def read_trace(path):
+    """
+    Reads a navigation trace, without the steps of the screens that are not in SCREENS.
+    Inputs:
+        path (str): the JSON-lines file.
+    Raises:
+        ValueError: If a line is not a step.
+    Returns:
+        list of dict: the steps.
+    """
+    trace = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            step = json.loads(line)
+            if "screen" not in step or "user_id" not in step:
+                raise ValueError(f"{path}:{number}: not a step")
+            if step["screen"] in SCREENS:
+                trace.append(step)
+    return trace
+
+
+def write_trace(path, trace):
+    """
+    Writes a navigation trace, one step per line.
+    Inputs:
+        path (str): the file to write.
+        trace (list of dict): the steps.
+    Returns:
+        None
+    """
+    with open(path, "w") as f:
+        for step in trace:
+            f.write(json.dumps(step) + "\n")
+
+
+def navigation_trace(conn, sessions, steps, seed=0):
+    """
+    Generates the navigation of random sessions. A few users are much more active than the rest, and within a feed the
+    newest tweets are opened the most, which is what gives a cache something to hit.
+    Inputs:
+        conn (sqlite3.Connection): the database the steps refer to.
+        sessions (int): the number of sessions, each of them one login.
+        steps (int): the number of screens per session after the main menu.
+        seed (int): seeds the random choices.
+    Returns:
+        list of dict: the steps.
+    """
+    rng = random.Random(seed)
+    users = [row[0] for row in conn.execute("SELECT flwer FROM follows GROUP BY flwer ORDER BY flwer LIMIT 2000")]
+    if not users:
+        raise ValueError("The database has no users who follow anyone")
+    user_weights = [1.0 / (rank + 1) for rank in range(len(users))]
+    rng.shuffle(users)
+    feeds = {}
+    writers = {}
+    # the follows that the trace itself adds or removes: (follower, followee) -> following afterwards
+    toggled = {}
+    trace = []
+
+    def writer_of(tid):
+        if tid not in writers:
+            tweet = queries.get_tweet(conn, tid)
+            writers[tid] = tweet[3] if tweet else None
+        return writers[tid]
+
+    for session in range(sessions):
+        user_id = rng.choices(users, user_weights)[0]
+        if user_id not in feeds:
+            feeds[user_id] = [row[0] for row in queries.load_feed(conn, user_id, limit=30)]
+        feed = feeds[user_id]
+        stack = [("main_menu", None)]
+
+        def show(screen, target=None):
+            trace.append({"screen": screen, "user_id": user_id, "target": target,
+                          "seconds": round(rng.expovariate(1 / 5.0), 2)})
+
+        show("main_menu")
+        for i in range(steps):
+            screen, target = stack[-1]
+            pick = rng.random()
+            if screen == "main_menu":
+                if pick < 0.6 or not feed:
+                    stack.append(("feed", None))
+                elif pick < 0.8:
+                    # a user found through the search
+                    stack.append(("user_profile", rng.choice(users)))
+                else:
+                    show("post")
+                    stack.append(("main_menu", None))
+            elif screen == "feed" and pick < 0.7 and feed:
+                position = min(int(rng.expovariate(1 / 4.0)), len(feed) - 1)
+                stack.append(("tweet_detail", feed[position]))
+            elif screen == "tweet_detail" and pick < 0.4 and writer_of(target) is not None:
+                stack.append(("user_profile", writer_of(target)))
+            elif screen == "user_profile" and pick < 0.3:
+                stack.append(("user_tweets", target))
+            elif screen == "user_profile" and pick < 0.5 and target != user_id:
+                edge = (user_id, target)
+                if edge not in toggled:
+                    toggled[edge] = queries.is_following(conn, user_id, target)
+                show("unfollow" if toggled[edge] else "follow", target)
+                toggled[edge] = not toggled[edge]
+                # the profile is built again to show the new button
+                stack.append(stack.pop())
+            elif len(stack) > 1:
+                stack.pop()
+            else:
+                stack.append(("feed", None))
+            show(*stack[-1])
+    return trace
+
+
+def replay(conn, trace, lookups, clock=None):
+    """
+    Runs the lookups of every step of a trace, then rolls back what the steps wrote.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        trace (list of dict): the steps.
+        lookups (module or CachedQueries): queries, or the cache in front of it.
+        clock (list of float or None): the time of the trace, moved on by the seconds of each step, for a TTLPolicy
+        that reads clock[0].
+    Returns:
+        tuple: (seconds spent in the lookups of the screens that only read, number of steps that could not be run
+        on this database)
+    """
+    elapsed = 0.0
+    skipped = 0
+    try:
+        for step in trace:
+            start = time.perf_counter()
+            try:
+                SCREENS[step["screen"]](conn, lookups, step)
+            except sqlite3.IntegrityError:
+                # a recorded trace can follow someone that this database already has as followed
+                skipped += 1
+            if step["screen"] not in WRITES:
+                elapsed += time.perf_counter() - start
+            if clock is not None:
+                clock[0] += step.get("seconds", 0.0)
+    finally:
+        conn.rollback()
+    return elapsed, skipped
+
+
+def benchmark_cache(args):
+    """
+    Runs the cache benchmark and prints its report.
+    Inputs:
+        args (argparse.Namespace): the parsed command line.
+    Returns:
+        None
+    """
+    conn = db.open_db(args.database, load_extension=False)
+    try:
+        if args.trace:
+            trace = read_trace(args.trace)
+        else:
+            trace = navigation_trace(conn, args.sessions, args.steps, args.seed)
+        if args.save_trace:
+            write_trace(args.save_trace, trace)
+        counts = {}
+        for step in trace:
+            counts[step["screen"]] = counts.get(step["screen"], 0) + 1
+        print(f"{len(trace)} steps: " + ", ".join(f"{screen}={n}" for screen, n in sorted(counts.items())))
+
+        # one uncached run to warm up the page cache of the database, then the fastest of --repeat runs
+        replay(conn, trace, queries)
+        uncached, skipped = min(replay(conn, trace, queries) for i in range(args.repeat))
+        if skipped:
+            print(f"{skipped} steps could not be run on this database and were skipped")
+        header = (f"{'policy':<8}{'entries':>9}{'hits':>9}{'misses':>9}{'hit %':>8}{'evicted':>9}{'expired':>9}"
+                  f"{'invalid':>9}{'KiB':>8}{'ms':>9}{'speedup':>9}")
+        print(header)
+        print("-" * len(header))
+        print(f"{'none':<8}{'':>9}{'':>9}{'':>9}{'':>8}{'':>9}{'':>9}{'':>9}{'':>8}{uncached * 1000:>9.1f}"
+              f"{1.0:>9.2f}")
+        for name in POLICIES:
+            for entries in args.entries:
+                elapsed = None
+                for i in range(args.repeat):
+                    clock = [0.0]
+                    policy = TTLPolicy(args.ttl, clock=lambda: clock[0]) if name == "ttl" else POLICIES[name]()
+                    cache = Cache(policy, max_entries=entries, max_bytes=args.max_bytes)
+                    run_elapsed, skipped = replay(conn, trace, CachedQueries(cache), clock)
+                    elapsed = run_elapsed if elapsed is None else min(elapsed, run_elapsed)
+                # every run gets the same counts
+                stats = cache.stats()
+                print(f"{name:<8}{entries:>9}{stats['hits']:>9}{stats['misses']:>9}{stats['hit_rate'] * 100:>8.1f}"
+                      f"{stats['evictions']:>9}{stats['expirations']:>9}{stats['invalidations']:>9}"
+                      # the sizes are only counted when there is a limit on them
+                      + (f"{stats['bytes'] / 1024:>8.1f}" if args.max_bytes else f"{'-':>8}") +
+                      f"{elapsed * 1000:>9.1f}{uncached / max(elapsed, 1e-9):>9.2f}")
+    finally:
+        conn.close()
+
+
+def traced_bytes():
+    """
+    Gets the memory allocated since tracemalloc was started, after a garbage collection.
+    Inputs:
+        None
+    Returns:
+        int: the bytes still allocated.
+    """
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def measure_rows(load, shape):
+    """
+    Measures the memory that a query result takes as the list of tuples it is returned as, then as CompactRows.
+    Inputs:
+        load (function): runs the query.
+        shape (str): the shape of its rows, see compact_rows.py.
+    Returns:
+        tuple: (number of rows, bytes as tuples, bytes as CompactRows)
+    """
+    tracemalloc.start()
+    try:
+        start = traced_bytes()
+        rows = load()
+        as_tuples = traced_bytes() - start
+        compact = CompactRows(shape, rows)
+        if compact != rows:
+            raise ValueError("CompactRows does not give back the rows it was given")
+        count = len(rows)
+        # only what the compact rows hold on to is left, strings that they share with the tuples included
+        del rows
+        as_compact = traced_bytes() - start
+    finally:
+        tracemalloc.stop()
+    return count, as_tuples, as_compact
+
+
+def benchmark_memory(args):
+    """
+    Runs the memory benchmark and prints its report.
+    Inputs:
+        args (argparse.Namespace): the parsed command line.
+    Returns:
+        None
+    """
+    conn = db.open_db(args.database)
+    try:
+        def most(sql):
+            row = conn.execute(sql).fetchone()
+            return row[0] if row else None
+
+        reader = most("SELECT flwer FROM follows GROUP BY flwer ORDER BY COUNT(*) DESC LIMIT 1")
+        writer = most("SELECT writer_id FROM tweets GROUP BY writer_id ORDER BY COUNT(*) DESC LIMIT 1")
+        followed = most("SELECT flwee FROM follows GROUP BY flwee ORDER BY COUNT(*) DESC LIMIT 1")
+        term = most("SELECT term FROM hashtag_mentions GROUP BY term ORDER BY COUNT(*) DESC LIMIT 1")
+        prefix = most("SELECT LOWER(SUBSTR(name, 1, 2)) AS prefix FROM users WHERE name IS NOT NULL "
+                      "GROUP BY prefix ORDER BY COUNT(*) DESC LIMIT 1")
+        results = [
+            (f"feed of user {reader}", lambda: queries.load_feed(conn, reader), FEED_ROW),
+            (f"tweets of user {writer}", lambda: queries.get_user_tweets(conn, writer), TWEET_ROW),
+            (f"search {term}", lambda: queries.search_tweets(conn, [term]), TWEET_ROW),
+            (f"search users '{prefix}'", lambda: queries.search_users(conn, [prefix]), USER_ROW),
+            (f"followers of {followed}", lambda: queries.list_followers(conn, followed), USER_ROW),
+        ]
+        header = (f"{'result':<28}{'rows':>8}{'tuples KiB':>12}{'compact KiB':>13}{'B/row':>8}{'B/row':>8}"
+                  f"{'ratio':>8}")
+        print(header)
+        print("-" * len(header))
+        for name, load, shape in results:
+            if None in (reader, writer, followed, term, prefix):
+                # an empty table, there is nothing big to load
+                continue
+            count, as_tuples, as_compact = measure_rows(load, shape)
+            if not count:
+                continue
+            print(f"{name:<28}{count:>8}{as_tuples / 1024:>12.1f}{as_compact / 1024:>13.1f}"
+                  f"{as_tuples / count:>8.0f}{as_compact / count:>8.0f}{as_compact / max(as_tuples, 1):>8.2f}")
+    finally:
+        conn.close()
+
+
+def parse_sizes(text):
+    """
+    Parses a comma-separated list of cache sizes such as "100,1000".
+    Inputs:
+        text (str): the list.
+    Raises:
+        ValueError: If a size is not a positive number.
+    Returns:
+        list of int: the sizes.
+    """
+    sizes = [int(part) for part in text.split(",") if part.strip()]
+    if not sizes or min(sizes) < 1:
+        raise ValueError(f"Invalid sizes: {text}")
+    return sizes
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs one of the benchmarks.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark parts of the app without a window.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cache_parser = commands.add_parser("cache", help="hit rates of the lookup cache on navigation traces")
+    cache_parser.add_argument("database", help="the database file, it is not changed")
+    cache_parser.add_argument("--trace", help="replay this navigation trace instead of generating one")
+    cache_parser.add_argument("--sessions", type=int, default=200, help="sessions to generate (default 200)")
+    cache_parser.add_argument("--steps", type=int, default=40, help="screens per generated session (default 40)")
+    cache_parser.add_argument("--seed", type=int, default=0)
+    cache_parser.add_argument("--save-trace", help="write the trace that was replayed to this file")
+    cache_parser.add_argument("--entries", type=parse_sizes, default=[100, 1000, 10000],
+                              help="cache sizes to try, in entries (default 100,1000,10000)")
+    cache_parser.add_argument("--max-bytes", type=int, default=None, help="also limit every cache to this many bytes")
+    cache_parser.add_argument("--repeat", type=int, default=3, help="runs of every setup, the fastest counts")
+    cache_parser.add_argument("--ttl", type=float, default=60.0,
+                              help="seconds of trace time that a TTL entry lives (default 60)")
+    memory_parser = commands.add_parser("memory", help="memory of the loaded result lists, tuples against compact")
+    memory_parser.add_argument("database", help="the database file")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "cache":
+            benchmark_cache(args)
+        else:
+            benchmark_memory(args)
+    except (NonexistentDatabaseException, ValueError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
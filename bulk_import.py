@@ -0,0 +1,375 @@
+# bulk_import.py
+# Streams JSONL or CSV files into the tables of the database. Rows are read a batch at a time and inserted with
+# executemany inside large transactions, the secondary indexes are dropped during the load and built once at the end,
+# and the hashtags of imported tweets are extracted with the same rules as the compose screen. Memory use only depends
+# on the batch size, not on the size of the input.
+#
+# Usage: python bulk_import.py database.db users=users.csv tweets=tweets.jsonl [table=file ...]
+#                              [--create] [--batch 5000] [--commit-every 100000] [--on-conflict ignore]
+import argparse
+import csv
+import json
+import os.path
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+import db
+import queries
+import schema
+import trending
+from exceptions import NonexistentDatabaseException, InvalidHashtagException, DuplicateHashtagException
+
+
+def detect_format(path, forced=None):
+    """
+    Works out whether a file is JSONL or CSV from its extension.
+    Inputs:
+        path (str): the path of the input file.
+        forced (str or None): "jsonl" or "csv" to skip the detection.
+    Raises:
+        ValueError: If the extension is not recognised.
+    Returns:
+        str: "jsonl" or "csv".
+    """
+    if forced:
+        return forced
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension in (".csv", ".txt"):
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path}, use --format jsonl or --format csv")
+
+
+def read_rows(path, columns, file_format):
+    """
+    Reads the rows of an input file one at a time. Columns that a row does not have are imported as NULL, as are
+    empty CSV fields.
+    Inputs:
+        path (str): the path of the input file.
+        columns (list of str): the columns of the target table.
+        file_format (str): "jsonl" or "csv".
+    Raises:
+        ValueError: If the file refers to a column that the table does not have, or a line is not a JSON object.
+    Returns:
+        generator of tuple: one tuple per row, with the values in the order of columns.
+    """
+    known = set(columns)
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            unknown = set(reader.fieldnames or []) - known
+            if unknown:
+                raise ValueError(f"{path}: unknown columns {', '.join(sorted(unknown))}")
+            for record in reader:
+                yield tuple(record.get(column) or None for column in columns)
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(f"{path}:{line_number}: expected a JSON object")
+                unknown = set(record) - known
+                if unknown:
+                    raise ValueError(f"{path}:{line_number}: unknown columns {', '.join(sorted(unknown))}")
+                yield tuple(record.get(column) for column in columns)
+
+
+def batches(rows, size):
+    """
+    Groups an iterator of rows into lists of at most size rows.
+    Inputs:
+        rows (iterator): the rows.
+        size (int): the batch size.
+    Returns:
+        generator of list: the batches.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Importer:
+    """
+    Loads input files into one database and keeps count of what happened to every table.
+    """
+
+    def __init__(self, conn, batch_size=5000, commit_every=100000, on_conflict="ignore", extract_hashtags=True):
+        """
+        Inputs:
+            conn (sqlite3.Connection): the connection to load into, preferably opened with the bulk-load profile.
+            batch_size (int): the number of rows given to each executemany call.
+            commit_every (int): the number of rows between commits.
+            on_conflict (str): "abort", "ignore" or "replace", what to do with rows that clash with existing keys.
+            extract_hashtags (bool): whether to fill hashtag_mentions from the text of imported tweets.
+        Returns:
+            None
+        """
+        self.conn = conn
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.on_conflict = on_conflict.upper()
+        self.extract_hashtags = extract_hashtags
+        self.uncommitted = 0
+        # table name -> {"read", "inserted", "rejected", "seconds"}
+        self.stats = {}
+
+    def table_stats(self, table):
+        """
+        Gets (creating it if needed) the counters of a table.
+        Inputs:
+            table (str): the name of the table.
+        Returns:
+            dict: the counters.
+        """
+        return self.stats.setdefault(table, {"read": 0, "inserted": 0, "rejected": 0, "seconds": 0.0})
+
+    def maybe_commit(self, rows):
+        """
+        Commits once enough rows have been inserted since the last commit.
+        Inputs:
+            rows (int): the number of rows that were just inserted.
+        Returns:
+            None
+        """
+        self.uncommitted += rows
+        if self.uncommitted >= self.commit_every:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def insert(self, table, columns, rows):
+        """
+        Inserts a batch of rows with executemany.
+        Inputs:
+            table (str): the name of the table.
+            columns (list of str): the columns that the values are for.
+            rows (list of tuple): the rows.
+        Returns:
+            int: the number of rows that were really inserted (ignored rows are not counted).
+        """
+        placeholders = ", ".join("?" for column in columns)
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        before = self.conn.total_changes
+        self.conn.executemany(f'INSERT OR {self.on_conflict} INTO "{table}" ({column_list}) VALUES ({placeholders})',
+                              rows)
+        return self.conn.total_changes - before
+
+    def existing_tweets(self, tids):
+        """
+        Finds which of some tweet ids are in the tweets table, in one query.
+        Inputs:
+            tids (list): the ids, as the input file has them.
+        Returns:
+            set: the ids that are in the table, as they were given.
+        """
+        return {row[0] for row in self.conn.execute(
+            "SELECT j.value FROM json_each(?) j JOIN tweets t ON t.tid = j.value", (json.dumps(tids),))}
+
+    def split_hashtags(self, batch, columns):
+        """
+        Extracts the hashtags of a batch of tweets, dropping the tweets that the compose screen would have refused.
+        Inputs:
+            batch (list of tuple): tweets rows.
+            columns (list of str): the columns of the tweets table.
+        Returns:
+            tuple: (accepted tweet rows, the hashtags of every accepted row in the same order)
+        """
+        text_index = columns.index("text")
+        accepted = []
+        hashtags = []
+        for row in batch:
+            try:
+                terms = queries.extract_hashtags(row[text_index] or "")
+            except (InvalidHashtagException, DuplicateHashtagException):
+                continue
+            accepted.append(row)
+            hashtags.append(terms)
+        return accepted, hashtags
+
+    def insert_tweets(self, columns, batch, hashtags, mention_stats):
+        """
+        Inserts a batch of accepted tweets with executemany and the hashtag mentions of the ones that were really
+        inserted, so that a tweet that was ignored keeps the mentions of the text it already has. Which ones those are
+        is found by looking their ids up before and after the insert. A replaced tweet loses its old mentions.
+        Inputs:
+            columns (list of str): the columns of the tweets table.
+            batch (list of tuple): tweets rows, as split_hashtags accepted them.
+            hashtags (list of list of str): the hashtags of every row, from split_hashtags.
+            mention_stats (dict): the counters of hashtag_mentions.
+        Returns:
+            int: the number of tweets that were inserted.
+        """
+        tid_index = columns.index("tid")
+        tids = [row[tid_index] for row in batch]
+        existed = self.existing_tweets(tids) if self.on_conflict != "REPLACE" else set()
+        inserted = self.insert("tweets", columns, batch)
+        if self.on_conflict == "REPLACE":
+            # every row that is in the table now was written by the batch, the last row of a tid wins
+            written = self.existing_tweets(tids)
+            latest = {row[tid_index]: terms for row, terms in zip(batch, hashtags) if row[tid_index] in written}
+            self.conn.executemany("DELETE FROM hashtag_mentions WHERE tid = ?", ((tid,) for tid in latest))
+        else:
+            # only the tids that were not there before were inserted, by the first row of each
+            written = self.existing_tweets([tid for tid in tids if tid not in existed])
+            latest = {}
+            for row, terms in zip(batch, hashtags):
+                if row[tid_index] in written:
+                    latest.setdefault(row[tid_index], terms)
+        mentions = [(tid, term) for tid, terms in latest.items() for term in terms]
+        if mentions:
+            mention_stats["read"] += len(mentions)
+            mention_stats["inserted"] += self.insert("hashtag_mentions", ["tid", "term"], mentions)
+        return inserted
+
+    def load_file(self, table, path, file_format):
+        """
+        Streams one input file into a table.
+        Inputs:
+            table (str): the name of the table.
+            path (str): the path of the input file.
+            file_format (str): "jsonl" or "csv".
+        Raises:
+            ValueError: If the table does not exist or the file does not match it.
+        Returns:
+            None
+        """
+        columns = schema.table_columns(self.conn, table)
+        if not columns:
+            raise ValueError(f"The database has no table named {table}")
+        stats = self.table_stats(table)
+        mention_stats = self.table_stats("hashtag_mentions") if table == "tweets" and self.extract_hashtags else None
+        start = time.perf_counter()
+
+        for batch in batches(read_rows(path, columns, file_format), self.batch_size):
+            stats["read"] += len(batch)
+            if mention_stats is not None:
+                accepted, hashtags = self.split_hashtags(batch, columns)
+                stats["rejected"] += len(batch) - len(accepted)
+                batch = accepted
+                inserted = self.insert_tweets(columns, batch, hashtags, mention_stats)
+            else:
+                inserted = self.insert(table, columns, batch)
+            stats["inserted"] += inserted
+            self.maybe_commit(len(batch))
+
+        self.conn.commit()
+        self.uncommitted = 0
+        stats["seconds"] += time.perf_counter() - start
+
+
+def parse_sources(sources):
+    """
+    Parses the table=file arguments and puts them in an order where foreign keys are loaded before they are used.
+    Inputs:
+        sources (list of str): the table=file arguments.
+    Raises:
+        ValueError: If an argument is malformed or names an unknown table.
+    Returns:
+        list of tuple: (table, path) pairs.
+    """
+    pairs = []
+    for source in sources:
+        table, separator, path = source.partition("=")
+        if not separator or not table or not path:
+            raise ValueError(f"Expected table=file, got '{source}'")
+        if table not in schema.TABLE_ORDER:
+            raise ValueError(f"Unknown table '{table}', expected one of: {', '.join(schema.TABLE_ORDER)}")
+        pairs.append((table, path))
+    return sorted(pairs, key=lambda pair: schema.TABLE_ORDER.index(pair[0]))
+
+
+def main(argv=None):
+    """
+    Parses the command line, runs the import and prints how fast every table was loaded.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Bulk-load JSONL or CSV files into the database.")
+    parser.add_argument("database", help="the database file to load into")
+    parser.add_argument("sources", nargs="+", metavar="table=file",
+                        help="tables to load, e.g. users=users.csv tweets=tweets.jsonl")
+    parser.add_argument("--create", action="store_true", help="create the database and its tables if needed")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="format of every input (default: by extension)")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per executemany call (default 5000)")
+    parser.add_argument("--commit-every", type=int, default=100000, help="rows per transaction (default 100000)")
+    parser.add_argument("--on-conflict", choices=["abort", "ignore", "replace"], default="ignore",
+                        help="what to do with rows whose key already exists (default ignore)")
+    parser.add_argument("--no-extract-hashtags", action="store_true",
+                        help="do not fill hashtag_mentions from the text of imported tweets")
+    parser.add_argument("--check-foreign-keys", action="store_true",
+                        help="count the rows that point to missing rows once the load is done")
+    args = parser.parse_args(argv)
+
+    try:
+        pairs = parse_sources(args.sources)
+        for table, path in pairs:
+            if not os.path.isfile(path):
+                raise ValueError(f"Input file does not exist: {path}")
+        if args.create and not os.path.isfile(args.database):
+            sqlite3.connect(args.database).close()
+        conn = db.open_db(args.database, "bulk-load", load_extension=False)
+    except (ValueError, NonexistentDatabaseException, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.create:
+        schema.create_schema(conn)
+
+    importer = Importer(conn, args.batch, args.commit_every, args.on_conflict, not args.no_extract_hashtags)
+    start = time.perf_counter()
+    try:
+        schema.drop_secondary_indexes(conn)
+        for table, path in pairs:
+            importer.load_file(table, path, detect_format(path, args.format))
+    except (ValueError, sqlite3.Error) as e:
+        conn.rollback()
+        print(f"Error: {e}", file=sys.stderr)
+        print("Rows committed before the error are kept, the secondary indexes are rebuilt.", file=sys.stderr)
+        schema.fill_timestamps(conn)
+        schema.create_secondary_indexes(conn)
+        conn.commit()
+        return 1
+
+    index_start = time.perf_counter()
+    # files without a ts column get it worked out from the dates and times
+    schema.fill_timestamps(conn)
+    schema.create_secondary_indexes(conn)
+    # the imported hashtags were not counted as they went in
+    if trending.tables_exist(conn):
+        trending.rebuild(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    index_seconds = time.perf_counter() - index_start
+    total_seconds = time.perf_counter() - start
+
+    print(f"{'table':<18}{'read':>10}{'inserted':>10}{'rejected':>10}{'seconds':>10}{'rows/s':>12}")
+    total_inserted = 0
+    for table in schema.TABLE_ORDER:
+        if table not in importer.stats:
+            continue
+        stats = importer.stats[table]
+        total_inserted += stats["inserted"]
+        # hashtag_mentions that were extracted from tweets have no time of their own, it is part of the tweets time
+        rate = f"{stats['inserted'] / stats['seconds']:.0f}" if stats["seconds"] else "-"
+        print(f"{table:<18}{stats['read']:>10}{stats['inserted']:>10}{stats['rejected']:>10}"
+              f"{stats['seconds']:>10.2f}{rate:>12}")
+    print(f"indexes and ANALYZE: {index_seconds:.2f}s")
+    print(f"total: {total_inserted} rows in {total_seconds:.2f}s ({total_inserted / total_seconds:.0f} rows/s)")
+
+    if args.check_foreign_keys:
+        violations = sum(1 for row in conn.execute("PRAGMA foreign_key_check"))
+        print(f"foreign key violations: {violations}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+# cache.py
+# A read-through cache for the lookups that the screens repeat all the time: the name of a user (the main menu asks on
+# every rebuild), a tweet (tweet details), whether one user follows another and whom a user follows. A miss runs the
+# query and keeps its result; a write made through the app forgets the results it changes, and so does a change that
+# another process made when the changelog is installed (see changelog.py).
+#
+# How the cache picks what to drop when it is full is a policy:
+#   LRUPolicy - the entry that was used the longest time ago,
+#   LFUPolicy - the entry that was used the fewest times, the oldest of those on a tie,
+#   TTLPolicy - the oldest entry, and entries also expire a fixed number of seconds after they were read.
+# The size can be limited in entries, in (approximate) bytes, or both.
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import queries
+
+# how often CachedQueries reads the changelog, at most
+POLL_SECONDS = 1.0
+
+
+def approximate_size(value):
+    """
+    Estimates the memory that a query result takes, counting the tuples, lists and dicts it is made of and what they
+    hold.
+    Inputs:
+        value (object): the result.
+    Returns:
+        int: the size in bytes.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(approximate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    return size
+
+
+class LRUPolicy:
+    """
+    Evicts the least recently used entry.
+    """
+    # whether expired has to be asked on every hit
+    expires = False
+
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def added(self, key):
+        self.order[key] = None
+
+    def used(self, key):
+        self.order.move_to_end(key)
+
+    def removed(self, key):
+        del self.order[key]
+
+    def victim(self):
+        return next(iter(self.order))
+
+    def expired(self, key):
+        return False
+
+
+class LFUPolicy:
+    """
+    Evicts the least frequently used entry, the one that has been in the cache the longest among equally used ones.
+    Entries are kept in one bucket per use count, so every operation takes constant time.
+    """
+    expires = False
+
+    def __init__(self):
+        self.counts = {}
+        # use count -> the entries with that count, oldest first
+        self.buckets = {}
+        self.min_count = 0
+
+    def added(self, key):
+        self.counts[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_count = 1
+
+    def used(self, key):
+        count = self.counts[key]
+        self._take(key, count)
+        if self.min_count == count and count not in self.buckets:
+            self.min_count = count + 1
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def removed(self, key):
+        self._take(key, self.counts.pop(key))
+
+    def _take(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+    def victim(self):
+        if self.min_count not in self.buckets:
+            # the least used entries were removed rather than used
+            self.min_count = min(self.buckets)
+        return next(iter(self.buckets[self.min_count]))
+
+    def expired(self, key):
+        return False
+
+
+class TTLPolicy:
+    """
+    Lets entries expire a number of seconds after they were read from the database, and evicts the oldest entry.
+    """
+    expires = True
+
+    def __init__(self, seconds, clock=time.monotonic):
+        """
+        Inputs:
+            seconds (float): how long an entry stays valid.
+            clock (function): gets the time in seconds, a benchmark can pass the time of a trace instead.
+        Returns:
+            None
+        """
+        self.seconds = seconds
+        self.clock = clock
+        # key -> when it was added, oldest first
+        self.added_at = OrderedDict()
+
+    def added(self, key):
+        self.added_at[key] = self.clock()
+
+    def used(self, key):
+        pass
+
+    def removed(self, key):
+        del self.added_at[key]
+
+    def victim(self):
+        return next(iter(self.added_at))
+
+    def expired(self, key):
+        return self.clock() - self.added_at[key] > self.seconds
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "ttl": TTLPolicy,
+}
+
+
+class Cache:
+    """
+    Query results by key, with a size limit, an eviction policy and hit/miss counts. It can be used from several
+    threads.
+    """
+
+    def __init__(self, policy=None, max_entries=None, max_bytes=None, sizeof=approximate_size):
+        """
+        Creates an empty cache.
+        Inputs:
+            policy (LRUPolicy, LFUPolicy or TTLPolicy or None): what to evict, least recently used when None.
+            max_entries (int or None): the most entries, no limit when None.
+            max_bytes (int or None): the most bytes that the values may take together, no limit when None.
+            sizeof (function): gets the size of a value in bytes, only used with max_bytes.
+        Returns:
+            None
+        """
+        self.policy = policy or LRUPolicy()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        # key -> (value, size)
+        self.entries = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        # counts the invalidations, so that a value read before one is not kept after it
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, load):
+        """
+        Gets the value of a key, loading it on a miss.
+        Inputs:
+            key (hashable): the key.
+            load (function): called without arguments on a miss, returns the value.
+        Returns:
+            object: the value.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not (self.policy.expires and self.policy.expired(key)):
+                    self.hits += 1
+                    self.policy.used(key)
+                    return entry[0]
+                self.expirations += 1
+                self._remove(key)
+            self.misses += 1
+            generation = self.generation
+        # the query runs without the lock, the value is dropped if something was invalidated meanwhile
+        value = load()
+        with self.lock:
+            if generation == self.generation:
+                self._put(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a value, replacing the one the key had.
+        Inputs:
+            key (hashable): the key.
+            value (object): the value.
+        Returns:
+            None
+        """
+        with self.lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        if key in self.entries:
+            self._remove(key)
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        # room is made before the value is added, so that the policy never picks the value that is being added
+        while self.entries and ((self.max_entries is not None and len(self.entries) >= self.max_entries) or
+                                (self.max_bytes is not None and self.bytes + size > self.max_bytes)):
+            self._remove(self.policy.victim())
+            self.evictions += 1
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self.policy.added(key)
+
+    def _remove(self, key):
+        value, size = self.entries.pop(key)
+        self.bytes -= size
+        self.policy.removed(key)
+
+    def invalidate(self, *keys):
+        """
+        Forgets the values of some keys, keys that are not cached are ignored.
+        Inputs:
+            keys (hashable): the keys.
+        Returns:
+            None
+        """
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                if key in self.entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        """
+        Forgets every value, the counts are kept.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.entries)
+            for key in list(self.entries):
+                self._remove(key)
+
+    def stats(self):
+        """
+        Gets the counts of the cache.
+        Inputs:
+            None
+        Returns:
+            dict: hits, misses, hit_rate, entries, bytes, evictions, expirations and invalidations.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": len(self.entries), "bytes": self.bytes, "evictions": self.evictions,
+                    "expirations": self.expirations, "invalidations": self.invalidations}
+
+
+def user_key(user_id):
+    """
+    Gets how a user id appears in the keys, the screens pass ids both as int and as str.
+    Inputs:
+        user_id (int or str): the id.
+    Returns:
+        str: the id as text.
+    """
+    return str(user_id).strip()
+
+
+class CachedQueries:
+    """
+    Stands in for a queries module in the app, with the user, tweet and follow lookups going through a Cache and the
+    writes forgetting what they change. Everything else is passed on to the queries it wraps.
+    """
+
+    def __init__(self, cache, base=queries, changes=None):
+        """
+        Inputs:
+            cache (Cache): where the results are kept.
+            base (module or object): what the queries are delegated to, queries, sharded_queries or another stand-in.
+            changes (changelog.Subscriber or None): the changes to the database, read at most every POLL_SECONDS so
+            that the writes of other processes are not served stale. It is only read from the thread of the
+            interface.
+        Returns:
+            None
+        """
+        self.cache = cache
+        self.base = base
+        self.changes = changes
+        self.polled_at = 0.0
+        if changes is not None:
+            changes.subscribe(self.forget_changes)
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def _cached(self, key, load):
+        """
+        Gets a result through the cache, after catching up on the changelog if it is time to.
+        Inputs:
+            key (tuple): the name of the lookup and its arguments.
+            load (function): runs the lookup.
+        Returns:
+            object: the result.
+        """
+        if self.changes is not None and time.monotonic() - self.polled_at > POLL_SECONDS:
+            self.polled_at = time.monotonic()
+            while self.changes.poll():
+                pass
+        return self.cache.get(key, load)
+
+    def forget_changes(self, changes):
+        """
+        Forgets the results that some changes from the changelog affect.
+        Inputs:
+            changes (list of tuple): see changelog.Subscriber.poll.
+        Returns:
+            None
+        """
+        keys = []
+        for seq, table, op, key1, key2 in changes:
+            if table is None:
+                self.cache.clear()
+                return
+            if table == "users":
+                keys.append(("get_user_name", user_key(key1)))
+            elif table == "tweets":
+                keys.append(("get_tweet", user_key(key1)))
+            elif table == "follows":
+                keys.extend(self._follow_keys(key1, key2))
+        self.cache.invalidate(*keys)
+
+    @staticmethod
+    def _follow_keys(follower_id, followee_id):
+        return [("is_following", user_key(follower_id), user_key(followee_id)),
+                ("get_followed_users", user_key(follower_id))]
+
+    def get_user_name(self, conn, user_id):
+        """See queries.get_user_name."""
+        return self._cached(("get_user_name", user_key(user_id)), lambda: self.base.get_user_name(conn, user_id))
+
+    def get_tweet(self, conn, tweet_id):
+        """See queries.get_tweet."""
+        return self._cached(("get_tweet", user_key(tweet_id)), lambda: self.base.get_tweet(conn, tweet_id))
+
+    def is_following(self, conn, follower_id, followee_id):
+        """See queries.is_following."""
+        return self._cached(("is_following", user_key(follower_id), user_key(followee_id)),
+                            lambda: self.base.is_following(conn, follower_id, followee_id))
+
+    def get_followed_users(self, conn, user_id):
+        """See queries.get_followed_users, the list is a copy so that the caller can change it."""
+        return list(self._cached(("get_followed_users", user_key(user_id)),
+                                 lambda: tuple(self.base.get_followed_users(conn, user_id))))
+
+    def create_user(self, conn, *args, **kwargs):
+        """See queries.create_user, a lookup of the new id that found nobody is forgotten."""
+        new_usr = self.base.create_user(conn, *args, **kwargs)
+        self.cache.invalidate(("get_user_name", user_key(new_usr)))
+        return new_usr
+
+    def post_tweet(self, conn, *args, **kwargs):
+        """See queries.post_tweet, a lookup of the new id that found nothing is forgotten."""
+        new_tid = self.base.post_tweet(conn, *args, **kwargs)
+        self.cache.invalidate(("get_tweet", user_key(new_tid)))
+        return new_tid
+
+    def follow_user(self, conn, follower_id, followee_id):
+        """See queries.follow_user."""
+        result = self.base.follow_user(conn, follower_id, followee_id)
+        self.cache.invalidate(*self._follow_keys(follower_id, followee_id))
+        return result
+
+    def unfollow_user(self, conn, follower_id, followee_id):
+        """See queries.unfollow_user."""
+        result = self.base.unfollow_user(conn, follower_id, followee_id)
+        self.cache.invalidate(*self._follow_keys(follower_id, followee_id))
+        return result
@@ -0,0 +1,292 @@
+# changelog.py
+# Change data capture for the tables that the screens show. Once installed, triggers on users, follows, tweets,
+# retweets and hashtag_mentions append one row per inserted, updated or deleted row to the changelog table, whoever did
+# the write: the app, the HTTP API, a bulk load or the sqlite3 shell. Every change gets a sequence number one higher
+# than the last one, and a change is only visible once the transaction that made it has committed, after every change
+# with a lower number. A subscriber therefore only has to remember the last number it has read and ask for the rows
+# after it, which is one range scan of the primary key.
+#
+# A change only says which rows were touched, not what they held, through two keys per table (see KEYS): enough to
+# tell which feeds, profiles, counters and searches it affects. Old changes are dropped with trim; a subscriber that
+# was behind the dropped changes is told that anything may have changed.
+#
+# Usage: python changelog.py install database.db [database.db ...]
+#        python changelog.py uninstall database.db [database.db ...]
+#        python changelog.py status database.db
+#        python changelog.py trim database.db --keep N
+#        python changelog.py tail database.db [--after SEQ] [--interval SECONDS]
+#
+# The files of a sharded store are installed one by one, every shard then has its own numbers.
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+TABLE = """CREATE TABLE IF NOT EXISTS changelog (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl         TEXT NOT NULL,
+    op          TEXT NOT NULL,
+    key1,
+    key2
+)"""
+
+# table -> the columns recorded as key1 and key2, None when there is no second key
+KEYS = {
+    "users": ("usr", None),
+    "follows": ("flwer", "flwee"),
+    "tweets": ("tid", "writer_id"),
+    "retweets": ("tid", "retweeter_id"),
+    "hashtag_mentions": ("tid", "term"),
+}
+
+# what op holds for each kind of write
+INSERT, UPDATE, DELETE = "I", "U", "D"
+
+# the most changes a subscriber reads at once
+BATCH = 1000
+
+# the change a subscriber gets in place of the changes that were trimmed before it read them, its table is None
+EVERYTHING = (None, None, None, None, None)
+
+
+def trigger_sql(table, event):
+    """
+    Builds the trigger that records one kind of write to a table.
+    Inputs:
+        table (str): a table of KEYS.
+        event (str): "INSERT", "UPDATE" or "DELETE".
+    Returns:
+        tuple: (name of the trigger, CREATE TRIGGER statement)
+    """
+    def keys(row):
+        return ", ".join(f"{row}.{column}" if column else "NULL" for column in KEYS[table])
+
+    name = f"changelog_{table}_{event.lower()}"
+    insert = "INSERT INTO changelog (tbl, op, key1, key2) VALUES"
+    if event == "INSERT":
+        body = f"{insert} ('{table}', '{INSERT}', {keys('NEW')});"
+    elif event == "DELETE":
+        body = f"{insert} ('{table}', '{DELETE}', {keys('OLD')});"
+    else:
+        # an update that changes a key moves the row, so both the old and the new keys are affected
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in KEYS[table] if column)
+        body = (f"{insert} ('{table}', '{UPDATE}', {keys('NEW')});\n"
+                f"    INSERT INTO changelog (tbl, op, key1, key2) SELECT '{table}', '{UPDATE}', {keys('OLD')} "
+                f"WHERE {changed};")
+    return name, f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN\n    {body}\nEND"
+
+
+def triggers():
+    """
+    Gets every trigger of the changelog.
+    Inputs:
+        None
+    Returns:
+        list of tuple: (name, CREATE TRIGGER statement) pairs.
+    """
+    return [trigger_sql(table, event) for table in KEYS for event in ("INSERT", "UPDATE", "DELETE")]
+
+
+def installed(conn):
+    """
+    Checks whether the changelog has been installed in the main database.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        bool: True when it is.
+    """
+    return conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'changelog'"
+                        ).fetchone() is not None
+
+
+def install(conn):
+    """
+    Creates the changelog table and its triggers, the writes made before are not in it.
+    Inputs:
+        conn (sqlite3.Connection): the database connection, the caller commits.
+    Returns:
+        None
+    """
+    conn.execute(TABLE)
+    for name, sql in triggers():
+        conn.execute(sql)
+
+
+def uninstall(conn):
+    """
+    Drops the triggers and the changelog table.
+    Inputs:
+        conn (sqlite3.Connection): the database connection, the caller commits.
+    Returns:
+        None
+    """
+    for name, sql in triggers():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS changelog")
+
+
+def last_seq(conn):
+    """
+    Gets the number of the last change ever recorded, trimmed or not.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        int: the number, 0 before the first change.
+    """
+    row = conn.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'changelog'").fetchone()
+    return row[0] if row else 0
+
+
+def trim(conn, keep):
+    """
+    Drops all but the newest changes.
+    Inputs:
+        conn (sqlite3.Connection): the database connection, the caller commits.
+        keep (int): the number of changes to keep.
+    Returns:
+        int: the number of changes dropped.
+    """
+    return conn.execute("DELETE FROM changelog WHERE seq <= ?", (last_seq(conn) - max(0, keep),)).rowcount
+
+
+class Subscriber:
+    """
+    Reads the changes in order, each one once, and hands them to its callbacks. A subscriber is used from one thread,
+    with a connection of its own or one that only that thread uses.
+    """
+
+    def __init__(self, conn, tables=None, after_seq=None):
+        """
+        Creates a subscriber that starts after a change.
+        Inputs:
+            conn (sqlite3.Connection): a connection to a database with the changelog installed.
+            tables (iterable of str or None): only get the changes to these tables, all of them when None.
+            after_seq (int or None): the number of the last change that is already known, the newest one when None.
+        Returns:
+            None
+        """
+        self.conn = conn
+        self.tables = None if tables is None else set(tables)
+        self.last_seq = last_seq(conn) if after_seq is None else after_seq
+        self.callbacks = []
+
+    def subscribe(self, callback):
+        """
+        Registers a function that is called with every batch of changes that poll reads.
+        Inputs:
+            callback (function): called as callback(changes), see poll.
+        Returns:
+            None
+        """
+        self.callbacks.append(callback)
+
+    def poll(self, limit=BATCH):
+        """
+        Reads the changes committed since the last poll and passes them to the callbacks.
+        Inputs:
+            limit (int): the most changes to read, the rest are read by the next poll.
+        Returns:
+            list of tuple: (seq, table, op, key1, key2) rows in order. When changes were trimmed before they could be
+            read, the list is [EVERYTHING] instead and the subscriber moves on to the newest change.
+        """
+        first = self.conn.execute("SELECT MIN(seq) FROM main.changelog").fetchone()[0]
+        newest = last_seq(self.conn)
+        if newest > self.last_seq and (first is None or first > self.last_seq + 1):
+            self.last_seq = newest
+            changes = [EVERYTHING]
+        else:
+            rows = self.conn.execute("SELECT seq, tbl, op, key1, key2 FROM main.changelog WHERE seq > ? "
+                                     "ORDER BY seq LIMIT ?", (self.last_seq, limit)).fetchall()
+            if not rows:
+                return []
+            self.last_seq = rows[-1][0]
+            changes = [row for row in rows if self.tables is None or row[1] in self.tables]
+        if changes:
+            for callback in self.callbacks:
+                callback(changes)
+        return changes
+
+    def tail(self, interval=1.0):
+        """
+        Polls forever, waiting a while whenever there is nothing new.
+        Inputs:
+            interval (float): the seconds to wait between polls that found nothing.
+        Returns:
+            generator of list: the batches of changes, see poll.
+        """
+        while True:
+            changes = self.poll()
+            if changes:
+                yield changes
+            else:
+                time.sleep(interval)
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs one of the commands.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Record the changes to the database and follow them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("install", "create the changelog and its triggers"),
+                               ("uninstall", "drop the changelog and its triggers")):
+        commands.add_parser(command, help=help_text).add_argument("databases", nargs="+")
+    commands.add_parser("status", help="show the number of changes kept").add_argument("database")
+    trim_parser = commands.add_parser("trim", help="drop all but the newest changes")
+    trim_parser.add_argument("database")
+    trim_parser.add_argument("--keep", type=int, required=True)
+    tail_parser = commands.add_parser("tail", help="print the changes as they are committed")
+    tail_parser.add_argument("database")
+    tail_parser.add_argument("--after", type=int, default=None, help="start after this change (default: the newest)")
+    tail_parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    paths = args.databases if args.command in ("install", "uninstall") else [args.database]
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"Error: Database does not exist: {path}", file=sys.stderr)
+            return 1
+    try:
+        for path in paths:
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA busy_timeout = 5000")
+            try:
+                if args.command == "install":
+                    install(conn)
+                    conn.commit()
+                    print(f"{path}: installed")
+                elif args.command == "uninstall":
+                    uninstall(conn)
+                    conn.commit()
+                    print(f"{path}: uninstalled")
+                elif not installed(conn):
+                    print(f"Error: {path} has no changelog, run install first", file=sys.stderr)
+                    return 1
+                elif args.command == "trim":
+                    print(f"{trim(conn, args.keep)} changes dropped")
+                    conn.commit()
+                elif args.command == "status":
+                    kept, first = conn.execute("SELECT COUNT(*), MIN(seq) FROM changelog").fetchone()
+                    print(f"{kept} changes kept, from {first} to {last_seq(conn)}")
+                else:
+                    for changes in Subscriber(conn, after_seq=args.after).tail(args.interval):
+                        for seq, table, op, key1, key2 in changes:
+                            print("everything may have changed" if table is None else
+                                  f"{seq} {op} {table} {key1} {key2}", flush=True)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# compact_rows.py
+# A compact way to keep the rows that the list screens show for as long as they are open. A list of tuples costs a
+# tuple per row plus an object per value: a 7-column feed row takes over 500 bytes besides its text. CompactRows keeps
+# one column per field instead, the integers packed 8 bytes each in an array and the strings that repeat (names, dates,
+# times, statuses) interned so that every row shares one copy. A row is only made into a tuple when it is read, so the
+# screens index, slice, iterate and concatenate it as they did the lists.
+#
+# The shape of a row is a string with one letter per column:
+#   i - an integer, packed in an array('q') (a column that gets anything else is kept as a list from then on)
+#   s - a string that repeats across rows, interned
+#   t - any other value, a text for example, kept as it is
+import sys
+from array import array
+from collections.abc import Sequence
+
+# the shapes of the rows of queries.load_feed, search_tweets / get_user_tweets and search_users / list_followers, the
+# names in a list of users are mostly different, so interning them would only cost memory
+FEED_ROW = "itssiss"
+TWEET_ROW = "iitss"
+USER_ROW = "it"
+
+
+def intern_value(value):
+    """
+    Interns a string, other values are returned as they are.
+    Inputs:
+        value (object): the value.
+    Returns:
+        object: the value, or the one copy of an equal string.
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
+class CompactRows(Sequence):
+    """
+    A list of rows of the same shape, stored by column. Rows are added, never changed or removed.
+    """
+
+    def __init__(self, shape, rows=()):
+        """
+        Creates the list.
+        Inputs:
+            shape (str): one letter per column, see the top of the file.
+            rows (iterable of tuple): the first rows.
+        Returns:
+            None
+        """
+        if not shape or set(shape) - set("ist"):
+            raise ValueError(f"Invalid row shape: {shape!r}")
+        self.shape = shape
+        self.columns = [array("q") if kind == "i" else [] for kind in shape]
+        self.length = 0
+        self.extend(rows)
+
+    def append(self, row):
+        """
+        Adds a row at the end.
+        Inputs:
+            row (tuple): a value per column.
+        Returns:
+            None
+        """
+        if len(row) != len(self.shape):
+            raise ValueError(f"Expected {len(self.shape)} columns, got {len(row)}")
+        for j, value in enumerate(row):
+            column = self.columns[j]
+            if self.shape[j] == "s":
+                value = intern_value(value)
+            elif type(column) is array:
+                try:
+                    column.append(value)
+                    continue
+                except (TypeError, OverflowError):
+                    # a NULL, a text or a huge number: the column keeps Python objects from now on
+                    column = self.columns[j] = column.tolist()
+            column.append(value)
+        self.length += 1
+
+    def extend(self, rows):
+        """
+        Adds rows at the end.
+        Inputs:
+            rows (iterable of tuple): the rows.
+        Returns:
+            None
+        """
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CompactRows(self.shape, (self[i] for i in range(*index.indices(self.length))))
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("row index out of range")
+        return tuple(column[index] for column in self.columns)
+
+    def __iter__(self):
+        return zip(*self.columns)
+
+    def __add__(self, other):
+        rows = CompactRows(self.shape, self)
+        rows.extend(other)
+        return rows
+
+    def __radd__(self, other):
+        rows = CompactRows(self.shape, other)
+        rows.extend(self)
+        return rows
+
+    def __eq__(self, other):
+        if not isinstance(other, (CompactRows, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(row == tuple(other_row) for row, other_row in zip(self, other))
+
+    def __repr__(self):
+        return f"CompactRows({self.shape!r}, {list(self)!r})"
+
+    def column(self, j):
+        """
+        Gets one column.
+        Inputs:
+            j (int): the number of the column.
+        Returns:
+            array or list: the values, in the order of the rows. It must not be changed.
+        """
+        return self.columns[j]
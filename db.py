@@ -3,48 +3,306 @@ import sqlite3
 import os.path
 from tkinter import messagebox
 import sys
-from exceptions import NonexistentDatabaseException
+from exceptions import NonexistentDatabaseException, OutdatedDatabaseException, UnknownProfileException
+import partitions
+import schema
+import trending
 
-def connect_db():
+# Named connection profiles. Each profile is a set of PRAGMA values that is applied right after the connection is
+# opened, so that the same database file can be tuned differently depending on who is using it:
+#   interactive - the Tk application, many small transactions mixed with reads
+#   bulk-load   - one process loading a lot of rows in large transactions, durability is traded for speed
+#   read-only   - a replica/reporting connection that can never write to the file
+# negative cache_size values are in KiB (so -16000 is roughly 16MB), mmap_size is in bytes and busy_timeout is in ms
+PROFILES = {
+    "interactive": {
+        "read_only": False,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+    },
+    "bulk-load": {
+        "read_only": False,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+        "foreign_keys": "OFF",
+    },
+    "read-only": {
+        "read_only": True,
+        "journal_mode": None,  # the journal mode of a file cannot be changed from a read only connection
+        "synchronous": None,
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+    },
+}
+
+DEFAULT_PROFILE = "interactive"
+
+USAGE = ("Usage: python main.py database.db [--profile " + "|".join(PROFILES) + "] [--search-workers N]"
+         " [--search-index] [--cache-entries N] [--cache-ttl SECONDS] [--startup-timing] [--latency-overlay]"
+         " [--latency-report FILE] [--record-trace FILE] [--metrics-file FILE] [--metrics-port N]"
+         " [--metrics-interval SECONDS]")
+
+# the options of the application after the database and the profile: option -> (key in the options dict, default)
+APP_OPTIONS = {
+    # run the tweet search on N processes (see parallel_search.py), 0 runs it in-process
+    "--search-workers": ("search_workers", 0),
+    # keep the last N user, tweet and follow lookups (see cache.py), 0 turns the cache off
+    "--cache-entries": ("cache_entries", 0),
+    # let the cached lookups expire after this many seconds instead of evicting the least recently used, 0 never
+    "--cache-ttl": ("cache_ttl", 0),
+    # serve the metrics of the queries, writes and screen actions on http://127.0.0.1:N/metrics (see metrics.py), 0 not
+    "--metrics-port": ("metrics_port", 0),
+    # how often --metrics-file is written, in seconds
+    "--metrics-interval": ("metrics_interval", 15),
+}
+# the options that take no value: option -> key in the options dict, which is True when the option is given
+APP_FLAGS = {
+    # run the tweet search on an inverted index with AND and NOT (see search_index.py)
+    "--search-index": "search_index",
+    # print how long the app took to show the login window and to open the database (see startup_timing.py)
+    "--startup-timing": "startup_timing",
+    # time every screen action and show the times over the window, F12 hides them (see ui_latency.py)
+    "--latency-overlay": "latency_overlay",
+}
+# the options that take a file name: option -> key in the options dict, which is None when the option is not given
+APP_PATHS = {
+    # time every screen action and write the percentiles to this file when the app exits (see ui_latency.py)
+    "--latency-report": "latency_report",
+    # add every screen shown, search and write of the session to this trace, to replay later (see session_trace.py)
+    "--record-trace": "record_trace",
+    # write the metrics of the queries, writes and screen actions to this file every few seconds (see metrics.py)
+    "--metrics-file": "metrics_file",
+}
+
+
+def parse_args(argv):
+    """
+    Parses the command line of the application. The database file is required, the connection profile can
+    optionally be picked with --profile NAME (or --profile=NAME), and the options in APP_OPTIONS (--name N or
+    --name=N), APP_PATHS (--name FILE or --name=FILE) and APP_FLAGS (--name) turn on the optional features of the app.
+    Inputs:
+        argv (list of str): the command-line arguments, without the program name.
+    Raises:
+        ValueError: If the arguments do not match the expected usage.
+    Returns:
+        tuple: (db_name, profile_name, options), where options is a dict with every key of APP_OPTIONS, APP_PATHS and
+        APP_FLAGS
+    """
+    db_name = None
+    values = {"--profile": DEFAULT_PROFILE}
+    values.update({option: str(default) for option, (key, default) in APP_OPTIONS.items()})
+    values.update({option: None for option in APP_PATHS})
+    options = {key: False for key in APP_FLAGS.values()}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in values:
+            if i + 1 >= len(argv):
+                raise ValueError(USAGE)
+            values[arg] = argv[i + 1]
+            i += 2
+            continue
+        name = arg.split("=", 1)[0]
+        if arg in APP_FLAGS:
+            options[APP_FLAGS[arg]] = True
+        elif "=" in arg and name in values:
+            values[name] = arg.split("=", 1)[1]
+        elif db_name is None and not arg.startswith("--"):
+            db_name = arg
+        else:
+            raise ValueError(USAGE)
+        i += 1
+
+    if db_name is None:
+        raise ValueError(USAGE)
+    for option, (key, default) in APP_OPTIONS.items():
+        if not values[option].isdigit():
+            raise ValueError(USAGE)
+        options[key] = int(values[option])
+    for option, key in APP_PATHS.items():
+        options[key] = values[option]
+    return db_name, values["--profile"], options
+
+
+def apply_profile(conn, profile):
+    """
+    Applies every PRAGMA of a connection profile to an open connection.
+    Inputs:
+        conn (sqlite3.Connection): the connection to tune.
+        profile (str): the name of one of the entries in PROFILES.
+    Raises:
+        UnknownProfileException: If the profile does not exist.
+    Returns:
+        None
+    """
+    if profile not in PROFILES:
+        raise UnknownProfileException(profile, list(PROFILES))
+    settings = PROFILES[profile]
+
+    # busy_timeout goes first so that switching the journal mode waits for other connections instead of failing
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])};")
+    if settings["journal_mode"]:
+        conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']};").fetchone()
+    if settings["synchronous"]:
+        conn.execute(f"PRAGMA synchronous = {settings['synchronous']};")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])};")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])};").fetchone()
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']};")
+    conn.execute(f"PRAGMA foreign_keys = {settings['foreign_keys']};")
+    if settings["read_only"]:
+        conn.execute("PRAGMA query_only = ON;")
+
+
+def load_regexp_extension(conn):
+    """
+    Loads the sqlean `regexp` extension that provides regexp_like, which the tweet search relies on. Failing to load it
+    is not fatal, the rest of the application still works.
+    Inputs:
+        conn (sqlite3.Connection): the connection to load the extension into.
+    Returns:
+        bool: True if the extension was loaded.
+    """
+    # Cross-platform handling for loading `regexp` extension
+    import platform
+    system = platform.system()
+    try:
+        conn.enable_load_extension(True)
+        if system == "Darwin":
+            conn.load_extension("./regexp.dylib")
+        elif system == "Linux":
+            conn.load_extension("./regexp.so")
+        elif system == "Windows":
+            conn.load_extension("./regexp.dll")
+        else:
+            return False
+        return True
+    except (sqlite3.OperationalError, AttributeError) as e:
+        # AttributeError is raised by Python builds that were compiled without extension loading support
+        print(f"Optional: Could not load regexp extension: {e}")
+        return False
+    finally:
+        if hasattr(conn, "enable_load_extension"):
+            conn.enable_load_extension(False)
+
+
+def ensure_regexp_extension(conn):
+    """
+    Loads the regexp extension into a connection that does not have regexp_like yet, so that it is only loaded once a
+    search needs it. A connection that has it already is left alone.
+    Inputs:
+        conn (sqlite3.Connection): the connection.
+    Returns:
+        bool: True if regexp_like can be used.
+    """
+    try:
+        conn.execute("SELECT regexp_like('', '')")
+        return True
+    except sqlite3.OperationalError:
+        return load_regexp_extension(conn)
+
+
+def open_db(db_name, profile=DEFAULT_PROFILE, load_extension=True, check_same_thread=True, attach_partitions=False):
     """
-    Connects to the SQLite database provided as a command-line argument.
-    Enables foreign key support and attempts to load the regexp extension.
+    Opens a database file with the given connection profile. Unlike connect_db, this never touches the GUI, so it can
+    be used by command-line tools as well.
+    Inputs:
+        db_name (str): path to an existing database file.
+        profile (str): the name of the connection profile to apply.
+        load_extension (bool): whether to load the regexp extension.
+        check_same_thread (bool): passed to sqlite3.connect, False lets the connection be handed between threads.
+        attach_partitions (bool): whether to attach the archived months (see partitions.py), so that reads see every
+        tweet. Such a connection cannot write to tweets, retweets or hashtag_mentions. Without them the connection
+        only sees the recent tweets, which is all that a writer needs.
     Raises:
         NonexistentDatabaseException: If the database file does not exist.
+        UnknownProfileException: If the profile does not exist.
+        OutdatedDatabaseException: If a read-only profile opens a database that has no ts columns yet.
         sqlite3.Error: If there's an error connecting to the database.
     Returns:
         sqlite3.Connection: The database connection object.
     """
-    if len(sys.argv) != 2:
-        messagebox.showerror("Error", "Usage: python main.py database.db")
+    if profile not in PROFILES:
+        raise UnknownProfileException(profile, list(PROFILES))
+    if not os.path.isfile(db_name):
+        raise NonexistentDatabaseException(invalid_path=db_name)
+
+    if PROFILES[profile]["read_only"]:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_name)}?mode=ro", uri=True,
+                               check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
+    apply_profile(conn, profile)
+    if not PROFILES[profile]["read_only"]:
+        partitions.migrate_timestamps(conn, db_name)
+        trending.create_tables(conn)
+    elif schema.missing_timestamps(conn):
+        # the queries read the ts columns, and a read-only profile must never write to the file to add them
+        conn.close()
+        raise OutdatedDatabaseException(db_name)
+    if attach_partitions:
+        partitions.attach_partitions(conn, db_name)
+    elif partitions.list_partitions(conn):
+        # retweets and replies can point to archived tweets, which this connection cannot see
+        conn.execute("PRAGMA foreign_keys = OFF;")
+    if load_extension:
+        load_regexp_extension(conn)
+    return conn
+
+
+def read_command_line():
+    """
+    Parses the command line of the application, showing the usage and exiting when it is wrong.
+    Inputs:
+        None
+    Returns:
+        tuple: (db_name, profile_name, options), see parse_args.
+    """
+    try:
+        return parse_args(sys.argv[1:])
+    except ValueError:
+        messagebox.showerror("Error", USAGE)
         sys.exit(1)
 
-    db_name = sys.argv[1]
+
+def connect_db():
+    """
+    Connects to the SQLite database provided as a command-line argument, using the connection profile picked with
+    --profile (interactive by default).
+    Enables foreign key support. The regexp extension is not loaded here, the tweet search loads it the first time it
+    needs it (see ensure_regexp_extension). If the argument is the directory of a sharded store (see sharding.py), a
+    router over its shards is returned instead.
+    Raises:
+        NonexistentDatabaseException: If the database file does not exist.
+        sqlite3.Error: If there's an error connecting to the database.
+    Returns:
+        sqlite3.Connection or sharding.ShardRouter: The database connection object.
+    """
+    db_name, profile, options = read_command_line()
+
     try:
-        if not os.path.isfile(db_name):
-            raise NonexistentDatabaseException(invalid_path=db_name)
-        conn = sqlite3.connect(db_name)
-        conn.enable_load_extension(True)
-        conn.execute("PRAGMA foreign_keys = ON;")
-        
-        # Cross-platform handling for loading `regexp` extension
-        import platform
-        system = platform.system()
-        try:
-            if system == "Darwin":
-                conn.load_extension("./regexp.dylib")
-            elif system == "Linux":
-                conn.load_extension("./regexp.so")
-            elif system == "Windows":
-                conn.load_extension("./regexp.dll")
-        except sqlite3.OperationalError as e:
-            print(f"Optional: Could not load regexp extension: {e}")
-        
-        return conn
+        if os.path.isdir(db_name):
+            # sharding builds on this module, so it is only imported when it is needed
+            import sharding
+            return sharding.ShardRouter(db_name, profile, load_extension=False)
+        return open_db(db_name, profile, load_extension=False, attach_partitions=True)
     except NonexistentDatabaseException as e:
         messagebox.showerror("Database Error", f"Database does not exist: {e}")
         sys.exit(1)
+    except UnknownProfileException as e:
+        messagebox.showerror("Error", f"{e}\n{USAGE}")
+        sys.exit(1)
     except sqlite3.Error as e:
         messagebox.showerror("Database Error", f"Error connecting to database: {e}")
         sys.exit(1)
-
@@ -1,4 +1,7 @@
 # exceptions.py
+import sqlite3
+
+
 class NonexistentDatabaseException(Exception):
     """
     An exception raised when the specified database does not exist.
@@ -16,4 +19,64 @@ class EmptyStackAccessException(Exception):
 
     def __init__(self):
         self.message = "Cannot go back, a previous UI screen does not exist"
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+
+class UnknownProfileException(Exception):
+    """
+    An exception raised when a connection profile that does not exist is requested.
+    """
+    def __init__(self, profile, known_profiles):
+        self.profile = profile
+        self.message = f"Unknown connection profile '{profile}', expected one of: {', '.join(known_profiles)}"
+        super().__init__(self.message)
+
+
+class InvalidHashtagException(Exception):
+    """
+    An exception raised when the text of a tweet contains a standalone '#' character.
+    """
+    def __init__(self):
+        self.message = "Hashtags cannot be a single '#' character. Please enter a valid hashtag (e.g. #example)"
+        super().__init__(self.message)
+
+
+class DuplicateHashtagException(Exception):
+    """
+    An exception raised when the text of a tweet mentions the same hashtag more than once.
+    """
+    def __init__(self):
+        self.message = "You cannot enter the same hashtag multiple times."
+        super().__init__(self.message)
+
+
+class PoolTimeoutException(Exception):
+    """
+    An exception raised when no pooled database connection became free in time.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.message = f"No database connection became available within {timeout} seconds"
+        super().__init__(self.message)
+
+
+class InvalidSearchQueryException(Exception):
+    """
+    An exception raised when a tweet search cannot be understood by the search index.
+    """
+    def __init__(self, keyword, reason):
+        self.keyword = keyword
+        self.message = f"Cannot search for '{keyword}': {reason}"
+        super().__init__(self.message)
+
+
+class OutdatedDatabaseException(sqlite3.DatabaseError):
+    """
+    An exception raised when a database that was created before the ts columns is opened read-only, which cannot add
+    them. It is a sqlite3.DatabaseError, so the tools that report database errors report it too.
+    """
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.message = (f"{db_name} was created before the ts columns and a read-only connection cannot add them, run "
+                        f"`python partitions.py migrate {db_name}` or open it with a writable profile first")
+        super().__init__(self.message)
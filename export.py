@@ -0,0 +1,239 @@
+# export.py
+# Streams tables, or the timeline of a user, out of a live database into JSONL or CSV files, and can make a compacted
+# copy of the database file and its archived months. Everything that is exported in one run is read inside a single
+# read transaction, so the files agree with each other even while the application keeps writing (in WAL mode the
+# writers are not blocked).
+#
+# Usage: python export.py database.db [--tables users,tweets] [--timeline USER_ID] [--format jsonl|csv]
+#                         [--out-dir DIR] [--copy snapshot.db]
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import db
+import partitions
+import queries
+import schema
+from exceptions import NonexistentDatabaseException
+
+
+def write_rows(cursor, path, file_format):
+    """
+    Writes the rows of a cursor to a file as they are fetched, so only one row is held in memory at a time.
+    Inputs:
+        cursor (sqlite3.Cursor): an executed query.
+        path (str): the output file.
+        file_format (str): "jsonl" or "csv".
+    Returns:
+        int: the number of rows written.
+    """
+    columns = [description[0] for description in cursor.description]
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in cursor:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in cursor:
+                f.write(json.dumps(dict(zip(columns, row)), default=str))
+                f.write("\n")
+                count += 1
+    return count
+
+
+class Snapshot:
+    """
+    A read transaction that every export of one run goes through. Opening the transaction and reading from it pins
+    the version of the database that the first query sees, later commits by other connections are not visible.
+    """
+
+    def __init__(self, conn):
+        """
+        Inputs:
+            conn (sqlite3.Connection): the connection to read from, it should not be used for anything else meanwhile.
+        Returns:
+            None
+        """
+        self.conn = conn
+        self.previous_isolation_level = conn.isolation_level
+
+    def __enter__(self):
+        # we manage the transaction ourselves, otherwise the sqlite3 module could end it on us
+        self.conn.isolation_level = None
+        self.conn.execute("BEGIN")
+        # the snapshot only starts with the first read, so we make one straight away
+        self.conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.conn.execute("ROLLBACK")
+        self.conn.isolation_level = self.previous_isolation_level
+        return False
+
+    def export_table(self, table, path, file_format):
+        """
+        Exports a whole table.
+        Inputs:
+            table (str): the name of the table.
+            path (str): the output file.
+            file_format (str): "jsonl" or "csv".
+        Returns:
+            int: the number of rows written.
+        """
+        return write_rows(self.conn.execute(f'SELECT * FROM "{table}"'), path, file_format)
+
+    def export_timeline(self, user_id, path, file_format):
+        """
+        Exports the tweets and retweets of a user, newest first.
+        Inputs:
+            user_id (int): the id of the user.
+            path (str): the output file.
+            file_format (str): "jsonl" or "csv".
+        Returns:
+            int: the number of rows written.
+        """
+        return write_rows(queries.user_timeline(self.conn, user_id), path, file_format)
+
+
+def copy_database(source, target_path, pages=256, sleep_ms=5, compact=True):
+    """
+    Copies a live database with the online backup API. The copy is made a few pages at a time with a short pause in
+    between, so the source is only ever locked for one small step, and then the copy is vacuumed to drop free pages.
+    The archived months (see partitions.py) are copied next to the copy, in its own partition directory.
+    Inputs:
+        source (sqlite3.Connection): a connection to the database to copy.
+        target_path (str): the file to write the copy to, it is replaced if it exists.
+        pages (int): the number of pages copied per step.
+        sleep_ms (float): the pause between steps.
+        compact (bool): whether to VACUUM the copy afterwards.
+    Returns:
+        tuple: (number of pages copied, size of the copy and its partitions in bytes)
+    """
+    source_path = next(row[2] for row in source.execute("PRAGMA database_list") if row[1] == "main")
+    archived = partitions.list_partitions(source)
+    directory = partitions.partition_directory(target_path)
+    copied = copy_file(source, target_path, pages, sleep_ms, compact)
+    size = os.path.getsize(target_path)
+    if not archived:
+        return copied, size
+
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.dirname(os.path.abspath(source_path))
+    target = sqlite3.connect(target_path)
+    try:
+        for name, file, first_date, last_date in archived:
+            path = os.path.join(directory, f"{name}.db")
+            # the partitions are only written by an archive run, which nothing else runs alongside
+            partition = sqlite3.connect(f"file:{os.path.join(base, file)}?mode=ro", uri=True)
+            try:
+                # a partition is compacted when it is archived, so it is copied as it is
+                copied += copy_file(partition, path, pages, sleep_ms, compact=False)
+            finally:
+                partition.close()
+            size += os.path.getsize(path)
+            target.execute("UPDATE partitions SET file = ? WHERE name = ?",
+                           (f"{os.path.basename(directory)}/{name}.db", name))
+        target.commit()
+    finally:
+        target.close()
+    return copied, size
+
+
+def copy_file(source, target_path, pages, sleep_ms, compact):
+    """
+    Copies one database file with the online backup API, see copy_database.
+    Inputs:
+        source (sqlite3.Connection): a connection to the database to copy.
+        target_path (str): the file to write the copy to, it is replaced if it exists.
+        pages (int): the number of pages copied per step.
+        sleep_ms (float): the pause between steps.
+        compact (bool): whether to VACUUM the copy afterwards.
+    Returns:
+        int: the number of pages copied.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(target_path + suffix):
+            os.remove(target_path + suffix)
+    target = sqlite3.connect(target_path)
+    copied = [0]
+
+    def progress(status, remaining, total):
+        copied[0] = total - remaining
+
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep_ms / 1000.0)
+        # the copy is its own file now, compacting it does not touch the source at all
+        if compact:
+            target.execute("VACUUM")
+        # the backup also copied the WAL setting, a snapshot file is easier to ship as one self-contained file
+        target.execute("PRAGMA journal_mode = DELETE").fetchone()
+    finally:
+        target.close()
+    return copied[0]
+
+
+def main(argv=None):
+    """
+    Parses the command line, runs the exports and prints what was written.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Export a consistent snapshot of the database.")
+    parser.add_argument("database", help="the database file to export from")
+    parser.add_argument("--tables", default="",
+                        help="comma-separated tables to export, or 'all' (default: all unless --timeline or --copy)")
+    parser.add_argument("--timeline", type=int, action="append", default=[], metavar="USER_ID",
+                        help="export the tweets and retweets of a user, can be repeated")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--out-dir", default=".", help="directory for the exported files (default: current)")
+    parser.add_argument("--copy", metavar="PATH", help="also write a compacted copy of the database file here")
+    parser.add_argument("--copy-pages", type=int, default=256, help="pages per backup step (default 256)")
+    parser.add_argument("--copy-sleep-ms", type=float, default=5.0, help="pause between backup steps (default 5)")
+    args = parser.parse_args(argv)
+
+    tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+    if tables == ["all"] or (not tables and not args.timeline and not args.copy):
+        tables = list(schema.TABLE_ORDER)
+    unknown = set(tables) - set(schema.TABLE_ORDER)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    try:
+        conn = db.open_db(args.database, "read-only", load_extension=False, attach_partitions=True)
+    except (NonexistentDatabaseException, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    if tables or args.timeline:
+        start = time.perf_counter()
+        with Snapshot(conn) as snapshot:
+            for table in tables:
+                path = os.path.join(args.out_dir, f"{table}.{args.format}")
+                count = snapshot.export_table(table, path, args.format)
+                print(f"{table}: {count} rows -> {path}")
+            for user_id in args.timeline:
+                path = os.path.join(args.out_dir, f"timeline_{user_id}.{args.format}")
+                count = snapshot.export_timeline(user_id, path, args.format)
+                print(f"timeline of user {user_id}: {count} rows -> {path}")
+        print(f"export took {time.perf_counter() - start:.2f}s")
+
+    if args.copy:
+        start = time.perf_counter()
+        pages, size = copy_database(conn, args.copy, args.copy_pages, args.copy_sleep_ms)
+        print(f"copy: {pages} pages, {size} bytes -> {args.copy} ({time.perf_counter() - start:.2f}s)")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# fuzzy_search.py
+# Finds users whose name is close to a keyword even when it is misspelled. Every word of every name, and every whole
+# name, is cut into trigrams ("jon" gives "__j", "_jo", "jon", "on_", "n__", with _ standing for the padding) and each
+# trigram points to the names that have it. A word within k edits of the keyword still has all but at most 4k of the
+# keyword's trigrams, so only the names found through the keyword's own trigrams are candidates, and only those are
+# compared letter by letter.
+# The comparison counts insertions, deletions, substitutions and swaps of two neighbouring letters as one edit each.
+#
+# The names are read in full the first time and then only the users added since, before every search.
+import re
+from collections import Counter
+
+# the words of a name
+WORD = re.compile(r'\w+')
+# what the start and the end of a word are padded with before it is cut into trigrams
+PADDING = '\0\0'
+
+
+def max_distance(keyword):
+    """
+    Gets how many edits a keyword may be away from a name. Short keywords get fewer, so that they do not match
+    everything, and the limits keep every match sharing at least one trigram with the keyword.
+    Inputs:
+        keyword (str): the keyword.
+    Returns:
+        int: the number of edits.
+    """
+    if len(keyword) < 3:
+        return 0
+    return 1 if len(keyword) < 8 else 2
+
+
+def trigrams(word):
+    """
+    Cuts a word into its trigrams, with the start and the end padded.
+    Inputs:
+        word (str): the word.
+    Returns:
+        set of str: the trigrams.
+    """
+    padded = PADDING + word + PADDING
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """
+    Counts the edits between two words, a swap of two neighbouring letters counting as one, and gives up as soon as
+    it is over a limit.
+    Inputs:
+        first (str), second (str): the words.
+        limit (int): the most edits that are of interest.
+    Returns:
+        int: the number of edits, or limit + 1 when there are more than limit.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(second) + 1))
+    for i, letter in enumerate(first, start=1):
+        current = [i] + [0] * len(second)
+        for j, other in enumerate(second, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (letter != other))
+            if i > 1 and j > 1 and letter == second[j - 2] and first[i - 2] == other:
+                current[j] = min(current[j], before_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyNameIndex:
+    """
+    The trigrams of the words of every user name, used from the thread of the interface.
+    """
+
+    def __init__(self, read_names):
+        """
+        Creates an empty index, it reads the names the first time it is searched.
+        Inputs:
+            read_names (function): called as read_names(after_usr), returns the (usr, name) rows of the users with an id
+            above after_usr (see queries.get_user_names).
+        Returns:
+            None
+        """
+        self.read_names = read_names
+        self.names = {}
+        # a word or a whole name -> the users that have it
+        self.users_of = {}
+        # trigram -> the words and whole names that have it
+        self.terms_of = {}
+        self.last_usr = None
+
+    def add(self, usr, name):
+        """
+        Adds one user.
+        Inputs:
+            usr (int): the id of the user.
+            name (str): their name.
+        Returns:
+            None
+        """
+        self.names[usr] = name
+        name = (name or '').lower()
+        terms = set(WORD.findall(name))
+        if name.strip():
+            terms.add(name.strip())
+        for term in terms:
+            if term not in self.users_of:
+                self.users_of[term] = set()
+                for trigram in trigrams(term):
+                    self.terms_of.setdefault(trigram, []).append(term)
+            self.users_of[term].add(usr)
+
+    def refresh(self):
+        """
+        Adds the users created since the last refresh, or all of them the first time.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        after_usr = -1 if self.last_usr is None else self.last_usr
+        rows = self.read_names(after_usr)
+        for usr, name in rows:
+            self.add(usr, name)
+        self.last_usr = max((usr for usr, name in rows), default=after_usr)
+
+    def close_users(self, keyword):
+        """
+        Finds the users with a word of their name, or their whole name, within max_distance edits of a keyword.
+        Inputs:
+            keyword (str): the lowercased keyword.
+        Returns:
+            dict: usr -> the fewest edits between the keyword and their name.
+        """
+        limit = max_distance(keyword)
+        keyword_trigrams = trigrams(keyword)
+        shared = Counter()
+        for trigram in keyword_trigrams:
+            shared.update(self.terms_of.get(trigram, ()))
+        needed = len(keyword_trigrams) - 4 * limit
+        distances = {}
+        for term, count in shared.items():
+            if count < needed:
+                continue
+            distance = edit_distance(keyword, term, limit)
+            if distance > limit:
+                continue
+            for usr in self.users_of[term]:
+                distances[usr] = min(distance, distances.get(usr, distance))
+        return distances
+
+    def search(self, keywords, exact_rows):
+        """
+        Ranks the users whose name contains a keyword or is close to one: the fewest edits first, then in the order of
+        the exact search (shortest name, name, id).
+        Inputs:
+            keywords (list of str): the lowercased keywords.
+            exact_rows (list of tuple): the (usr, name) rows of the exact search for the same keywords, they count as
+            zero edits.
+        Returns:
+            list of tuple: (usr, name) rows.
+        """
+        self.refresh()
+        distances = {usr: 0 for usr, name in exact_rows}
+        names = dict(exact_rows)
+        for keyword in keywords:
+            for usr, distance in self.close_users(keyword.lower().strip()).items():
+                if distance < distances.get(usr, distance + 1):
+                    distances[usr] = distance
+                    names.setdefault(usr, self.names[usr])
+        return sorted(names.items(), key=lambda row: (distances[row[0]], len(row[1]), row[1], row[0]))
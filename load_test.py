@@ -0,0 +1,563 @@
+# load_test.py
+# A headless load generator. It drives a number of simulated sessions against one database file at the same time, each
+# of them logging in and then picking random actions (reading the feed, searching, posting, retweeting, following)
+# using the same queries as the screens, and reports throughput, latency percentiles, lock waits and errors for every
+# kind of action.
+#
+# Usage: python load_test.py database.db [--sessions 8] [--duration 10] [--mode thread|process]
+#                            [--mix feed=40,post=10,...] [--profile interactive] [--group-commit]
+#                            [--url http://127.0.0.1:8000]
+import argparse
+import json
+import math
+import random
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import db
+import queries
+from exceptions import NonexistentDatabaseException, UnknownProfileException
+from write_queue import WriteQueue
+
+# the relative weights of the actions that a session picks from after it has logged in
+DEFAULT_MIX = {
+    "feed": 35,
+    "search_tweets": 15,
+    "search_users": 10,
+    "profile": 10,
+    "post": 10,
+    "retweet": 10,
+    "follow": 10,
+}
+
+# the order in which the actions are listed in the report
+OPERATIONS = ["login"] + list(DEFAULT_MIX)
+
+
+def parse_mix(text):
+    """
+    Parses an action mix such as "feed=40,post=10". Actions that are left out are never picked.
+    Inputs:
+        text (str): comma-separated name=weight pairs.
+    Raises:
+        ValueError: If an action is unknown or a weight is not a non-negative number.
+    Returns:
+        dict: action name -> weight.
+    """
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown action '{name}', expected one of: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+        if mix[name] < 0:
+            raise ValueError(f"The weight of '{name}' cannot be negative")
+    if not mix or sum(mix.values()) == 0:
+        raise ValueError("The mix needs at least one action with a positive weight")
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    Inputs:
+        sorted_values (list of float): the values, in increasing order.
+        pct (float): the percentile, between 0 and 100.
+    Returns:
+        float: the percentile, or 0.0 for an empty list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def is_lock_error(error):
+    """
+    Tells whether an sqlite3 error means that another connection is holding the lock we need.
+    Inputs:
+        error (sqlite3.Error): the error that was raised.
+    Returns:
+        bool: True for "database is locked" and "database table is locked" errors.
+    """
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class Session:
+    """
+    One simulated user. The session has its own connection, so sessions never share state other than the database file.
+    """
+
+    def __init__(self, config, index, write_queue=None):
+        """
+        Opens the session's connection.
+        Inputs:
+            config (dict): the run configuration built by prepare_config.
+            index (int): the number of this session, used to pick its user and seed its random generator.
+            write_queue (WriteQueue or None): the queue shared by all sessions when group commit is on.
+        Returns:
+            None
+        """
+        self.config = config
+        self.index = index
+        self.random = random.Random(config["seed"] + index)
+        self.user_id, self.password = config["users"][index % len(config["users"])]
+        self.conn = db.open_db(config["db_name"], config["profile"], load_extension=config["regexp"])
+        # we wait for locks ourselves (see run_with_retry) so that the time spent waiting can be measured, the profile's
+        # busy_timeout is kept as the budget for how long we are willing to wait
+        self.lock_budget = db.PROFILES[config["profile"]]["busy_timeout"] / 1000.0
+        self.conn.execute("PRAGMA busy_timeout = 0;")
+        self.write_queue = write_queue
+        self.posted = 0
+
+        self.stats = {name: {"latencies": [], "lock_wait": 0.0, "errors": {}} for name in OPERATIONS}
+
+    def run_with_retry(self, action):
+        """
+        Runs one action, retrying with exponential backoff while the database is locked.
+        Inputs:
+            action (function): a function taking no arguments that does the work (and commits, for writes).
+        Raises:
+            sqlite3.Error: If the action fails for another reason, or stays locked for longer than the budget.
+        Returns:
+            float: the number of seconds spent waiting for locks.
+        """
+        waited = 0.0
+        delay = 0.001
+        while True:
+            try:
+                action()
+                return waited
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                if not is_lock_error(e) or waited >= self.lock_budget:
+                    e.lock_wait = waited
+                    raise
+                start = time.perf_counter()
+                time.sleep(delay)
+                waited += time.perf_counter() - start
+                delay = min(delay * 2, 0.05)
+
+    def record(self, name, action):
+        """
+        Times one action and adds the result to the session's statistics.
+        Inputs:
+            name (str): the name of the action, one of OPERATIONS.
+            action (function): see run_with_retry.
+        Returns:
+            None
+        """
+        stats = self.stats[name]
+        start = time.perf_counter()
+        try:
+            stats["lock_wait"] += self.run_with_retry(action)
+        except (sqlite3.Error, OSError) as e:
+            stats["lock_wait"] += getattr(e, "lock_wait", 0.0)
+            kind = self.error_kind(e)
+            stats["errors"][kind] = stats["errors"].get(kind, 0) + 1
+        stats["latencies"].append(time.perf_counter() - start)
+
+    def error_kind(self, error):
+        """
+        Puts an error in the category it is reported under.
+        Inputs:
+            error (Exception): the error raised by an action.
+        Returns:
+            str: "locked", "integrity" or the name of the error class.
+        """
+        if is_lock_error(error):
+            return "locked"
+        if isinstance(error, sqlite3.IntegrityError):
+            return "integrity"
+        return type(error).__name__
+
+    def write(self, operation, *args):
+        """
+        Runs a write operation and commits it, either on the session's own connection or through the shared write
+        queue when group commit is turned on.
+        Inputs:
+            operation (function): a write function from queries, called with the connection and args.
+        Returns:
+            object: the return value of the operation.
+        """
+        if self.write_queue is not None:
+            return self.write_queue.execute(operation, *args)
+        result = operation(self.conn, *args)
+        self.conn.commit()
+        return result
+
+    # The actions, each one mirrors what a screen does when the user clicks the matching button
+    def login(self):
+        """Checks the password and gets the name for the title bar, like LoginScreen and MainMenuScreen."""
+        if queries.authenticate(self.conn, self.user_id, self.password) is None:
+            raise sqlite3.IntegrityError(f"user {self.user_id} could not log in")
+        queries.get_user_name(self.conn, self.user_id)
+
+    def feed(self):
+        """Loads the whole feed, like FeedScreen."""
+        if queries.get_followed_users(self.conn, self.user_id):
+            queries.load_feed(self.conn, self.user_id)
+
+    def search_tweets(self):
+        """Searches tweets for one word or hashtag, like SearchTweetsScreen."""
+        queries.search_tweets(self.conn, [self.random.choice(self.config["keywords"])])
+
+    def search_users(self):
+        """Searches users by a piece of a name, like SearchUsersScreen."""
+        queries.search_users(self.conn, [self.random.choice(self.config["name_fragments"])])
+
+    def profile(self):
+        """Opens the profile of a random user, like UserProfileScreen."""
+        target = self.random.choice(self.config["users"])[0]
+        queries.get_profile_summary(self.conn, target)
+        queries.is_following(self.conn, self.user_id, target)
+        queries.get_user_tweets(self.conn, target)
+
+    def post(self):
+        """Posts a tweet with a hashtag, like ComposeTweetScreen."""
+        self.posted += 1
+        text = f"load test tweet {self.posted} from session {self.index} #loadtest{self.index}x{self.posted}"
+        self.write(queries.post_tweet, self.user_id, text, queries.extract_hashtags(text))
+
+    def retweet(self):
+        """Retweets a random recent tweet, like TweetDetailScreen."""
+        tweet_id = self.random.choice(self.config["tids"])
+        tweet = queries.get_tweet(self.conn, tweet_id)
+        if tweet is None:
+            return
+        self.write(queries.retweet, tweet_id, self.user_id, tweet[3])
+
+    def follow(self):
+        """Follows a random user, or unfollows them if they are already followed."""
+        target = self.random.choice(self.config["users"])[0]
+        if target == self.user_id:
+            return
+        if queries.is_following(self.conn, self.user_id, target):
+            self.write(queries.unfollow_user, self.user_id, target)
+        else:
+            self.write(queries.follow_user, self.user_id, target)
+
+    def run(self):
+        """
+        Logs in and then keeps picking actions from the mix until the time or operation limit is hit.
+        Inputs:
+            None
+        Returns:
+            dict: the session's statistics.
+        """
+        names = list(self.config["mix"])
+        weights = [self.config["mix"][name] for name in names]
+        deadline = time.perf_counter() + self.config["duration"]
+        think = self.config["think_ms"] / 1000.0
+
+        self.record("login", self.login)
+        done = 0
+        while time.perf_counter() < deadline and (not self.config["ops"] or done < self.config["ops"]):
+            name = self.random.choices(names, weights)[0]
+            self.record(name, getattr(self, name))
+            done += 1
+            if think:
+                time.sleep(think)
+        if self.conn is not None:
+            self.conn.close()
+        return self.stats
+
+
+class HttpSession(Session):
+    """
+    A simulated user that goes through a running api_server instead of opening the database itself. The actions are
+    the same as Session's, turned into HTTP requests. Lock waits happen inside the server, so they are not measured
+    here, a request the server gave up on (503) counts as a "locked" error and a refused write (409) as "integrity".
+    """
+
+    def __init__(self, config, index, write_queue=None):
+        """
+        Inputs:
+            config (dict): the run configuration built by prepare_config, with the server's "url".
+            index (int): the number of this session.
+            write_queue: unused, writes are serialized by the server.
+        Returns:
+            None
+        """
+        self.config = config
+        self.index = index
+        self.random = random.Random(config["seed"] + index)
+        self.user_id, self.password = config["users"][index % len(config["users"])]
+        self.url = config["url"].rstrip("/")
+        self.conn = None
+        self.token = None
+        self.posted = 0
+        self.stats = {name: {"latencies": [], "lock_wait": 0.0, "errors": {}} for name in OPERATIONS}
+
+    def request(self, method, path, body=None, params=None):
+        """
+        Sends one request to the server.
+        Inputs:
+            method (str): the HTTP method.
+            path (str): the path, starting with a slash.
+            body (dict or None): the JSON body.
+            params (dict or None): the query string.
+        Raises:
+            urllib.error.HTTPError: If the server answered with an error status.
+        Returns:
+            object: the decoded JSON response.
+        """
+        url = self.url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", "Bearer " + self.token)
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def run_with_retry(self, action):
+        """The server does its own waiting, so the action is run once and no lock wait is reported."""
+        action()
+        return 0.0
+
+    def error_kind(self, error):
+        """Maps the HTTP status of a failed request to the same categories as Session.error_kind."""
+        if isinstance(error, urllib.error.HTTPError):
+            if error.code == 503:
+                return "locked"
+            if error.code == 409:
+                return "integrity"
+            return f"http{error.code}"
+        return type(error).__name__
+
+    def login(self):
+        """Logs in and keeps the session token."""
+        self.token = self.request("POST", "/login", {"user_id": self.user_id, "password": self.password})["token"]
+
+    def feed(self):
+        """Loads the first page of the feed."""
+        self.request("GET", "/feed")
+
+    def search_tweets(self):
+        """Searches tweets for one word or hashtag."""
+        self.request("GET", "/search/tweets", params={"q": self.random.choice(self.config["keywords"])})
+
+    def search_users(self):
+        """Searches users by a piece of a name."""
+        self.request("GET", "/search/users", params={"q": self.random.choice(self.config["name_fragments"])})
+
+    def profile(self):
+        """Opens the profile of a random user."""
+        self.request("GET", f"/users/{self.random.choice(self.config['users'])[0]}")
+
+    def post(self):
+        """Posts a tweet with a hashtag."""
+        self.posted += 1
+        text = f"load test tweet {self.posted} from session {self.index} #loadtest{self.index}x{self.posted}"
+        self.request("POST", "/tweets", {"text": text})
+
+    def retweet(self):
+        """Retweets a random recent tweet."""
+        self.request("POST", f"/tweets/{self.random.choice(self.config['tids'])}/retweet", {})
+
+    def follow(self):
+        """Follows a random user, or unfollows them if they are already followed."""
+        target = self.random.choice(self.config["users"])[0]
+        if target == self.user_id:
+            return
+        if self.request("GET", f"/users/{target}")["is_following"]:
+            self.request("DELETE", f"/users/{target}/follow")
+        else:
+            self.request("POST", f"/users/{target}/follow", {})
+
+
+def run_session(config, index, write_queue=None):
+    """
+    Entry point of a worker thread or process.
+    Inputs:
+        config (dict): the run configuration built by prepare_config.
+        index (int): the number of the session.
+        write_queue (WriteQueue or None): the shared write queue, only in thread mode.
+    Returns:
+        dict: the session's statistics.
+    """
+    session_class = HttpSession if config["url"] else Session
+    return session_class(config, index, write_queue).run()
+
+
+def prepare_config(args):
+    """
+    Samples the users, tweets and search terms that the sessions will use, so that the sessions do not have to.
+    Inputs:
+        args (argparse.Namespace): the parsed command line.
+    Returns:
+        dict: the run configuration, made only of plain values so it can be sent to worker processes.
+    """
+    conn = db.open_db(args.database, "read-only")
+    users = conn.execute("SELECT usr, pwd FROM users ORDER BY usr LIMIT ?", (max(args.sessions, 1000),)).fetchall()
+    tids = [row[0] for row in conn.execute("SELECT tid FROM tweets ORDER BY tid DESC LIMIT 10000")]
+    texts = [row[0] for row in conn.execute("SELECT text FROM tweets ORDER BY tid DESC LIMIT 500")]
+    terms = [row[0].lower() for row in conn.execute("SELECT DISTINCT term FROM hashtag_mentions LIMIT 500")]
+    names = [row[0] for row in conn.execute("SELECT name FROM users LIMIT 500") if row[0]]
+
+    # the word search needs regexp_like from the extension, when it is missing we only search for hashtags
+    try:
+        conn.execute("SELECT regexp_like('a', 'a')").fetchone()
+        regexp = True
+    except sqlite3.OperationalError:
+        regexp = False
+    conn.close()
+
+    if not users:
+        raise ValueError("The database has no users to log in as")
+
+    words = set()
+    if regexp:
+        for text in texts:
+            words.update(word.lower() for word in text.split() if word.isalpha())
+    keywords = sorted(words) + terms
+    name_fragments = sorted({name.lower()[:3] for name in names})
+
+    return {
+        "db_name": args.database,
+        "url": args.url,
+        "profile": args.profile,
+        "regexp": regexp,
+        "users": users,
+        "tids": tids or [0],
+        "keywords": keywords or ["#loadtest"],
+        "name_fragments": name_fragments or ["a"],
+        "mix": args.mix,
+        "duration": args.duration,
+        "ops": args.ops,
+        "think_ms": args.think_ms,
+        "seed": args.seed,
+    }
+
+
+def merge_stats(results):
+    """
+    Merges the statistics of every session.
+    Inputs:
+        results (list of dict): the statistics returned by each session.
+    Returns:
+        dict: operation name -> merged statistics.
+    """
+    merged = {name: {"latencies": [], "lock_wait": 0.0, "errors": {}} for name in OPERATIONS}
+    for stats in results:
+        for name, op in stats.items():
+            merged[name]["latencies"].extend(op["latencies"])
+            merged[name]["lock_wait"] += op["lock_wait"]
+            for kind, count in op["errors"].items():
+                merged[name]["errors"][kind] = merged[name]["errors"].get(kind, 0) + count
+    return merged
+
+
+def print_report(merged, elapsed, sessions, mode):
+    """
+    Prints a table with one line per action.
+    Inputs:
+        merged (dict): see merge_stats.
+        elapsed (float): the wall-clock time of the run, in seconds.
+        sessions (int): the number of sessions.
+        mode (str): "thread" or "process".
+    Returns:
+        None
+    """
+    print(f"{sessions} sessions ({mode} mode), {elapsed:.2f}s")
+    header = f"{'action':<14}{'count':>8}{'ops/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}" \
+             f"{'lock ms':>10}{'err %':>7}  errors"
+    print(header)
+    print("-" * len(header))
+    total = 0
+    total_errors = 0
+    for name in OPERATIONS:
+        op = merged[name]
+        latencies = sorted(op["latencies"])
+        if not latencies:
+            continue
+        count = len(latencies)
+        errors = sum(op["errors"].values())
+        total += count
+        total_errors += errors
+        error_text = ", ".join(f"{kind}={n}" for kind, n in sorted(op["errors"].items()))
+        print(f"{name:<14}{count:>8}{count / elapsed:>9.1f}"
+              f"{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 90) * 1000:>9.2f}"
+              f"{percentile(latencies, 99) * 1000:>9.2f}{latencies[-1] * 1000:>9.2f}"
+              f"{op['lock_wait'] * 1000:>10.1f}{100.0 * errors / count:>7.2f}  {error_text}")
+    print("-" * len(header))
+    print(f"{'total':<14}{total:>8}{total / elapsed:>9.1f}{'':>46}{100.0 * total_errors / max(total, 1):>7.2f}")
+
+
+def main(argv=None):
+    """
+    Parses the command line, runs the sessions and prints the report.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Simulate concurrent users against one database file.")
+    parser.add_argument("database", help="the database file, it will be written to")
+    parser.add_argument("--sessions", type=int, default=8, help="number of simulated users (default 8)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run for (default 10)")
+    parser.add_argument("--ops", type=int, default=0, help="stop each session after this many actions")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="action weights, e.g. feed=40,search_tweets=20,post=10 (default: %s)"
+                             % ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--profile", default=db.DEFAULT_PROFILE, help="connection profile of the sessions")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between the actions of a session")
+    parser.add_argument("--group-commit", action="store_true",
+                        help="send all writes through one shared WriteQueue (thread mode only)")
+    parser.add_argument("--batch", type=int, default=100, help="most writes per group commit (default 100)")
+    parser.add_argument("--batch-delay-ms", type=float, default=5.0,
+                        help="how long a group commit waits for more writes (default 5)")
+    parser.add_argument("--url", help="drive a running api_server at this address instead of the file directly")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.group_commit and args.url:
+        parser.error("--group-commit cannot be used with --url, the server has its own write queue")
+    if args.group_commit and args.mode != "thread":
+        parser.error("--group-commit needs --mode thread, processes cannot share a write queue")
+
+    try:
+        if args.profile not in db.PROFILES:
+            raise UnknownProfileException(args.profile, list(db.PROFILES))
+        config = prepare_config(args)
+    except (NonexistentDatabaseException, UnknownProfileException, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if not config["regexp"]:
+        print("Note: regexp extension not available, tweet searches only use hashtags")
+
+    write_queue = None
+    if args.group_commit:
+        write_queue = WriteQueue(db.open_db(args.database, args.profile, load_extension=False,
+                                            check_same_thread=False),
+                                 max_batch=args.batch, max_delay_ms=args.batch_delay_ms)
+
+    executor_class = ThreadPoolExecutor if args.mode == "thread" else ProcessPoolExecutor
+    start = time.perf_counter()
+    with executor_class(max_workers=args.sessions) as executor:
+        futures = [executor.submit(run_session, config, i, write_queue) for i in range(args.sessions)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    print_report(merge_stats(results), elapsed, args.sessions, args.mode)
+    if write_queue is not None:
+        write_queue.close()
+        stats = write_queue.stats()
+        print(f"group commit: {stats['operations']} writes in {stats['batches']} transactions "
+              f"(average {stats['average_batch']:.1f} per commit, {stats['failed_commits']} failed commits)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,28 @@
 # main.py
+import time
+
+# the start of the startup timing, read before anything else is imported
+STARTED = time.perf_counter()
+
+import os
 import tkinter as tk
 from tkinter import messagebox
 
-from db import connect_db
+import queries
+from autocomplete import HashtagCompleter
+from fuzzy_search import FuzzyNameIndex
+from db import connect_db, open_db, read_command_line
 from screen_stack import ScreenStack
+from startup_timing import StartupTimer
+import trace_hooks
+from trace_hooks import recorded_navigation
+import ui_latency
+from ui_latency import LatencyOverlay, LatencyRecorder, TimedCalls, timed_action
+from write_queue import WriteQueue
 
-# Import screen classes
-from screens.screen import Screen
-from screens.login_screen import LoginScreen
-from screens.signup_screen import SignupScreen
-from screens.main_menu_screen import MainMenuScreen
-from screens.feed_screen import FeedScreen
-from screens.search_tweets_screen import SearchTweetsScreen
-from screens.search_users_screen import SearchUsersScreen
-from screens.user_profile_screen import UserProfileScreen
-from screens.user_tweets_screen import UserTweetsScreen
-from screens.tweet_detail_screen import TweetDetailScreen
-from screens.compose_tweet_screen import ComposeTweetScreen
-from screens.reply_tweet_screen import ReplyTweetScreen
-from screens.list_followers_screen import ListFollowersScreen
+# the screens are imported the first time they are shown, and the modules of the optional features (parallel_search,
+# search_index, cache, changelog, metrics and session_trace) only when they are turned on
+from screens.registry import screen_class
 
 
 class App:
@@ -40,11 +44,128 @@ class App:
         self.root = root
         self.root.title("Barebones-Twitter")
         self.root.geometry("500x500")
-        self.conn = connect_db()
+        self.startup = StartupTimer(STARTED)
+        self.startup.mark("imports")
+        self.db_name, self.profile, self.options = read_command_line()
+        self.conn = None
+        # the counters and histograms exported for Prometheus (see metrics.py), only kept when they are exported
+        self.metrics = None
+        self.metrics_exporters = []
+        if self.options["metrics_file"] or self.options["metrics_port"]:
+            from metrics import AppMetrics
+            self.metrics = AppMetrics()
+        # the times of the screen actions (see ui_latency.py), only kept when they are shown, reported or exported
+        self.latency = None
+        if self.options["latency_overlay"] or self.options["latency_report"] or self.metrics is not None:
+            self.latency = ui_latency.active = LatencyRecorder(root)
+            if self.options["latency_overlay"]:
+                LatencyOverlay(root, self.latency)
+            if self.metrics is not None:
+                self.latency.listeners.append(self.metrics.add_action)
+        # the steps of the session (see session_trace.py), only kept when they are recorded
+        self.trace = None
+        if self.options["record_trace"]:
+            from session_trace import TraceRecorder
+            self.trace = trace_hooks.active = TraceRecorder(self.options["record_trace"])
         self.screen_stack = ScreenStack()
         self.show_login_screen()
+        self.startup.mark("login screen")
+        # the database is opened once the login window is up, nothing needs it before the user logs in or signs up and
+        # the events of the window wait until it is open
+        self.root.after_idle(self.open_database)
+
+    def open_database(self):
+        """
+        Opens the database and sets up the queries, the write queue and the optional features that the command line
+        turned on. It runs right after the login window is shown.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        # the window is drawn by the idle tasks that were queued before this one
+        self.root.update_idletasks()
+        self.startup.mark("login window shown")
+        db_name, profile, options = self.db_name, self.profile, self.options
+        self.conn = connect_db()
+        self.startup.mark("database opened")
+        # the worker processes of the parallel search, they are stopped when the app exits
+        self.searcher = None
+        # connect_db opens a directory as a sharded store, the modules of sharding are only imported for one
+        self.sharded = os.path.isdir(db_name)
+        if self.sharded:
+            import sharded_queries
+            # self.conn is a ShardRouter, which also takes the place of the write queue since every shard has its own
+            self.queries = sharded_queries
+            self.write_queue = self.conn
+        else:
+            # all writes go through a single writer connection that group-commits them
+            self.queries = queries
+            if options["search_workers"]:
+                from parallel_search import ParallelQueries, ParallelSearcher
+                self.searcher = ParallelSearcher(db_name, options["search_workers"])
+                self.queries = ParallelQueries(self.searcher)
+            if options["search_index"]:
+                from search_index import IndexedQueries, InvertedIndex
+                self.queries = IndexedQueries(InvertedIndex(), self.queries)
+            self.write_queue = WriteQueue(open_db(db_name, profile, load_extension=False, check_same_thread=False))
+        if options["cache_entries"]:
+            from cache import Cache, CachedQueries, LRUPolicy, TTLPolicy
+            from changelog import Subscriber, installed
+            # the lookups of every screen share one cache, which also hears of the writes of other processes when the
+            # changelog is installed (a sharded store has one changelog per shard, so it only sees its own writes)
+            policy = TTLPolicy(options["cache_ttl"]) if options["cache_ttl"] else LRUPolicy()
+            changes = None
+            if not self.sharded and installed(self.conn):
+                changes = Subscriber(self.conn)
+            self.queries = CachedQueries(Cache(policy, max_entries=options["cache_entries"]), self.queries, changes)
+        if self.metrics is not None:
+            self.start_metrics()
+        if self.latency is not None:
+            # every query and write made during an action counts as its query time
+            self.queries = TimedCalls(self.latency, self.queries)
+            self.write_queue = TimedCalls(self.latency, self.write_queue)
+        if self.trace is not None:
+            from session_trace import RecordedWrites
+            # the writes that succeed are steps of the trace
+            self.write_queue = RecordedWrites(self.write_queue)
+        # the hashtag suggestions of the compose, reply and search screens
+        self.hashtag_completer = HashtagCompleter(
+            lambda after_tid: self.queries.get_hashtag_counts(self.conn, after_tid))
+        # the fuzzy mode of the user search
+        self.user_name_index = FuzzyNameIndex(lambda after_usr: self.queries.get_user_names(self.conn, after_usr))
+        self.startup.mark("ready")
+        if options["startup_timing"]:
+            print(self.startup.report())
+
+    def start_metrics(self):
+        """
+        Times the queries and the writes for the metrics, has them read the counters of the write queues and the cache,
+        and starts exporting them to the file or the port of the command line.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        from metrics import FileExporter, MeteredQueries, MeteredWrites, MetricsServer
+        options = self.options
+        self.metrics.watch_write_queues(self.conn.write_queues if self.sharded else [self.write_queue])
+        if options["cache_entries"]:
+            self.metrics.watch_cache(self.queries.cache)
+        self.queries = MeteredQueries(self.metrics, self.queries)
+        self.write_queue = MeteredWrites(self.metrics, self.write_queue)
+        if options["metrics_file"]:
+            self.metrics_exporters.append(FileExporter(self.metrics.registry, options["metrics_file"],
+                                                       max(1, options["metrics_interval"])))
+        if options["metrics_port"]:
+            try:
+                self.metrics_exporters.append(MetricsServer(self.metrics.registry, options["metrics_port"]))
+            except OSError as e:
+                messagebox.showwarning("Metrics", f"Could not serve the metrics on port {options['metrics_port']}: {e}")
 
     # Screen Switching Functions
+    @timed_action
+    @recorded_navigation
     def show_login_screen(self):
         """
         The entry point of the program, this function is called in the constructor, and it starts off the application by
@@ -54,9 +175,11 @@ class App:
         Returns:
             None
         """
-        self.login = LoginScreen(self)
+        self.login = screen_class("LoginScreen")(self)
         self.screen_stack.push(self.login)
 
+    @timed_action
+    @recorded_navigation
     def show_signup_screen(self):
         """
         Is called by the LoginScreen class whenever we want to allow the user to create a new account in case we don't
@@ -66,9 +189,11 @@ class App:
         Returns:
             None
         """
-        self.signup = SignupScreen(self)
+        self.signup = screen_class("SignupScreen")(self)
         self.screen_stack.push(self.signup)
 
+    @timed_action
+    @recorded_navigation
     def show_feed_screen(self, user_id):
         """
         A function that creates an instance of the FeedScreen class, and for this, we will pull information about the
@@ -79,9 +204,11 @@ class App:
         Returns:
             None
         """
-        self.feed = FeedScreen(self, user_id)
+        self.feed = screen_class("FeedScreen")(self, user_id)
         self.screen_stack.push(self.feed)
 
+    @timed_action
+    @recorded_navigation
     def show_main_menu(self, user_id):
         """
         A function that creates an instance of the MainMenuScreen class, where the user is given options to navigate to
@@ -93,9 +220,11 @@ class App:
         Returns:
             None
         """
-        self.main_menu = MainMenuScreen(self, user_id)
+        self.main_menu = screen_class("MainMenuScreen")(self, user_id)
         self.screen_stack.push(self.main_menu)
 
+    @timed_action
+    @recorded_navigation
     def show_search_users_screen(self, user_id):
         """
         A function that creates an instance of the SearchUsersScreen class, where the user is given options to search
@@ -108,9 +237,11 @@ class App:
         Returns:
             None
         """
-        self.search_user = SearchUsersScreen(self, user_id)
+        self.search_user = screen_class("SearchUsersScreen")(self, user_id)
         self.screen_stack.push(self.search_user)
 
+    @timed_action
+    @recorded_navigation
     def show_tweet_detail_screen(self, user_id, tweet_id):
         """
         A function that creates an instance of the TweetDetailScreen class, where the user is given options to look at
@@ -124,9 +255,11 @@ class App:
         Returns:
             None
         """
-        self.tweet_detail = TweetDetailScreen(self, user_id, tweet_id)
+        self.tweet_detail = screen_class("TweetDetailScreen")(self, user_id, tweet_id)
         self.screen_stack.push(self.tweet_detail)
 
+    @timed_action
+    @recorded_navigation
     def show_reply_tweet_screen(self, user_id, tweet_id):
         """
         A function that creates an instance of the ReplyTweetScreen class, where the user is given the option to reply
@@ -141,9 +274,11 @@ class App:
         Returns:
             None
         """
-        self.reply_tweet = ReplyTweetScreen(self, user_id, tweet_id)
+        self.reply_tweet = screen_class("ReplyTweetScreen")(self, user_id, tweet_id)
         self.screen_stack.push(self.reply_tweet)
 
+    @timed_action
+    @recorded_navigation
     def show_user_profile_screen(self, user_id, target_user_id):
         """
         A function that creates an instance of the UserProfileScreen class, where the profile of a selected user has
@@ -154,9 +289,11 @@ class App:
         Returns:
             None
         """
-        self.user_profile = UserProfileScreen(self, user_id, target_user_id)
+        self.user_profile = screen_class("UserProfileScreen")(self, user_id, target_user_id)
         self.screen_stack.push(self.user_profile)
 
+    @timed_action
+    @recorded_navigation
     def show_user_tweets_screen(self, user_id, target_user_id):
         """
         A function that creates an instance of the UserTweetsScreen class, where all the tweets of a selected user can
@@ -167,9 +304,11 @@ class App:
         Returns:
             None
         """
-        self.user_tweets = UserTweetsScreen(self, user_id, target_user_id)
+        self.user_tweets = screen_class("UserTweetsScreen")(self, user_id, target_user_id)
         self.screen_stack.push(self.user_tweets)
 
+    @timed_action
+    @recorded_navigation
     def show_search_tweets_screen(self, user_id):
         """
         A function that creates an instance of the SearchTweetsScreen class, where we get to search through all the
@@ -180,9 +319,11 @@ class App:
         Returns:
             None
         """
-        self.search_tweets = SearchTweetsScreen(self, user_id)
+        self.search_tweets = screen_class("SearchTweetsScreen")(self, user_id)
         self.screen_stack.push(self.search_tweets)
 
+    @timed_action
+    @recorded_navigation
     def show_compose_tweet_screen(self, user_id):
         """
         A function that creates an instance of the ComposeTweetScreen class, where the user gets to write a tweet.
@@ -194,9 +335,11 @@ class App:
         Returns:
             None
         """
-        self.compose_tweet = ComposeTweetScreen(self, user_id)
+        self.compose_tweet = screen_class("ComposeTweetScreen")(self, user_id)
         self.screen_stack.push(self.compose_tweet)
 
+    @timed_action
+    @recorded_navigation
     def show_list_followers_screen(self, user_id):
         """
         This function creates an instance of the ListFollowersScreen class, which allows the user to see a list of all
@@ -207,9 +350,23 @@ class App:
         Returns:
             None
         """
-        self.list_follower = ListFollowersScreen(self, user_id)
+        self.list_follower = screen_class("ListFollowersScreen")(self, user_id)
         self.screen_stack.push(self.list_follower)
 
+    @timed_action
+    @recorded_navigation
+    def show_trending_screen(self, user_id):
+        """
+        This function creates an instance of the TrendingScreen class, which shows the hashtags that are mentioned the
+        most right now.
+        Inputs:
+            user_id (int): the user_id of the user that is logged in.
+        Returns:
+            None
+        """
+        self.trending = screen_class("TrendingScreen")(self, user_id)
+        self.screen_stack.push(self.trending)
+
     # Helper to clear screen
     def clear_screen(self):
         """
@@ -222,6 +379,8 @@ class App:
         for widget in self.root.winfo_children():
             widget.destroy()
 
+    @timed_action
+    @recorded_navigation
     def back(self):
         """
         Allows the user to go to the page that they were previously on (stored in the screen stack)
@@ -233,6 +392,8 @@ class App:
         self.screen_stack.pop()
         self.screen_stack.peek().build_user_interface()
 
+    @timed_action
+    @recorded_navigation
     def back_to_main_menu(self):
         """
         Takes the user back to the main menu
@@ -244,7 +405,7 @@ class App:
         while len(self.screen_stack) > 2:
             self.screen_stack.pop()
 
-        if type(self.screen_stack.peek()) == MainMenuScreen:
+        if type(self.screen_stack.peek()) == screen_class("MainMenuScreen"):
             self.screen_stack.peek().build_user_interface()
         else:
             messagebox.showwarning("Error",
@@ -264,6 +425,8 @@ class App:
         # changes the title back to the
         self.root.title("Barebones-Twitter")
 
+    @timed_action
+    @recorded_navigation
     def reload(self):
         """
         Reloads the current screen by rebuilding the current user interface
@@ -278,6 +441,19 @@ def main():
     root = tk.Tk()
     app = App(root)
     root.mainloop()
+    if app.options["latency_report"]:
+        app.latency.write(app.options["latency_report"])
+    if app.trace is not None:
+        app.trace.close()
+    if app.conn is None:
+        # the window was closed before the database was opened
+        return
+    app.write_queue.close()
+    if app.searcher is not None:
+        app.searcher.close()
+    # the last export has the writes that were committed on the way out
+    for exporter in app.metrics_exporters:
+        exporter.close()
 
 
 if __name__ == "__main__":
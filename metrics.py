@@ -0,0 +1,505 @@
+# metrics.py
+# Counters and histograms of what the app does, in the text format that Prometheus scrapes, for dashboards of the
+# feed and search latency, the commit rate and the waits for the write lock. They are fed by:
+#   - the queries, every call timed by its name (MeteredQueries),
+#   - the writes, every one timed by the operation, as the screen waits for its commit (MeteredWrites),
+#   - the screen actions of ui_latency.py, timed as a whole,
+#   - the counters that the write queues and the cache already keep, which are only read when the metrics are
+#     exported, so the commits and the lookups cost nothing more.
+# `python main.py database.db --metrics-file app.prom` rewrites the file every --metrics-interval seconds (15 by
+# default, for the textfile collector of the node exporter), and --metrics-port N serves them on
+# http://127.0.0.1:N/metrics for Prometheus to scrape.
+#
+# Usage: python metrics.py app.prom   (prints the histograms of a metrics file as percentiles)
+import bisect
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# the start of every metric name
+PREFIX = "simplex_"
+# the upper bounds of the buckets of the histograms, in seconds; +Inf is added
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# a label of a sample, name="value" with the value escaped
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    """
+    Formats the labels of a sample.
+    Inputs:
+        names (tuple of str): the names of the labels.
+        values (tuple): their values, in the same order.
+        extra (tuple of tuple): more (name, value) pairs, such as the le of a bucket.
+    Returns:
+        str: the labels in braces, or nothing when there are none.
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A count that only goes up, one per combination of the values of its labels.
+    """
+
+    def __init__(self, name, help_text, label_names=()):
+        """
+        Inputs:
+            name (str): the name of the metric, ending in _total.
+            help_text (str): what it counts.
+            label_names (tuple of str): the names of its labels.
+        Returns:
+            None
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        # label values -> count
+        self.values = {}
+
+    def inc(self, amount=1, labels=()):
+        """
+        Adds to the count.
+        Inputs:
+            amount (int or float): how much, not negative.
+            labels (tuple): the values of the labels, in the order of label_names.
+        Returns:
+            None
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def lines(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in values:
+            yield f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+
+
+class Histogram:
+    """
+    How many observations fell at or under each bucket bound, with their sum and count, one per combination of the
+    values of its labels. An observation is a bisect and an add under a lock, cheap enough for every query.
+    """
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        Inputs:
+            name (str): the name of the metric.
+            help_text (str): what it measures.
+            label_names (tuple of str): the names of its labels.
+            buckets (tuple of float): the upper bounds of the buckets, increasing.
+        Returns:
+            None
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # label values -> [count of every bucket (not cumulative) and of +Inf, sum]
+        self.values = {}
+
+    def observe(self, value, labels=()):
+        """
+        Counts an observation.
+        Inputs:
+            value (float): the observation, such as seconds.
+            labels (tuple): the values of the labels, in the order of label_names.
+        Returns:
+            None
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def lines(self):
+        with self.lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", format_value(bound)),)
+                yield f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}"
+
+
+class Registry:
+    """
+    The metrics of the app, and the collectors that read counters kept elsewhere when the metrics are exported.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        # functions called at every export, each returns a list of (name, type, help, [(labels dict, value)])
+        self.collectors = []
+
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(PREFIX + name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(PREFIX + name, help_text, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Exports every metric.
+        Inputs:
+            None
+        Returns:
+            str: the metrics in the Prometheus text format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.lines())
+        for collect in self.collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{PREFIX}{name}{format_labels(names, tuple(labels[n] for n in names))} "
+                                 f"{format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class AppMetrics:
+    """
+    The metrics that the app keeps, in one registry.
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        self.query_seconds = self.registry.histogram(
+            "query_seconds", "Time of the calls to the queries, by query.", ("query",))
+        self.query_errors = self.registry.counter(
+            "query_errors_total", "Calls to the queries that raised, by query.", ("query",))
+        self.write_seconds = self.registry.histogram(
+            "write_seconds", "Time from handing a write to the write queue to its commit, by operation.",
+            ("operation",))
+        self.write_errors = self.registry.counter(
+            "write_errors_total", "Writes that failed or whose commit failed, by operation.", ("operation",))
+        self.action_seconds = self.registry.histogram(
+            "action_seconds", "Time of the screen actions, queries, widgets and layout, by action.", ("action",))
+
+    def add_action(self, name, sample):
+        """
+        Counts a screen action, a listener of ui_latency.LatencyRecorder.
+        Inputs:
+            name (str): the action.
+            sample (tuple): its (total, query, build, layout) in seconds.
+        Returns:
+            None
+        """
+        self.action_seconds.observe(sample[0], (name,))
+
+    def watch_write_queues(self, write_queues):
+        """
+        Exports the counters of write queues, added up, such as the one of the app or those of the shards.
+        Inputs:
+            write_queues (list of WriteQueue): the queues.
+        Returns:
+            None
+        """
+        def collect():
+            stats = [write_queue.stats() for write_queue in write_queues]
+
+            def total(key):
+                return [({}, sum(entry[key] for entry in stats))]
+            return [
+                ("write_batches_total", "counter", "Transactions committed by the write queue.", total("batches")),
+                ("write_operations_total", "counter", "Writes committed by the write queue.", total("operations")),
+                ("write_failed_commits_total", "counter", "Transactions of the write queue that failed.",
+                 total("failed_commits")),
+                ("write_lock_wait_seconds_total", "counter", "Time the write queue waited for the write lock.",
+                 total("lock_wait_seconds")),
+                ("write_commit_seconds_total", "counter", "Time the write queue spent committing.",
+                 total("commit_seconds")),
+            ]
+        self.registry.collectors.append(collect)
+
+    def watch_cache(self, cache):
+        """
+        Exports the counters of the lookup cache.
+        Inputs:
+            cache (cache.Cache): the cache.
+        Returns:
+            None
+        """
+        def collect():
+            stats = cache.stats()
+            counters = [(key, f"cache_{key}_total", f"Lookups of the cache that were {key}.")
+                        for key in ("hits", "misses")]
+            counters += [(key, f"cache_{key}_total", f"Entries of the cache that were dropped, {key}.")
+                         for key in ("evictions", "expirations", "invalidations")]
+            return ([(name, "counter", help_text, [({}, stats[key])]) for key, name, help_text in counters] +
+                    [("cache_entries", "gauge", "Entries in the cache.", [({}, stats["entries"])])])
+        self.registry.collectors.append(collect)
+
+
+class MeteredQueries:
+    """
+    Stands in for the queries of the app and times every call by its name. Everything else is passed on to what it
+    wraps. A query is wrapped the first time it is called.
+    """
+
+    def __init__(self, metrics, base):
+        """
+        Inputs:
+            metrics (AppMetrics): where the times are counted.
+            base (module or object): what the calls are passed on to.
+        Returns:
+            None
+        """
+        self.metrics = metrics
+        self.base = base
+
+    def __getattr__(self, name):
+        value = getattr(self.base, name)
+        if not callable(value):
+            return value
+        labels = (name,)
+
+        @functools.wraps(value)
+        def metered(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            except Exception:
+                self.metrics.query_errors.inc(labels=labels)
+                raise
+            finally:
+                self.metrics.query_seconds.observe(time.perf_counter() - start, labels)
+        # kept on the instance, so the next call finds it without coming back here
+        setattr(self, name, metered)
+        return metered
+
+
+class MeteredWrites:
+    """
+    Stands in for the write queue of the app (or the ShardRouter of a sharded store) and times every write until its
+    commit, by operation. Everything else is passed on to what it wraps.
+    """
+
+    def __init__(self, metrics, base):
+        """
+        Inputs:
+            metrics (AppMetrics): where the times are counted.
+            base (WriteQueue or ShardRouter): what the writes are passed on to.
+        Returns:
+            None
+        """
+        self.metrics = metrics
+        self.base = base
+
+    def execute(self, operation, *args, **kwargs):
+        labels = (operation.__name__,)
+        start = time.perf_counter()
+        try:
+            return self.base.execute(operation, *args, **kwargs)
+        except Exception:
+            self.metrics.write_errors.inc(labels=labels)
+            raise
+        finally:
+            self.metrics.write_seconds.observe(time.perf_counter() - start, labels)
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+
+def write_file(registry, path):
+    """
+    Writes the metrics to a file, through a temporary file that replaces it so a reader never sees half of them.
+    Inputs:
+        registry (Registry): the metrics.
+        path (str): the file.
+    Returns:
+        None
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(registry.render())
+    os.replace(temporary, path)
+
+
+class FileExporter:
+    """
+    Rewrites a metrics file every few seconds on a thread of its own, and once more when it is stopped.
+    """
+
+    def __init__(self, registry, path, interval):
+        """
+        Starts the thread.
+        Inputs:
+            registry (Registry): the metrics.
+            path (str): the file.
+            interval (float): the seconds between two writes.
+        Returns:
+            None
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                write_file(self.registry, self.path)
+            except OSError as e:
+                print(f"Could not write the metrics to {self.path}: {e}", file=sys.stderr)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        write_file(self.registry, self.path)
+
+
+class MetricsServer:
+    """
+    Serves the metrics on http://127.0.0.1:port/metrics on a thread of its own. Only the local machine can reach it.
+    """
+
+    def __init__(self, registry, port):
+        """
+        Starts the server.
+        Inputs:
+            registry (Registry): the metrics.
+            port (int): the port, 0 picks a free one.
+        Raises:
+            OSError: If the port cannot be bound.
+        Returns:
+            None
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?", 1)[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", CONTENT_TYPE)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                # a scrape every few seconds would fill the terminal
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def histogram_percentile(buckets, percent):
+    """
+    Estimates a percentile from the cumulative buckets of a histogram, as histogram_quantile of Prometheus does.
+    Inputs:
+        buckets (list of tuple): (upper bound, cumulative count), increasing, the last bound +Inf.
+        percent (float): the percentile, between 0 and 100.
+    Returns:
+        float: the estimate, the highest finite bound when it falls in the +Inf bucket.
+    """
+    total = buckets[-1][1]
+    rank = total * percent / 100
+    lower, below = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1)
+        lower, below = bound, count
+    return lower
+
+
+def read_histograms(text):
+    """
+    Reads the histograms of a metrics file.
+    Inputs:
+        text (str): the metrics in the Prometheus text format.
+    Returns:
+        dict: (name, labels without le) -> list of (upper bound, cumulative count)
+    """
+    histograms = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "_bucket{" not in line:
+            continue
+        series, count = line.rsplit(" ", 1)
+        name, labels = series.split("{", 1)
+        pairs = LABEL.findall(labels)
+        bound = dict(pairs)["le"]
+        rest = ",".join(f'{label}="{value}"' for label, value in pairs if label != "le")
+        key = (name[:-len("_bucket")], rest)
+        histograms.setdefault(key, []).append((float("inf") if bound == "+Inf" else float(bound), int(count)))
+    return histograms
+
+
+def main(argv=None):
+    """
+    Prints the count and the estimated p50 / p90 / p99 of every histogram of a metrics file.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Usage: python metrics.py app.prom", file=sys.stderr)
+        return 1
+    if not os.path.isfile(argv[0]):
+        print(f"Error: File does not exist: {argv[0]}", file=sys.stderr)
+        return 1
+    with open(argv[0]) as f:
+        histograms = read_histograms(f.read())
+    print(f"{'series':<70}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for (name, labels), buckets in sorted(histograms.items()):
+        if not buckets[-1][1]:
+            continue
+        cells = "".join(f"{histogram_percentile(buckets, percent) * 1000:>10.2f}" for percent in (50, 90, 99))
+        print(f"{name + '{' + labels + '}':<70}{buckets[-1][1]:>8}{cells}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# paging.py
+# The rows behind a scrolling list, read from the database a page at a time as the list gets near its end. A page is
+# asked for with the last row that was read (keyset paging): the queries only read the rows after it, so the
+# thousandth page costs the same as the first one, where an OFFSET or a growing LIMIT would read every row before it
+# again. The rows are kept in CompactRows.
+from compact_rows import CompactRows
+
+# how many rows are read at a time
+PAGE_SIZE = 50
+
+
+class KeysetPager:
+    """
+    The rows of a query that takes (after, limit), such as queries.load_feed or queries.search_tweets, read page by
+    page.
+    """
+
+    def __init__(self, fetch, shape, page_size=PAGE_SIZE, keep=None):
+        """
+        Creates the pager, no rows are read until load_more.
+        Inputs:
+            fetch (function): called as fetch(after, limit), returns up to limit rows that come after the row after,
+            or the first rows when after is None.
+            shape (str): the shape of the rows, see compact_rows.
+            page_size (int): how many rows are read at a time.
+            keep (function or None): called with every row read, the rows that it returns False for are left out.
+        Returns:
+            None
+        """
+        self.fetch = fetch
+        self.page_size = page_size
+        self.keep = keep
+        self.rows = CompactRows(shape)
+        # the last row that fetch returned, which a row that is left out can be
+        self.last = None
+        self.done = False
+
+    @classmethod
+    def of_rows(cls, shape, rows):
+        """
+        Creates a pager whose rows are all known already, such as results that were ranked in memory.
+        Inputs:
+            shape (str): the shape of the rows.
+            rows (iterable of tuple): the rows.
+        Returns:
+            KeysetPager: the pager, with nothing left to load.
+        """
+        pager = cls(None, shape)
+        pager.rows.extend(rows)
+        pager.done = True
+        return pager
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def load_more(self):
+        """
+        Reads the next page, unless every row has been read.
+        Inputs:
+            None
+        Returns:
+            int: the number of rows that were added.
+        """
+        if self.done:
+            return 0
+        page = self.fetch(self.last, self.page_size)
+        if len(page) < self.page_size:
+            self.done = True
+        if page:
+            self.last = page[-1]
+        before = len(self.rows)
+        self.rows.extend(page if self.keep is None else (row for row in page if self.keep(row)))
+        return len(self.rows) - before
+
+    def prepend(self, rows):
+        """
+        Puts rows in front of the ones that were read, the next page still starts after the last row read.
+        Inputs:
+            rows (iterable of tuple): the rows.
+        Returns:
+            None
+        """
+        self.rows = CompactRows(self.rows.shape, rows) + self.rows
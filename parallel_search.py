@@ -0,0 +1,213 @@
+# parallel_search.py
+# Runs the tweet search on several processes at once. The regexp_like keyword match is CPU-bound and SQLite runs a
+# query on one core, so the rowid range of the tweets table is cut into chunks and every chunk is searched by a worker
+# process on its own read-only connection. The chunks come back sorted by ts DESC, tid DESC and are merged in that
+# order. On a partitioned database (see partitions.py) every tier is split across the workers, one tier after the
+# other, newest first, so a search for one page still stops at the first tiers that fill it.
+#
+# Usage: python parallel_search.py database.db "keyword,#hashtag" [--workers N] [--limit N] [--compare]
+import argparse
+import heapq
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import db
+import partitions
+import queries
+from exceptions import NonexistentDatabaseException
+
+# the connection of a worker process, opened by _open_worker_connection when the process starts
+_worker_conn = None
+
+
+def _open_worker_connection(db_name):
+    """
+    Runs once in every worker process.
+    Inputs:
+        db_name (str): path to the database file.
+    Returns:
+        None
+    """
+    global _worker_conn
+    _worker_conn = db.open_db(db_name, "read-only", attach_partitions=True)
+
+
+def _search_chunk(keywords, database, first_rowid, last_rowid, limit, after=None):
+    """
+    Runs in a worker process: searches one chunk of one tier.
+    Inputs:
+        keywords (list of str): the lowercased, validated search keywords.
+        database (str): the schema of the tier.
+        first_rowid (int), last_rowid (int): the rowid range of the chunk.
+        limit (int): the most rows to return, -1 for all of them.
+        after (tuple or None): a row of the results, only the rows after it are returned.
+    Returns:
+        list of tuple: (writer_id, tid, text, tdate, ttime) rows, newest first.
+    """
+    sql, parameters = queries.build_tweet_search_query(keywords, database, (first_rowid, last_rowid), after)
+    return _worker_conn.execute(sql + ' LIMIT ?', parameters + [limit]).fetchall()
+
+
+def split_range(first, last, chunks):
+    """
+    Cuts an inclusive range of integers into about equal, non-empty pieces.
+    Inputs:
+        first (int), last (int): the range.
+        chunks (int): the number of pieces wanted.
+    Returns:
+        list of tuple: (first, last) pieces in order.
+    """
+    size = max(1, -(-(last - first + 1) // chunks))
+    return [(low, min(low + size - 1, last)) for low in range(first, last + 1, size)]
+
+
+class ParallelSearcher:
+    """
+    A pool of worker processes that the tweet search is spread over.
+    """
+
+    def __init__(self, db_name, workers=None, chunks_per_worker=2):
+        """
+        Starts the worker processes.
+        Inputs:
+            db_name (str): path to the database file.
+            workers (int or None): the number of processes, one per CPU when None.
+            chunks_per_worker (int): how many chunks every tier is cut into per worker, more chunks even out workers
+            that are slower than the others.
+        Raises:
+            NonexistentDatabaseException: If the database file does not exist.
+        Returns:
+            None
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunks = self.workers * chunks_per_worker
+        # the parent only looks at the rowid ranges, it never runs the search itself
+        self.conn = db.open_db(db_name, "read-only", load_extension=False, attach_partitions=True)
+        # spawn rather than fork: the parent may already be running Tk and the writer thread
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_open_worker_connection, initargs=(db_name,))
+
+    def close(self):
+        """
+        Stops the worker processes and closes the connection.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=True)
+        self.conn.close()
+
+    def search_tier(self, keywords, database, limit, after=None):
+        """
+        Searches one tier on all the workers.
+        Inputs:
+            keywords (list of str): the lowercased, validated search keywords.
+            database (str): the schema of the tier.
+            limit (int): the most rows to return, -1 for all of them.
+            after (tuple or None): a row of the results, only the rows after it are returned.
+        Returns:
+            list of tuple: (writer_id, tid, text, tdate, ttime) rows, newest first.
+        """
+        first, last = self.conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {database}.tweets").fetchone()
+        if first is None:
+            return []
+        futures = [self.executor.submit(_search_chunk, keywords, database, low, high, limit, after)
+                   for low, high in split_range(first, last, self.chunks)]
+        results = [future.result() for future in futures]
+        merged = heapq.merge(*results, key=queries.search_position)
+        return list(merged if limit < 0 else itertools.islice(merged, limit))
+
+    def search(self, keywords, limit=None, after=None):
+        """
+        Runs a tweet search, with the same results as queries.search_tweets.
+        Inputs:
+            keywords (list of str): the lowercased, validated search keywords.
+            limit (int or None): the most rows to return, all of them when None.
+            after (tuple or None): a row of the results, only the rows after it are returned.
+        Returns:
+            list of tuple: (writer_id, tid, text, tdate, ttime) rows, newest first.
+        """
+        if queries.build_tweet_search_query(keywords)[0] is None:
+            return []
+        return partitions.read_newest_first(
+            self.conn, lambda database, tier_limit: self.search_tier(keywords, database, tier_limit, after),
+            queries.order_newest_first, lambda row: row[3], limit)
+
+
+class ParallelQueries:
+    """
+    Stands in for the queries module in the app, with the tweet search running on a ParallelSearcher.
+    """
+
+    def __init__(self, searcher):
+        """
+        Inputs:
+            searcher (ParallelSearcher): the pool to search on.
+        Returns:
+            None
+        """
+        self.searcher = searcher
+
+    def __getattr__(self, name):
+        return getattr(queries, name)
+
+    def search_tweets(self, conn, keywords, limit=None, after=None):
+        """See queries.search_tweets, conn is not used since the workers have their own connections."""
+        return self.searcher.search(keywords, limit, after)
+
+
+def main(argv=None):
+    """
+    Runs one search in parallel, and optionally also on a single connection to compare the time and the results.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Search tweets on several processes at once.")
+    parser.add_argument("database")
+    parser.add_argument("keywords", help="comma-separated keywords, as typed into the search screen")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--chunks-per-worker", type=int, default=2)
+    parser.add_argument("--limit", type=int, help="only get the first N results")
+    parser.add_argument("--compare", action="store_true", help="also run the search on a single connection")
+    args = parser.parse_args(argv)
+    keywords = [keyword.lower().strip() for keyword in args.keywords.split(",") if keyword.strip()]
+
+    try:
+        searcher = ParallelSearcher(args.database, args.workers, args.chunks_per_worker)
+    except (NonexistentDatabaseException, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    try:
+        # the first search also waits for the workers to start, so it is not timed
+        searcher.search(keywords, 1)
+        start = time.perf_counter()
+        rows = searcher.search(keywords, args.limit)
+        parallel_seconds = time.perf_counter() - start
+        print(f"parallel ({searcher.workers} workers, {searcher.chunks} chunks per tier): {len(rows)} tweets "
+              f"in {parallel_seconds * 1000:.1f} ms")
+        if args.compare:
+            conn = db.open_db(args.database, "read-only", attach_partitions=True)
+            start = time.perf_counter()
+            expected = queries.search_tweets(conn, keywords, args.limit)
+            serial_seconds = time.perf_counter() - start
+            conn.close()
+            print(f"single connection: {len(expected)} tweets in {serial_seconds * 1000:.1f} ms "
+                  f"({serial_seconds / parallel_seconds:.1f}x)")
+            # ts DESC, tid DESC leaves no ties, so both searches must return the same rows in the same order
+            same = rows == expected
+            print("results match" if same else "results DIFFER")
+    finally:
+        searcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
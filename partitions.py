@@ -0,0 +1,438 @@
+# partitions.py
+# Moves old tweets, retweets and hashtag mentions out of the main database into one database file per month. The main
+# database keeps the last few months (the hot tier) and takes every new write, the monthly partitions are compacted
+# once they are written and are only ever attached read-only. Months that are too old to get a partition of their own
+# go into a single "older" partition, because SQLite can only attach a handful of databases to one connection.
+#
+# A reader that attaches the partitions (see attach_partitions) gets temporary views named tweets, retweets and
+# hashtag_mentions that cover every tier, so all the queries keep working unchanged. The feed, the tweet search and the
+# recent tweets of a profile go one tier at a time instead, newest first, and stop as soon as they have a full page
+# (see read_newest_first).
+#
+# Usage: python partitions.py archive database.db [--keep-months 3] [--vacuum]
+#        python partitions.py status database.db
+#        python partitions.py migrate database.db
+#
+# Archiving should only be run while nothing else has the database open, since readers attach the partitions that
+# exist when they connect.
+import argparse
+import calendar
+import datetime
+import os
+import sqlite3
+import sys
+
+import schema
+
+PARTITIONED_TABLES = ["tweets", "retweets", "hashtag_mentions"]
+
+MANIFEST = """CREATE TABLE IF NOT EXISTS partitions (
+    name TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL
+)"""
+
+# SQLite attaches at most 10 databases to a connection, the monthly partitions and "older" leave one free for tools
+MAX_MONTHLY_PARTITIONS = 8
+OLDER = "older"
+
+# attached partitions are named part_2024_10, part_older, ...
+SCHEMA_PREFIX = "part_"
+
+
+def schema_name(name):
+    """
+    Gets the name a partition is attached under.
+    Inputs:
+        name (str): the name of the partition, "YYYY-MM" or "older".
+    Returns:
+        str: the schema name.
+    """
+    return SCHEMA_PREFIX + name.replace("-", "_")
+
+
+def partition_directory(db_name):
+    """
+    Gets the directory that holds the partitions of a database, next to the database file.
+    Inputs:
+        db_name (str): path to the main database file.
+    Returns:
+        str: the directory.
+    """
+    return os.path.splitext(os.path.abspath(db_name))[0] + ".partitions"
+
+
+def list_partitions(conn):
+    """
+    Reads the partitions that the main database knows about.
+    Inputs:
+        conn (sqlite3.Connection): a connection to the main database.
+    Returns:
+        list of tuple: (name, file, first_date, last_date) rows, newest first. file is relative to the directory of
+        the main database.
+    """
+    exists = conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'partitions'").fetchone()
+    if not exists:
+        return []
+    return conn.execute("SELECT name, file, first_date, last_date FROM main.partitions "
+                        "ORDER BY last_date DESC").fetchall()
+
+
+def attach_partitions(conn, db_name):
+    """
+    Attaches every partition read-only and creates the temporary views that make tweets, retweets and
+    hashtag_mentions cover all the tiers. Connections with the views can only read those tables.
+    Inputs:
+        conn (sqlite3.Connection): a connection to the main database.
+        db_name (str): path to the main database file.
+    Returns:
+        int: the number of partitions attached.
+    """
+    partitions = list_partitions(conn)
+    if not partitions:
+        return 0
+    base = os.path.dirname(os.path.abspath(db_name))
+    for name, file, first_date, last_date in partitions:
+        conn.execute("ATTACH DATABASE ? AS " + schema_name(name), (f"file:{os.path.join(base, file)}?mode=ro",))
+
+    # the views live in the temp database, which query_only would refuse to write to as well
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    conn.execute("PRAGMA query_only = OFF")
+    for table in PARTITIONED_TABLES:
+        sources = [f"SELECT * FROM main.{table}"]
+        sources.extend(f"SELECT * FROM {schema_name(name)}.{table}" for name, file, first, last in partitions)
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {table} AS " + " UNION ALL ".join(sources))
+    conn.execute(f"PRAGMA query_only = {query_only}")
+    return len(partitions)
+
+
+def add_timestamps(conn, db_name):
+    """
+    Gives the partitions of a database that were archived before the ts column existed their ts columns (see
+    schema.add_timestamps). This is the only time a partition is written to after its archive run.
+    Inputs:
+        conn (sqlite3.Connection): a connection to the main database.
+        db_name (str): path to the main database file.
+    Returns:
+        int: the number of partitions that got the columns.
+    """
+    base = os.path.dirname(os.path.abspath(db_name))
+    upgraded = 0
+    for name, file, first_date, last_date in list_partitions(conn):
+        partition = sqlite3.connect(os.path.join(base, file))
+        if schema.add_timestamps(partition):
+            partition.commit()
+            upgraded += 1
+        partition.close()
+    return upgraded
+
+
+def migrate_timestamps(conn, db_name):
+    """
+    Gives a database that was created before the ts column existed, and its partitions, their ts columns. Every
+    connection that opens such a database tries this at the same time, so it is done under the write lock and the
+    columns are read again once the lock is held: only the first connection migrates, the others find it done.
+    Inputs:
+        conn (sqlite3.Connection): a writable connection to the main database, not in a transaction.
+        db_name (str): path to the main database file.
+    Raises:
+        sqlite3.Error: If the migration fails, nothing of it is kept.
+    Returns:
+        bool: True if this connection did the migration.
+    """
+    if not schema.missing_timestamps(conn):
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        added = schema.add_timestamps(conn)
+        if added:
+            # the partitions are migrated before the lock is let go, so no reader sees them without their columns
+            add_timestamps(conn, db_name)
+        conn.commit()
+    except sqlite3.OperationalError as error:
+        conn.rollback()
+        if "duplicate column" not in str(error):
+            raise
+        added = False
+    return added
+
+
+def tiers(conn):
+    """
+    Gets the tiers that a connection can read, newest first: the main database, then the attached partitions.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        list of tuple: (schema name, last date or None) pairs, the main database has no last date.
+    """
+    attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith(SCHEMA_PREFIX)]
+    if not attached:
+        return [("main", None)]
+    last_dates = {schema_name(name): last_date for name, file, first_date, last_date in list_partitions(conn)}
+    ordered = sorted((last_dates[name], name) for name in attached if name in last_dates)
+    return [("main", None)] + [(name, last_date) for last_date, name in reversed(ordered)]
+
+
+def read_newest_first(conn, run, order, date_of, limit=None):
+    """
+    Runs a query on one tier at a time, newest first, and stops once the next tier cannot change the first limit rows:
+    when there already are limit rows and the last of them is newer than anything in that tier.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        run (function): called as run(schema name, limit) for each tier, returns its rows in order. A limit of -1
+        means no limit.
+        order (function): sorts a list of rows into the order of the query.
+        date_of (function): gets the date of a row.
+        limit (int or None): the number of rows wanted, all of them when None.
+    Returns:
+        list: the rows, at most limit of them.
+    """
+    rows = []
+    for database, last_date in tiers(conn):
+        if limit is not None and len(rows) >= limit and str(date_of(rows[limit - 1])) > last_date:
+            break
+        rows = order(rows + run(database, -1 if limit is None else limit))
+    return rows if limit is None else rows[:limit]
+
+
+def month_range(month):
+    """
+    Gets the first and the last day of a month.
+    Inputs:
+        month (str): "YYYY-MM".
+    Returns:
+        tuple: ("YYYY-MM-01", "YYYY-MM-DD") with the last day of the month.
+    """
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{month}-01", f"{month}-{calendar.monthrange(year, number)[1]:02d}"
+
+
+def create_partition_file(path):
+    """
+    Creates an empty partition file with the partitioned tables and their indexes.
+    Inputs:
+        path (str): the file to create.
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(path)
+    for name, sql in schema.TABLES:
+        if name in PARTITIONED_TABLES:
+            conn.execute(sql)
+    for name, sql in schema.SECONDARY_INDEXES:
+        if any(f" ON {table} " in sql for table in PARTITIONED_TABLES):
+            conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def copy_rows(conn, source, target, condition, parameters):
+    """
+    Copies the rows of some tweets and retweets, with the hashtag mentions of those tweets, between two attached
+    databases. Rows that are already there are replaced, so an archive run that was interrupted can be run again.
+    Inputs:
+        conn (sqlite3.Connection): a connection with both databases attached.
+        source (str), target (str): the schema names.
+        condition (dict): table -> WHERE clause over that table in source, hashtag_mentions may use {src}.
+        parameters (dict): table -> the parameters of its WHERE clause.
+    Returns:
+        None
+    """
+    for table in PARTITIONED_TABLES:
+        columns = ", ".join(f'"{column}"' for column in schema.table_columns(conn, table))
+        conn.execute(f"INSERT OR REPLACE INTO {target}.{table} ({columns}) SELECT {columns} FROM {source}.{table} "
+                     f"WHERE {condition[table].format(src=source)}", parameters[table])
+
+
+def delete_rows(conn, source, condition, parameters):
+    """
+    Deletes what copy_rows copied, the hashtag mentions first since they are found through their tweets.
+    Inputs:
+        see copy_rows.
+    Returns:
+        None
+    """
+    for table in reversed(PARTITIONED_TABLES):
+        conn.execute(f"DELETE FROM {source}.{table} WHERE {condition[table].format(src=source)}", parameters[table])
+
+
+def archive(db_name, keep_months=3, today=None, max_monthly=MAX_MONTHLY_PARTITIONS):
+    """
+    Moves the tweets and retweets that are older than the hot tier into partitions. Tweets go by tdate and retweets
+    by rdate, so every tier covers a range of dates. The newest tweet always stays in the main database, since new
+    tweet ids are one more than the largest id there.
+    Inputs:
+        db_name (str): path to the main database file.
+        keep_months (int): the number of months kept in the main database, counting the current one.
+        today (datetime.date or None): the current date, for testing.
+        max_monthly (int): the most monthly partitions, older months go into the "older" partition.
+    Returns:
+        dict: partition name -> number of rows moved into it.
+    """
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + today.month - 1 - (keep_months - 1)
+    cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+
+    directory = partition_directory(db_name)
+    os.makedirs(directory, exist_ok=True)
+    relative = os.path.basename(directory)
+    conn = sqlite3.connect(db_name)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute(MANIFEST)
+    conn.commit()
+    # the partitions are created with the ts columns, so the rows moved into them need theirs
+    migrate_timestamps(conn, db_name)
+
+    months = sorted({row[0] for row in conn.execute("""
+        SELECT DISTINCT substr(tdate, 1, 7) FROM tweets WHERE tdate < ?
+        UNION SELECT DISTINCT substr(rdate, 1, 7) FROM retweets WHERE rdate < ?
+    """, (cutoff, cutoff))}, reverse=True)
+    existing = {name: (file, first_date, last_date) for name, file, first_date, last_date in list_partitions(conn)}
+    everything = sorted(set(months) | (set(existing) - {OLDER}), reverse=True)
+    monthly = set(everything[:max_monthly])
+    newest_tid = conn.execute("SELECT IFNULL(MAX(tid), -1) FROM tweets").fetchone()[0]
+
+    moved = {}
+    ranges = {}
+
+    def attach(name):
+        path = os.path.join(directory, f"{name}.db")
+        if not os.path.exists(path):
+            create_partition_file(path)
+        conn.execute("ATTACH DATABASE ? AS target", (path,))
+        return path
+
+    for month in months:
+        name = month if month in monthly else OLDER
+        first_date, last_date = month_range(month)
+        mentions = "tid IN (SELECT tid FROM {src}.tweets WHERE tdate BETWEEN ? AND ? AND tid <> ?)"
+        condition = {"tweets": "tdate BETWEEN ? AND ? AND tid <> ?", "retweets": "rdate BETWEEN ? AND ?",
+                     "hashtag_mentions": mentions}
+        parameters = {"tweets": (first_date, last_date, newest_tid), "retweets": (first_date, last_date),
+                      "hashtag_mentions": (first_date, last_date, newest_tid)}
+        attach(name)
+        before = conn.total_changes
+        copy_rows(conn, "main", "target", condition, parameters)
+        moved[name] = moved.get(name, 0) + conn.total_changes - before
+        conn.commit()
+        delete_rows(conn, "main", condition, parameters)
+        conn.commit()
+        conn.execute("DETACH DATABASE target")
+        low, high = ranges.get(name, (first_date, last_date))
+        ranges[name] = (min(low, first_date), max(high, last_date))
+
+    # monthly partitions that have become too old are folded into "older"
+    for name in set(existing) - monthly - {OLDER}:
+        file, first_date, last_date = existing.pop(name)
+        path = os.path.join(os.path.dirname(os.path.abspath(db_name)), file)
+        conn.execute("ATTACH DATABASE ? AS source", (path,))
+        attach(OLDER)
+        everything_in = {table: "1" for table in PARTITIONED_TABLES}
+        before = conn.total_changes
+        copy_rows(conn, "source", "target", everything_in, {table: () for table in PARTITIONED_TABLES})
+        moved[OLDER] = moved.get(OLDER, 0) + conn.total_changes - before
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+        conn.execute("DETACH DATABASE target")
+        conn.execute("DELETE FROM partitions WHERE name = ?", (name,))
+        conn.commit()
+        os.remove(path)
+        low, high = ranges.get(OLDER, (first_date, last_date))
+        ranges[OLDER] = (min(low, first_date), max(high, last_date))
+
+    for name, (first_date, last_date) in ranges.items():
+        if name in existing:
+            first_date = min(first_date, existing[name][1])
+            last_date = max(last_date, existing[name][2])
+        conn.execute("INSERT OR REPLACE INTO partitions (name, file, first_date, last_date) VALUES (?, ?, ?, ?)",
+                     (name, f"{relative}/{name}.db", first_date, last_date))
+        # the partition will not change again until the next archive run, so it is compacted and made self-contained
+        partition = sqlite3.connect(os.path.join(directory, f"{name}.db"))
+        partition.execute("ANALYZE")
+        partition.commit()
+        partition.execute("VACUUM")
+        partition.execute("PRAGMA journal_mode = DELETE").fetchone()
+        partition.close()
+    conn.commit()
+    conn.close()
+    return moved
+
+
+def print_status(db_name):
+    """
+    Prints the rows of every tier.
+    Inputs:
+        db_name (str): path to the main database file.
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_name)}?mode=ro", uri=True)
+    attach_partitions(conn, db_name)
+    print(f"{'tier':<14}{'dates':<25}{'tweets':>10}{'retweets':>10}{'mentions':>10}")
+    ranges = {schema_name(name): f"{first_date}..{last_date}"
+              for name, file, first_date, last_date in list_partitions(conn)}
+    for database, last_date in tiers(conn):
+        counts = [conn.execute(f"SELECT COUNT(*) FROM {database}.{table}").fetchone()[0]
+                  for table in PARTITIONED_TABLES]
+        label = "hot" if database == "main" else database[len(SCHEMA_PREFIX):]
+        print(f"{label:<14}{ranges.get(database, ''):<25}{counts[0]:>10}{counts[1]:>10}{counts[2]:>10}")
+    conn.close()
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the archive, status or migrate command.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Move old tweets into monthly read-only partitions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive_parser = commands.add_parser("archive", help="move the months before the hot tier into partitions")
+    archive_parser.add_argument("database")
+    archive_parser.add_argument("--keep-months", type=int, default=3,
+                                help="months kept in the main database, counting the current one (default 3)")
+    archive_parser.add_argument("--vacuum", action="store_true", help="also compact the main database afterwards")
+    status_parser = commands.add_parser("status", help="show the rows of every tier")
+    status_parser.add_argument("database")
+    migrate_parser = commands.add_parser("migrate", help="add the ts columns to an older database and its partitions, "
+                                                         "so that it can be opened read-only")
+    migrate_parser.add_argument("database")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.database):
+        print(f"Error: Database does not exist: {args.database}", file=sys.stderr)
+        return 1
+    if args.command == "archive":
+        if args.keep_months < 1:
+            parser.error("--keep-months must be at least 1")
+        try:
+            moved = archive(args.database, args.keep_months)
+            if args.vacuum:
+                conn = sqlite3.connect(args.database)
+                conn.execute("VACUUM")
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        for name, rows in sorted(moved.items()):
+            print(f"{name}: {rows} rows moved")
+    elif args.command == "migrate":
+        conn = sqlite3.connect(args.database)
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            migrated = migrate_timestamps(conn, args.database)
+        except sqlite3.Error as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            conn.close()
+        print("ts columns added" if migrated else "already migrated")
+    print_status(args.database)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# pool.py
+# A fixed-size pool of database connections that can be shared between threads. Each connection is only ever used by
+# one thread at a time: it is taken out of the pool, used, and put back.
+import contextlib
+import queue
+
+import db
+from exceptions import PoolTimeoutException
+
+
+class ConnectionPool:
+    """
+    Holds a fixed number of open connections to one database file, all opened with the same connection profile.
+    """
+
+    def __init__(self, db_name, size=4, profile="read-only", load_extension=True, attach_partitions=True):
+        """
+        Opens every connection of the pool up front, so that errors (a missing file, for example) show up right away.
+        Inputs:
+            db_name (str): path to the database file.
+            size (int): the number of connections.
+            profile (str): the connection profile of every connection, read-only by default since writes are expected
+            to go through a WriteQueue.
+            load_extension (bool): whether to load the regexp extension into every connection.
+            attach_partitions (bool): whether to attach the archived months, see db.open_db.
+        Returns:
+            None
+        """
+        self.size = size
+        self.available = queue.Queue()
+        self.all = []
+        for _ in range(size):
+            conn = db.open_db(db_name, profile, load_extension=load_extension, check_same_thread=False,
+                              attach_partitions=attach_partitions)
+            self.all.append(conn)
+            self.available.put(conn)
+
+    def acquire(self, timeout=None):
+        """
+        Takes a connection out of the pool, waiting for one to be released if they are all in use.
+        Inputs:
+            timeout (float or None): the most seconds to wait, None waits forever.
+        Raises:
+            PoolTimeoutException: If no connection became free in time.
+        Returns:
+            sqlite3.Connection: the connection, which must be given back with release.
+        """
+        try:
+            return self.available.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeoutException(timeout)
+
+    def release(self, conn):
+        """
+        Gives a connection back to the pool, ending any transaction that was left open on it.
+        Inputs:
+            conn (sqlite3.Connection): a connection taken with acquire.
+        Returns:
+            None
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self.available.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        Lends a connection for the duration of a with block.
+        Inputs:
+            timeout (float or None): see acquire.
+        Returns:
+            sqlite3.Connection: the connection, given back when the block ends.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Closes every connection of the pool. The pool must not be used afterwards.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        for conn in self.all:
+            conn.close()
+        self.all = []
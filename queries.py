@@ -0,0 +1,775 @@
+# queries.py
+# The SQL that the screens run, pulled out into plain functions that only need a connection. The screens call these to
+# get their data, and so can anything that does not have a Tk window (the load tester, for example). None of the write
+# functions commit, the caller decides when the transaction ends.
+import re
+import datetime
+import db
+import partitions
+import schema
+import trending
+from exceptions import InvalidHashtagException, DuplicateHashtagException
+
+# how the search screen explains the keywords that search_tweets takes
+SEARCH_HELP = "Enter Keywords (comma-separated) - case insensitive"
+
+
+def authenticate(conn, user_id, password):
+    """
+    Looks up a user by id and password.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id that the user typed in.
+        password (str): the password that the user typed in.
+    Returns:
+        tuple or None: the full users row if the credentials match, otherwise None.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE usr = ? AND pwd = ?", (user_id, password))
+    return cursor.fetchone()
+
+
+def get_user_name(conn, user_id):
+    """
+    Gets the name of a user.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user.
+    Returns:
+        str or None: the name of the user, or None if there is no such user.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT name FROM users
+        WHERE usr = ?
+    """, (user_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def create_user(conn, name, email, phone, password, new_usr=None):
+    """
+    Inserts a new user with the next available user id.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        name (str), email (str), phone (str), password (str): the validated signup fields.
+        new_usr (int or None): the id to give the user, picked from MAX(usr) when None.
+    Returns:
+        str: the id of the new user.
+    """
+    cursor = conn.cursor()
+    if new_usr is None:
+        cursor.execute("SELECT MAX(usr) FROM users")
+        result = cursor.fetchone()
+        new_usr = str(int(result[0]) + 1) if result[0] else '1'
+    new_usr = str(new_usr)
+    cursor.execute("INSERT INTO users (usr, name, email, phone, pwd) VALUES (?, ?, ?, ?, ?)",
+                   (new_usr, name, email.lower(), phone, password))
+    return new_usr
+
+
+def get_followed_users(conn, user_id):
+    """
+    Gets the ids of all the users that a user follows.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the follower.
+    Returns:
+        list of int: the ids of the followed users.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT flwee FROM follows WHERE flwer = ?
+    """, (user_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def feed_position(row):
+    """
+    Gets where a feed row goes in the order of load_feed (ts DESC, tid, writer_id, status), as a key that grows down
+    the feed.
+    Inputs:
+        row (tuple): a (tid, text, tdate, ttime, writer_id, name, status) row.
+    Returns:
+        tuple: (-ts, tid, writer_id, status)
+    """
+    return -schema.timestamp_of_text(row[2], row[3]), row[0], row[4], row[6]
+
+
+def order_feed(rows):
+    """
+    Sorts feed rows like ORDER BY ts DESC, tid, writer_id, status does, the ts of a row is the number that its date and
+    time spell.
+    Inputs:
+        rows (list of tuple): (tid, text, tdate, ttime, writer_id, name, status) rows.
+    Returns:
+        list of tuple: the sorted rows.
+    """
+    return sorted(rows, key=feed_position)
+
+
+def load_feed(conn, user_id, limit=None, after=None):
+    """
+    Gets the tweets and retweets of every user that a user follows, newest first. On a partitioned database the tiers
+    are read newest first until limit rows are found.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user whose feed we are loading.
+        limit (int or None): the most rows to return, all of them when None.
+        after (tuple or None): a row of the feed, only the rows that come after it are returned. Pages read this way
+        cost the same however deep into the feed they are.
+    Returns:
+        list of tuple: (tid, text, tdate, ttime, writer_id, name, status) rows, where status is 'tweeted' or
+        'retweeted' and tdate/ttime have been converted to strings. The time of a retweet comes from its ts.
+    """
+    # both halves only read up to the ts of the row to start after, the rows of that second are then cut exactly
+    after_condition, tweet_bound, retweet_bound = "", "", ""
+    after_parameters = []
+    if after is not None:
+        negated_ts, tid, writer_id, status = feed_position(after)
+        after_condition = "WHERE ts < ? OR (ts = ? AND (tid, writer_id, status) > (?, ?, ?))"
+        after_parameters = [-negated_ts, -negated_ts, tid, writer_id, status]
+        tweet_bound, retweet_bound = f"AND t.ts <= {-negated_ts:d}", f"AND rt.ts <= {-negated_ts:d}"
+
+    def run(database, tier_limit):
+        # the tweet that was retweeted can be in any tier, so that join goes through the unqualified tweets
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT tid, text, tdate, ttime, writer_id, name, status FROM
+            (SELECT t.tid, t.text, t.tdate, t.ttime, t.writer_id, u.name, 'tweeted' AS status, t.ts
+            FROM follows f
+            JOIN {database}.tweets t ON t.writer_id = f.flwee
+            JOIN users u ON t.writer_id = u.usr
+            WHERE f.flwer = ? {tweet_bound}
+
+            UNION
+
+            SELECT rt.tid, t.text, rt.rdate AS tdate, TIME(rt.ts, 'unixepoch') AS ttime, rt.retweeter_id AS writer_id,
+                   u.name, 'retweeted' AS status, rt.ts
+            FROM follows f
+            JOIN {database}.retweets rt ON rt.retweeter_id = f.flwee
+            JOIN tweets t ON rt.tid = t.tid
+            JOIN users u ON rt.retweeter_id = u.usr
+            WHERE f.flwer = ? {retweet_bound}
+            )
+            {after_condition}
+            ORDER BY ts DESC, tid, writer_id, status
+            LIMIT ?
+        """, [user_id, user_id] + after_parameters + [tier_limit])
+        return cursor.fetchall()
+
+    rows = partitions.read_newest_first(conn, run, order_feed, lambda row: row[2], limit)
+    return [(tid, text, str(tdate), str(ttime), writer_id, name, status) for
+            tid, text, tdate, ttime, writer_id, name, status in rows]
+
+
+def get_feed_mark(conn):
+    """
+    Gets the high-water mark of the feeds: the highest tweet id and the highest rowid of retweets. Everything written
+    later is above it. New rows always go to the main database, even when old ones are in partitions.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        tuple: (highest tid, highest retweet rowid), -1 for an empty table.
+    """
+    return conn.execute("""
+        SELECT COALESCE((SELECT MAX(tid) FROM main.tweets), -1),
+               COALESCE((SELECT MAX(rowid) FROM main.retweets), -1)
+    """).fetchone()
+
+
+def load_new_feed_items(conn, user_id, mark):
+    """
+    Gets the tweets and retweets that were added to a user's feed since a mark was taken. Both parts are range scans
+    of a primary key, so this is cheap enough to run every few seconds.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user whose feed we are loading.
+        mark (tuple): a mark from get_feed_mark or from an earlier call.
+    Returns:
+        tuple: (the new rows like load_feed returns them, newest first, the mark to pass next time)
+    """
+    last_tid, last_rowid = mark
+    new_mark = get_feed_mark(conn)
+    rows = conn.execute("""
+        SELECT t.tid, t.text, t.tdate, t.ttime, t.writer_id, u.name, 'tweeted' AS status
+        FROM main.tweets t
+        JOIN users u ON t.writer_id = u.usr
+        WHERE t.tid > ? AND t.tid <= ? AND EXISTS (SELECT flwee FROM follows WHERE flwee = t.writer_id AND flwer = ?)
+
+        UNION
+
+        SELECT rt.tid, t.text, rt.rdate AS tdate, TIME(rt.ts, 'unixepoch') AS ttime, rt.retweeter_id AS writer_id,
+               u.name, 'retweeted' AS status
+        FROM main.retweets rt
+        JOIN tweets t ON rt.tid = t.tid
+        JOIN users u ON rt.retweeter_id = u.usr
+        WHERE rt.rowid > ? AND rt.rowid <= ?
+          AND EXISTS (SELECT flwee FROM follows WHERE flwee = rt.retweeter_id AND flwer = ?)
+    """, (last_tid, new_mark[0], user_id, last_rowid, new_mark[1], user_id)).fetchall()
+    rows = [(tid, text, str(tdate), str(ttime), writer_id, name, status) for
+            tid, text, tdate, ttime, writer_id, name, status in order_feed(rows)]
+    return rows, new_mark
+
+
+def build_tweet_search_query(keywords, database=None, rowid_range=None, after=None):
+    """
+    Builds the query for a tweet search. Keywords starting with # are matched exactly against hashtag_mentions, every
+    other keyword is matched as a whole word in the text of the tweet with regexp_like. The results of both are OR'd.
+    Inputs:
+        keywords (list of str): the lowercased, validated search keywords.
+        database (str or None): the schema to search, such as one tier of a partitioned database.
+        rowid_range (tuple or None): (first, last) to only search the tweets with a rowid in that range.
+        after (tuple or None): a row of the results, to only get the ones after it (see search_position).
+    Returns:
+        tuple: (sql, parameters), or (None, None) if there is nothing to search for.
+    """
+    prefix = database + "." if database else ""
+    # each half of the search keeps to the range, so its OR'd conditions are put in brackets
+    range_condition = ''
+    range_parameters = []
+    if rowid_range is not None:
+        range_condition = ' AND T.rowid BETWEEN ? AND ? '
+        range_parameters = list(rowid_range)
+    # the halves only read up to the ts of the row to start after, the tweets of that second are cut by tid outside
+    after_condition = ''
+    after_parameters = []
+    if after is not None:
+        negated_ts, negated_tid = search_position(after)
+        range_condition += ' AND T.ts <= ? '
+        range_parameters.append(-negated_ts)
+        after_condition = ' WHERE ts < ? OR (ts = ? AND tid < ?)'
+        after_parameters = [-negated_ts, -negated_ts, -negated_tid]
+    hashtag_search_terms = [x for x in keywords if x.startswith('#')]
+
+    # this regex expression is specifically here to make sure that we can exactly match each word in text with a
+    # corresponding term in the search bar. First, the (?i) makes the search case insensitive. Next, the
+    # (?<=\s|^|\W) essentially looks what comes before our matched string, where we need to match a whitespace (\s),
+    # the start of a string (^), or not a word (\W), while after the matched string must be a whitespace, end of
+    # text ($), or a non-word
+    non_hashtag_search_terms = ['(?i)(?<=\\s|^|\\W)' + x + '(?=\\s|$|\\W)' for x in keywords if
+                                not x.startswith('#')]
+
+    non_hashtag_search_query = None
+    # If we have non-hashtag search terms, we will build a query string for it
+    if non_hashtag_search_terms:
+        search_condition_1 = ' OR '.join([' regexp_like(LOWER(T.text), ?) ' for e in non_hashtag_search_terms])
+        non_hashtag_search_query = f'''SELECT T.writer_id, T.tid, T.text, T.tdate, T.ttime, T.ts FROM {prefix}tweets T
+                           WHERE  (''' + search_condition_1 + ')' + range_condition
+    hashtag_search_query = None
+    # If we have hashtag search terms, then we will build a query string for it too
+    if hashtag_search_terms:
+        search_condition_2 = ' OR '.join(' LOWER(H.term) = ? ' for e in hashtag_search_terms)
+        hashtag_search_query = f'''SELECT  T.writer_id, T.tid, T.text, T.tdate, T.ttime, T.ts FROM {prefix}tweets T
+                    JOIN {prefix}hashtag_mentions H ON H.tid = T.tid
+                WHERE (''' + search_condition_2 + ')' + range_condition
+
+    # builds the query string to extract all the data from the database, the halves also select ts to be ordered by it
+    full_sql_query = None
+    parameters = None
+    if non_hashtag_search_query and hashtag_search_query:
+        full_sql_query = non_hashtag_search_query + ' UNION ' + hashtag_search_query
+        parameters = non_hashtag_search_terms + range_parameters + hashtag_search_terms + range_parameters
+    elif non_hashtag_search_query:
+        full_sql_query = non_hashtag_search_query
+        parameters = non_hashtag_search_terms + range_parameters
+    elif hashtag_search_query:
+        full_sql_query = hashtag_search_query
+        parameters = hashtag_search_terms + range_parameters
+    if full_sql_query is not None:
+        full_sql_query = ('SELECT writer_id, tid, text, tdate, ttime FROM (' + full_sql_query + ' )' + after_condition +
+                          ' ORDER BY ts DESC, tid DESC')
+        parameters = parameters + after_parameters
+    return full_sql_query, parameters
+
+
+def search_position(row):
+    """
+    Gets where a row of a tweet search goes in its order (ts DESC, the newer tweet id first on a tie), as a key that
+    grows down the results.
+    Inputs:
+        row (tuple): a (writer_id, tid, text, tdate, ttime) row.
+    Returns:
+        tuple: (-ts, -tid)
+    """
+    return -schema.timestamp_of_text(row[3], row[4]), -row[1]
+
+
+def order_newest_first(rows):
+    """
+    Sorts (writer_id, tid, text, tdate, ttime) rows like ORDER BY ts DESC, tid DESC does.
+    Inputs:
+        rows (list of tuple): the rows.
+    Returns:
+        list of tuple: the sorted rows.
+    """
+    return sorted(rows, key=search_position)
+
+
+def search_tweets(conn, keywords, limit=None, after=None):
+    """
+    Runs a tweet search, see build_tweet_search_query for the matching rules. On a partitioned database the tiers are
+    searched newest first until limit rows are found.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        keywords (list of str): the lowercased, validated search keywords.
+        limit (int or None): the most rows to return, all of them when None.
+        after (tuple or None): a row of the results, only the rows after it are returned.
+    Returns:
+        list of tuple: (writer_id, tid, text, tdate, ttime) rows, newest first.
+    """
+    if build_tweet_search_query(keywords)[0] is None:
+        return []
+    if any(not keyword.startswith('#') for keyword in keywords):
+        # the app opens the database without the regexp extension, the first search for a word loads it
+        db.ensure_regexp_extension(conn)
+
+    def run(database, tier_limit):
+        full_sql_query, parameters = build_tweet_search_query(keywords, database, after=after)
+        cursor = conn.cursor()
+        cursor.execute(full_sql_query + ' LIMIT ?', parameters + [tier_limit])
+        return cursor.fetchall()
+
+    return partitions.read_newest_first(conn, run, order_newest_first, lambda row: row[3], limit)
+
+
+def user_search_position(row):
+    """
+    Gets where a row of a user search goes in its order (LENGTH(name), name, usr), as a key that grows down the
+    results.
+    Inputs:
+        row (tuple): a (usr, name) row.
+    Returns:
+        tuple: (length of the name, name, usr)
+    """
+    return len(row[1]), row[1], row[0]
+
+
+def search_users(conn, keywords, limit=None, after=None):
+    """
+    Finds the users whose name contains any of the keywords, shortest names first.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        keywords (list of str): the lowercased search keywords, without any LIKE wildcards.
+        limit (int or None): the most rows to return, all of them when None.
+        after (tuple or None): a row of the results, only the rows after it are returned.
+    Returns:
+        list of tuple: (usr, name) rows.
+    """
+    patterns = ['%' + keyword + '%' for keyword in keywords]
+    if not patterns:
+        return []
+
+    # we use list comprehension to create a list of parameterized query conditional statements. The join makes a
+    # compact and easy way to both get the "OR" connective in between the keywords without getting them at the ends
+    search_condition = " OR ".join([" LOWER(name) LIKE ? " for keyword in patterns])
+
+    # the query first orders the user names by order of increasing length. Then if the lenghs are tied, we break the
+    # tie in lexicographic order by using name, and then lexicographically sort by the user id
+    parameters = list(patterns)
+    if after is not None:
+        search_condition = "(" + search_condition + ") AND (LENGTH(name), name, usr) > (?, ?, ?)"
+        parameters.extend(user_search_position(after))
+    query_for_sql = ("SELECT usr, name FROM users  WHERE " + search_condition + " ORDER BY LENGTH(name), name, usr"
+                     " LIMIT ?")
+    parameters.append(-1 if limit is None else limit)
+
+    cursor = conn.cursor()
+    cursor.execute(query_for_sql, parameters)
+    return cursor.fetchall()
+
+
+def get_user_names(conn, after_usr=-1):
+    """
+    Gets the names of the users, for the fuzzy user search.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        after_usr (int): only get the users with a higher id than this.
+    Returns:
+        list of tuple: (usr, name) rows, by id.
+    """
+    return conn.execute("SELECT usr, name FROM users WHERE usr > ? ORDER BY usr", (after_usr,)).fetchall()
+
+
+def get_tweet(conn, tweet_id):
+    """
+    Gets a single tweet.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        tweet_id (int): the id of the tweet.
+    Returns:
+        tuple or None: (text, tdate, ttime, writer_id), or None if the tweet does not exist.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT text, tdate, ttime, writer_id FROM tweets WHERE tid = ?
+    """, (tweet_id,))
+    return cursor.fetchone()
+
+
+def get_tweet_stats(conn, tweet_id, user_id):
+    """
+    Gets the counters shown on the tweet detail screen.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        tweet_id (int): the id of the tweet.
+        user_id (int): the id of the user looking at the tweet.
+    Returns:
+        tuple: (is_retweet, num_retweets, num_retweet_spams, num_replies), where is_retweet tells whether user_id
+        has retweeted the tweet.
+    """
+    cursor = conn.cursor()
+
+    # Determine if the tweet is a retweet
+    cursor.execute("""
+        SELECT COUNT(*) FROM retweets WHERE tid = ? AND retweeter_id = ?
+    """, (tweet_id, user_id))
+    is_retweet = cursor.fetchone()[0] > 0
+
+    # Get number of retweets
+    cursor.execute("SELECT COUNT(*) FROM retweets WHERE tid = ?", (tweet_id,))
+    num_retweets = cursor.fetchone()[0]
+
+    cursor.execute("SELECT COUNT(*) FROM retweets WHERE tid = ? AND spam=1", (tweet_id,))
+    num_retweet_spams = cursor.fetchone()[0]
+
+    # Get number of replies
+    cursor.execute("SELECT COUNT(*) FROM tweets WHERE replyto_tid = ?", (tweet_id,))
+    num_replies = cursor.fetchone()[0]
+    return is_retweet, num_retweets, num_retweet_spams, num_replies
+
+
+def get_profile_summary(conn, user_id):
+    """
+    Gets the name and the counters shown at the top of a user's profile.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user whose profile is being viewed.
+    Returns:
+        tuple or None: (name, num_posts, num_following, num_followers), where num_posts counts both tweets and
+        retweets, or None if there is no such user.
+    """
+    name = get_user_name(conn, user_id)
+    if name is None:
+        return None
+    cursor = conn.cursor()
+
+    # Get profile details with combined tweet and retweet count using UNION
+    cursor.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT tid FROM tweets WHERE writer_id = ?
+            UNION ALL
+            SELECT tid FROM retweets WHERE retweeter_id = ?
+        )
+    """, (user_id, user_id))
+    num_tweets = cursor.fetchone()[0]
+
+    # Get follower and following counts
+    cursor.execute("SELECT COUNT(*) FROM follows WHERE flwer = ?", (user_id,))
+    num_following = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM follows WHERE flwee = ?", (user_id,))
+    num_followers = cursor.fetchone()[0]
+    return name, num_tweets, num_following, num_followers
+
+
+def is_following(conn, follower_id, followee_id):
+    """
+    Checks whether one user follows another.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        follower_id (int): the id of the follower.
+        followee_id (int): the id of the user who may be followed.
+    Returns:
+        bool: True if the follow edge exists.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM follows WHERE flwer = ? AND flwee = ?", (follower_id, followee_id))
+    return cursor.fetchone() is not None
+
+
+def get_user_tweets(conn, user_id, limit=None):
+    """
+    Gets the tweets written by a user, newest first.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the writer.
+        limit (int or None): the most tweets to return, all of them when None.
+    Returns:
+        list of tuple: (writer_id, tid, text, tdate, ttime) rows.
+    """
+    def run(database, tier_limit):
+        # a negative LIMIT means no limit in SQLite
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT writer_id, tid, text, tdate, ttime FROM {database}.tweets
+            WHERE writer_id = ?
+            ORDER BY ts DESC, tid DESC
+            LIMIT ?
+        """, (user_id, tier_limit))
+        return cursor.fetchall()
+
+    return partitions.read_newest_first(conn, run, order_newest_first, lambda row: row[3], limit)
+
+
+def count_user_tweets(conn, user_id):
+    """
+    Counts the tweets written by a user, retweets are not included.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the writer.
+    Returns:
+        int: the number of tweets.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM tweets WHERE writer_id = ?", (user_id,))
+    return cursor.fetchone()[0]
+
+
+def get_follow_counts(conn, user_id):
+    """
+    Counts the users that a user follows and the users that follow them.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user.
+    Returns:
+        tuple: (num_following, num_followers)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM follows WHERE flwer = ?", (user_id,))
+    num_following = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM follows WHERE flwee = ?", (user_id,))
+    num_followers = cursor.fetchone()[0]
+    return num_following, num_followers
+
+
+def follower_position(row):
+    """
+    Gets where a follower goes in the order of list_followers (name, usr, a missing name first), as a key that grows
+    down the list.
+    Inputs:
+        row (tuple): a (usr, name) row.
+    Returns:
+        tuple: (whether there is a name, the name, usr)
+    """
+    return row[1] is not None, row[1] or "", row[0]
+
+
+def list_followers(conn, user_id, limit=None, after=None):
+    """
+    Gets the followers of a user, ordered by name.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the followed user.
+        limit (int or None): the most rows to return, all of them when None.
+        after (tuple or None): a row of the list, only the rows after it are returned.
+    Returns:
+        list of tuple: (usr, name) rows.
+    """
+    after_condition = ""
+    parameters = [user_id]
+    if after is not None:
+        after_condition = "AND (u.name IS NOT NULL, IFNULL(u.name, ''), u.usr) > (?, ?, ?)"
+        parameters.extend(follower_position(after))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT u.usr, u.name FROM users u
+        JOIN follows f ON u.usr = f.flwer
+        WHERE f.flwee = ? {after_condition}
+        ORDER BY u.name, u.usr
+        LIMIT ?
+    """, parameters + [-1 if limit is None else limit])
+    return cursor.fetchall()
+
+
+def extract_hashtags(text):
+    """
+    Pulls the hashtags out of the text of a tweet, following the rules of the compose screen: a lone '#' is not
+    allowed, and the same hashtag cannot appear twice (case insensitive).
+    Inputs:
+        text (str): the text of the tweet.
+    Raises:
+        InvalidHashtagException: If the text contains a standalone '#'.
+        DuplicateHashtagException: If the same hashtag appears more than once.
+    Returns:
+        set of str: the lowercased hashtags, including the leading '#'.
+    """
+    # uses regular expressions to find and extract all text that is within each hashtag
+    # the hashtag sign at the front matches with a hashtag in the text, the \w matches a character that is a part of
+    # the term, the + allows you to continue matching until you hit another pound or whitespace
+    hashtags = re.findall(r'#\w+', text)
+    # set allows us to get rid of all duplicates
+    unique_hashtags = set(map(str.lower, hashtags))  # Case-insensitive comparison
+
+    # Ensure no standalone '#' is present
+    if '#' in text.split():
+        raise InvalidHashtagException()
+    if len(hashtags) != len(unique_hashtags):
+        raise DuplicateHashtagException()
+    return unique_hashtags
+
+
+def post_tweet(conn, writer_id, text, hashtags, replyto_tid=None, new_tid=None):
+    """
+    Inserts a new tweet (or a reply, when replyto_tid is given) along with its hashtag mentions.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        writer_id (int): the id of the writer.
+        text (str): the text of the tweet.
+        hashtags (iterable of str): the hashtags of the tweet, see extract_hashtags.
+        replyto_tid (int or None): the id of the tweet that is being replied to.
+        new_tid (int or None): the id to give the tweet, picked from MAX(tid) when None.
+    Returns:
+        int: the id of the new tweet.
+    """
+    cursor = conn.cursor()
+    if new_tid is None:
+        # we want a unique tid for the tweets, so clearly we would do so by selecting a tid that is 1 more than the
+        # maximum
+        cursor.execute("SELECT MAX(tid) FROM tweets")
+        result = cursor.fetchone()
+        new_tid = int(result[0]) + 1 if result[0] else 1
+
+    # finds the current date and time
+    now = datetime.datetime.now().replace(microsecond=0)
+    tdate = now.strftime('%Y-%m-%d')
+    ttime = now.strftime('%H:%M:%S')
+
+    cursor.execute("""
+        INSERT INTO tweets (tid, writer_id, text, tdate, ttime, replyto_tid, ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (new_tid, writer_id, text, tdate, ttime, replyto_tid, schema.timestamp_of(now)))
+
+    # Insert each unique hashtag
+    for term in hashtags:
+        cursor.execute("""
+            INSERT INTO hashtag_mentions (tid, term)
+            VALUES (?, ?)
+        """, (new_tid, term.lower()))  # Ensure hashtags are stored in lowercase
+    trending.record(conn, hashtags, tdate, ttime)
+    return new_tid
+
+
+def get_hashtag_counts(conn, after_tid=-1):
+    """
+    Counts the mentions of every hashtag, for the hashtag suggestions.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        after_tid (int): only count the mentions of the tweets with a higher id than this.
+    Returns:
+        list of tuple: (term, mentions, highest tid) rows, the term lowercased.
+    """
+    # without MATERIALIZED the planner walks the whole LOWER(term) index to group, even for the few newest tweets
+    return conn.execute("""
+        WITH new_mentions AS MATERIALIZED (
+            SELECT term, tid FROM hashtag_mentions WHERE tid > ?
+        )
+        SELECT LOWER(term), COUNT(*), MAX(tid)
+        FROM new_mentions
+        GROUP BY LOWER(term)
+    """, (after_tid,)).fetchall()
+
+
+def get_trending_hashtags(conn, limit=10, now=None):
+    """
+    Gets the hashtags with the highest decayed number of mentions (see trending.py), in one read.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        limit (int): the number of hashtags.
+        now (datetime.datetime or None): the present, datetime.now() when None.
+    Returns:
+        list of tuple: (term, score, mentions this hour, mentions today) rows, the highest score first. Empty when
+        nothing has been recorded yet.
+    """
+    if not trending.tables_exist(conn):
+        return []
+    now = now or datetime.datetime.now()
+    this_hour, today = trending.buckets_of(now)
+    rows = conn.execute("""
+        SELECT T.term, T.weight, S.base_hour,
+               IFNULL((SELECT mentions FROM hashtag_buckets
+                       WHERE term = T.term AND granularity = 'hour' AND bucket = ?), 0),
+               IFNULL((SELECT mentions FROM hashtag_buckets
+                       WHERE term = T.term AND granularity = 'day' AND bucket = ?), 0)
+        FROM trending_terms T, trending_state S
+        ORDER BY T.weight DESC
+        LIMIT ?
+    """, (this_hour, today, limit)).fetchall()
+    return [(term, weight / trending.decay_factor(base_hour, now), hour_mentions, day_mentions) for
+            term, weight, base_hour, hour_mentions, day_mentions in rows]
+
+
+def retweet(conn, tweet_id, retweeter_id, writer_id, spam=0):
+    """
+    Records a retweet. A user can only retweet a tweet once, so a second retweet raises sqlite3.IntegrityError.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        tweet_id (int): the id of the tweet being retweeted.
+        retweeter_id (int): the id of the user retweeting.
+        writer_id (int): the id of the original writer of the tweet.
+        spam (int): 1 if the retweet is flagged as spam.
+    Returns:
+        None
+    """
+    now = datetime.datetime.now()
+    conn.execute(
+        """
+        INSERT INTO retweets (tid, retweeter_id, writer_id, spam, rdate, ts)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (tweet_id, retweeter_id, writer_id, spam, now.strftime('%Y-%m-%d'), schema.timestamp_of(now))
+    )
+
+
+def follow_user(conn, follower_id, followee_id):
+    """
+    Adds a follow edge starting today.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        follower_id (int): the id of the follower.
+        followee_id (int): the id of the user to follow.
+    Returns:
+        None
+    """
+    conn.execute("INSERT INTO follows (flwer, flwee, start_date) VALUES (?, ?, ?)",
+                 (follower_id, followee_id, datetime.date.today().strftime('%Y-%m-%d')))
+
+
+def unfollow_user(conn, follower_id, followee_id):
+    """
+    Removes a follow edge.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        follower_id (int): the id of the follower.
+        followee_id (int): the id of the user to unfollow.
+    Returns:
+        None
+    """
+    conn.execute("DELETE FROM follows WHERE flwer = ? AND flwee = ?", (follower_id, followee_id))
+
+
+def user_timeline(conn, user_id):
+    """
+    Gets everything a user has posted, their tweets and their retweets, newest first. The rows are not fetched, so the
+    caller can stream them.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        user_id (int): the id of the user.
+    Returns:
+        sqlite3.Cursor: (status, tid, writer_id, text, date, time, replyto_tid) rows, where status is 'tweeted' or
+        'retweeted', writer_id is the original writer and the date and time of a retweet are when it was retweeted.
+    """
+    return conn.execute("""
+        SELECT status, tid, writer_id, text, date, time, replyto_tid FROM
+        (SELECT 'tweeted' AS status, t.tid, t.writer_id, t.text, t.tdate AS date, t.ttime AS time, t.replyto_tid, t.ts
+        FROM tweets t
+        WHERE t.writer_id = ?
+
+        UNION ALL
+
+        SELECT 'retweeted' AS status, rt.tid, rt.writer_id, t.text, rt.rdate AS date, TIME(rt.ts, 'unixepoch') AS time,
+        t.replyto_tid, rt.ts
+        FROM retweets rt
+        JOIN tweets t ON rt.tid = t.tid
+        WHERE rt.retweeter_id = ?)
+        ORDER BY ts DESC, tid DESC
+    """, (user_id, user_id))
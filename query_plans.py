@@ -0,0 +1,418 @@
+# query_plans.py
+# Checks the query plans of every statement that the screens run, so that a change to the SQL that turns an indexed
+# lookup into a full scan shows up before anyone notices the app got slow. It:
+#   1. generates a large database (tens of thousands of users, hundreds of thousands of tweets) with the schema and
+#      indexes of schema.py, analysed like bulk_import.py leaves one,
+#   2. collects every statement that the queries send to SQLite while a session replays every kind of step of
+#      session_trace.py (screens, searches, list pages, feed checks and writes), with the query that sent it,
+#   3. runs EXPLAIN QUERY PLAN on each one and reports the full scans of the big tables and the temporary B-trees
+#      built to sort, which is where an index should have been used.
+# A few of those are what the query is meant to do (the word search reads every tweet through the regexp); they are
+# in ACCEPTED with the reason. Anything else fails: `python query_plans.py` exits with 1, and
+# tests/test_query_plans.py fails.
+#
+# Usage: python query_plans.py [--database plans.db] [--users 20000] [--tweets 200000] [--all]
+import argparse
+import datetime
+import itertools
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+
+import db
+import queries
+import schema
+import session_trace
+import trending
+
+# the tables that the generated database fills, a scan of any of them reads every row
+LARGE_TABLES = {"users", "follows", "tweets", "hashtag_mentions", "retweets"}
+
+# the problems that are what a query has to do: (query, problem, pattern, reason). A problem is "SCAN <table>" or
+# "TEMP B-TREE", and it is only accepted in the statements of the query that the pattern is found in.
+ACCEPTED = [
+    ("search_tweets", "SCAN tweets", r"regexp_like",
+     "a word is matched by the regexp against the text of every tweet"),
+    ("search_tweets", "TEMP B-TREE", r"ORDER BY ts DESC, tid DESC",
+     "the matches come from the hashtag index or the regexp, and are then sorted by time"),
+    ("get_user_tweets", "TEMP B-TREE", r"ORDER BY ts DESC, tid DESC",
+     "idx_tweets_writer_ts reads the tweets newest first, only the tweets posted in the same second are sorted by tid"),
+    ("load_feed", "TEMP B-TREE", r"UNION",
+     "the tweets and retweets of every followed user are read newest first from their own index, and merged"),
+    ("list_followers", "TEMP B-TREE", r"ORDER BY u\.name",
+     "the followers of a user come from idx_follows_flwee, and are then sorted by name"),
+    ("search_users", "SCAN users", r"LIKE",
+     "a keyword is matched anywhere in the name, which no index can find"),
+    ("search_users", "TEMP B-TREE", r"LENGTH",
+     "the matches are ordered by the length of the name"),
+]
+
+# the statements that the workload has to send, so that a change to the data or the steps cannot quietly leave one
+# unchecked: (query, pattern, what it is). A later page is the one with the cursor, "ts < ?" or a row value.
+EXPECTED = [
+    ("load_feed", r"^(?!.*ts < \?)", "the first page of the feed"),
+    ("load_feed", r"ts < \?", "a later page of the feed"),
+    ("search_tweets", r"^(?!.*regexp_like)(?!.*ts < \?).*H\.term", "the first page of a hashtag search"),
+    ("search_tweets", r"^(?!.*regexp_like).*H\.term.*ts < \?", "a later page of a hashtag search"),
+    ("search_tweets", r"^(?!.*H\.term)(?!.*ts < \?).*regexp_like\(LOWER", "the first page of a word search"),
+    ("search_tweets", r"^(?!.*H\.term).*regexp_like\(LOWER.*ts < \?", "a later page of a word search"),
+    ("search_tweets", r"regexp_like\(LOWER.*H\.term.*ts < \?", "a later page of a word and hashtag search"),
+    ("search_users", r"^(?!.*\) >)", "the first page of a user search"),
+    ("search_users", r"\) > \(", "a later page of a user search"),
+    ("list_followers", r"^(?!.*\) >)", "the first page of the followers"),
+    ("list_followers", r"\) > \(", "a later page of the followers"),
+]
+
+# statements that are not queries of the data
+SKIPPED = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA|ANALYZE|ATTACH|DETACH)\b", re.IGNORECASE)
+# the literals of a statement, so that the same statement with other values is only checked once
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# a table and the name it is given in the statement, "tweets t" or "tweets AS t"
+TABLE_ALIAS = re.compile(r"\b(\w+)\s+(?:AS\s+)?(\w+)\b", re.IGNORECASE)
+# the words that can come after a table name that are not its alias
+KEYWORDS = {"where", "on", "join", "left", "inner", "cross", "natural", "group", "order", "limit", "using", "union",
+            "except", "intersect", "set", "values", "indexed", "not", "as", "and", "or", "window", "having"}
+
+WORDS = ["coffee", "rain", "music", "game", "exam", "project", "weekend", "travel", "movie", "code", "pizza", "snow",
+         "library", "concert", "garden", "bike", "lecture", "deadline", "river", "sunset"]
+
+
+def generate_database(path, users=20000, tweets=200000, seed=0):
+    """
+    Creates a database with the schema of the app and random users, follows, tweets, hashtags and retweets. A few
+    users are followed by many and write much of what is posted, like on the real thing.
+    Inputs:
+        path (str): the file to create, it must not exist.
+        users (int): the number of users.
+        tweets (int): the number of tweets.
+        seed (int): seeds the random choices.
+    Raises:
+        FileExistsError: If path exists.
+    Returns:
+        None
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        schema.create_schema(conn)
+        schema.drop_secondary_indexes(conn)
+        # popularity falls off with the rank, the first users are followed and written by the most
+        weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(users)))
+        ids = list(range(1, users + 1))
+        conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+                         ((usr, f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {usr}",
+                           f"user{usr}@example.com", 5550000000 + usr, f"pwd{usr}") for usr in ids))
+        follows = set()
+        for usr in ids:
+            for followee in rng.choices(ids, cum_weights=weights, k=rng.randint(1, 20)):
+                if followee != usr:
+                    follows.add((usr, followee))
+        conn.executemany("INSERT INTO follows VALUES (?, ?, '2024-01-01')", sorted(follows))
+
+        # a year of tweets up to now, so that the last days are trending
+        now = datetime.datetime.now().replace(microsecond=0)
+        span = 365 * 24 * 3600
+        start = now - datetime.timedelta(seconds=span)
+        moments = sorted(rng.randrange(span) for i in range(tweets))
+        writers = rng.choices(ids, cum_weights=weights, k=tweets)
+        tweet_rows, mention_rows = [], []
+        for tid, (offset, writer) in enumerate(zip(moments, writers), start=1):
+            moment = start + datetime.timedelta(seconds=offset)
+            words = rng.sample(WORDS, 4)
+            terms = rng.sample(WORDS, rng.choice((0, 0, 1, 2)))
+            text = " ".join(words + [f"#{term}" for term in terms])
+            replyto = rng.randint(1, tid - 1) if tid > 1 and rng.random() < 0.1 else None
+            tweet_rows.append((tid, writer, text, moment.strftime("%Y-%m-%d"), moment.strftime("%H:%M:%S"), replyto,
+                               schema.timestamp_of(moment)))
+            mention_rows.extend((tid, f"#{term}") for term in terms)
+        conn.executemany("INSERT INTO tweets VALUES (?, ?, ?, ?, ?, ?, ?)", tweet_rows)
+        conn.executemany("INSERT INTO hashtag_mentions VALUES (?, ?)", mention_rows)
+
+        retweets = {}
+        for i in range(tweets // 4):
+            tid = rng.randint(1, tweets)
+            retweeter = rng.choice(ids)
+            writer, date = tweet_rows[tid - 1][1], tweet_rows[tid - 1][3]
+            ts = schema.timestamp_of_text(date, "00:00:00")
+            retweets[(tid, retweeter)] = (tid, retweeter, writer, int(rng.random() < 0.05), date, ts)
+        conn.executemany("INSERT INTO retweets VALUES (?, ?, ?, ?, ?, ?)", retweets.values())
+        schema.create_secondary_indexes(conn)
+        trending.rebuild(conn, now)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class StatementCollector:
+    """
+    Stands in for the queries and keeps every statement that they send to SQLite, with the name of the query that
+    sent it. Statements that only differ in their values are kept once.
+    """
+
+    def __init__(self, conn, base=queries):
+        """
+        Starts listening to the statements of a connection.
+        Inputs:
+            conn (sqlite3.Connection): the connection the queries are run on.
+            base (module): the queries.
+        Returns:
+            None
+        """
+        self.base = base
+        self.current = None
+        # (query, statement without its values) -> the statement as it was run
+        self.statements = {}
+        conn.set_trace_callback(self.traced)
+
+    def traced(self, sql):
+        if self.current is None or SKIPPED.match(sql):
+            return
+        self.statements.setdefault((self.current, LITERALS.sub("?", " ".join(sql.split()))), sql)
+
+    def __getattr__(self, name):
+        value = getattr(self.base, name)
+        if not callable(value):
+            return value
+
+        def collected(*args, **kwargs):
+            # a query that calls another one is where the statements come from
+            outer, self.current = self.current, self.current or name
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self.current = outer
+        return collected
+
+
+def workload(conn):
+    """
+    Makes a session that takes every kind of step of session_trace.py, on the users and tweets of a database.
+    Inputs:
+        conn (sqlite3.Connection): the database.
+    Returns:
+        list of dict: the steps.
+    """
+    # the most followed user, and a user who follows many, which is where a bad plan costs the most
+    popular = conn.execute("SELECT flwee FROM follows GROUP BY flwee ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    user = conn.execute("SELECT flwer FROM follows GROUP BY flwer ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    tweet = conn.execute("SELECT tid FROM tweets WHERE writer_id = ? ORDER BY ts DESC LIMIT 1",
+                         (popular,)).fetchone()[0]
+    term = conn.execute("SELECT term FROM hashtag_mentions LIMIT 1").fetchone()[0]
+    word = conn.execute("SELECT text FROM tweets LIMIT 1").fetchone()[0].split()[0]
+    name = conn.execute("SELECT name FROM users WHERE usr = ?", (popular,)).fetchone()[0].split()[0].lower()
+
+    def step(screen, target=None, user_id=user, **fields):
+        return dict(screen=screen, user_id=user_id, target=target, **fields)
+
+    return [
+        step("login", user_id=None), step("signup", user_id=None), step("create_user", user_id=None),
+        step("main_menu"), step("feed"), step("load_more", list="feed"), step("load_more", list="feed"), step("poll"),
+        step("tweet_detail", tweet), step("reply_tweet", tweet),
+        step("post", tweet, text=f"a reply {term}", hashtags=[term]), step("retweet", tweet),
+        step("user_profile", popular), step("user_tweets", popular), step("unfollow", popular), step("follow", popular),
+        step("search_tweets"), step("tweet_search", keywords=[term]), step("load_more", list="tweets"),
+        step("tweet_search", keywords=[word]), step("load_more", list="tweets"),
+        step("tweet_search", keywords=[term, word]), step("load_more", list="tweets"),
+        step("search_users"), step("user_search", keywords=[name]), step("load_more", list="users"),
+        step("user_search", keywords=[name], fuzzy=True),
+        step("list_followers", user_id=popular), step("load_more", list="followers", user_id=popular),
+        step("trending"), step("compose_tweet"),
+        step("post", text=f"new {term} and #fresh", hashtags=[term, "#fresh"]),
+        step("main_menu"),
+    ]
+
+
+def regexp_like(text, pattern):
+    """
+    Stands in for the regexp_like of the regexp extension on connections that cannot load it, such as those of a
+    Python built without extension loading. The plans do not depend on it. Python cannot look behind for "^", so the
+    lookbehind that queries.search_tweets starts a word with is rewritten.
+    Inputs:
+        text (str or None): the text of a tweet.
+        pattern (str): the regular expression.
+    Returns:
+        bool: True if the pattern matches somewhere in the text.
+    """
+    pattern = pattern.replace("(?<=\\s|^|\\W)", "(?:^|(?<=\\W))")
+    return text is not None and re.search(pattern, text) is not None
+
+
+def collect_statements(conn):
+    """
+    Runs the workload on a database, without keeping what it writes, and collects the statements of the queries.
+    Inputs:
+        conn (sqlite3.Connection): the database.
+    Returns:
+        dict: (query, statement without its values) -> the statement as it was run.
+    """
+    if not db.ensure_regexp_extension(conn):
+        conn.create_function("regexp_like", 2, regexp_like, deterministic=True)
+    collector = StatementCollector(conn)
+    trace = workload(conn)
+    try:
+        session_trace.replay_trace(conn, collector, trace)
+        # what the app asks for outside of the steps: the login, and the hashtag suggestions
+        user_id = trace[3]["user_id"]
+        password = conn.execute("SELECT pwd FROM users WHERE usr = ?", (user_id,)).fetchone()[0]
+        collector.authenticate(conn, user_id, password)
+        collector.get_hashtag_counts(conn, -1)
+        collector.get_hashtag_counts(conn, 1000)
+    finally:
+        conn.set_trace_callback(None)
+        conn.rollback()
+    return collector.statements
+
+
+def explain(conn, sql):
+    """
+    Gets the plan of a statement.
+    Inputs:
+        conn (sqlite3.Connection): the database.
+        sql (str): the statement, with its values in it.
+    Returns:
+        list of str: the lines of the plan, in order.
+    """
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def table_names(sql):
+    """
+    Finds which table every name in a statement stands for.
+    Inputs:
+        sql (str): the statement.
+    Returns:
+        dict: name -> table, for the tables themselves and their aliases.
+    """
+    names = {table: table for table in LARGE_TABLES}
+    for table, alias in TABLE_ALIAS.findall(sql):
+        if table.lower() in LARGE_TABLES and alias.lower() not in KEYWORDS:
+            names[alias] = table.lower()
+    return names
+
+
+def plan_problems(sql, plan):
+    """
+    Finds the lines of a plan that read a large table in full or sort in a temporary B-tree.
+    Inputs:
+        sql (str): the statement.
+        plan (list of str): its plan, see explain.
+    Returns:
+        list of tuple: (problem, line of the plan), where problem is "SCAN <table>" or "TEMP B-TREE".
+    """
+    names = table_names(sql)
+    problems = []
+    for line in plan:
+        words = line.split()
+        if words[:1] == ["SCAN"] and len(words) > 1 and words[1] in names:
+            problems.append((f"SCAN {names[words[1]]}", line))
+        elif line.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in line:
+            problems.append(("TEMP B-TREE", line))
+    return problems
+
+
+def missing_statements(statements):
+    """
+    Finds the statements in EXPECTED that the workload did not send.
+    Inputs:
+        statements (dict): see collect_statements.
+    Returns:
+        list of str: what each missing statement is.
+    """
+    shapes = [(query, " ".join(shape.split())) for query, shape in statements]
+    return [what for expected_query, pattern, what in EXPECTED
+            if not any(query == expected_query and re.search(pattern, shape) for query, shape in shapes)]
+
+
+def check_plans(conn, statements):
+    """
+    Checks the plan of every statement.
+    Inputs:
+        conn (sqlite3.Connection): the database.
+        statements (dict): see collect_statements.
+    Returns:
+        list of tuple: (query, problem, line of the plan, statement, reason it is accepted or None), for every problem.
+    """
+    found = []
+    for (query, shape), sql in sorted(statements.items()):
+        for problem, line in plan_problems(sql, explain(conn, sql)):
+            found.append((query, problem, line, sql, accepted_reason(query, problem, sql)))
+    return found
+
+
+def accepted_reason(query, problem, sql):
+    """
+    Tells why a problem of a plan is accepted.
+    Inputs:
+        query (str): the query that sent the statement.
+        problem (str): the problem, see plan_problems.
+        sql (str): the statement.
+    Returns:
+        str or None: the reason from ACCEPTED, None when the problem is not accepted.
+    """
+    for accepted_query, accepted_problem, pattern, reason in ACCEPTED:
+        if accepted_query == query and accepted_problem == problem and re.search(pattern, sql, re.IGNORECASE):
+            return reason
+    return None
+
+
+def main(argv=None):
+    """
+    Generates a database (or uses one), collects the statements of the queries and prints the problems of their plans.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code, 1 when a plan has a problem that is not accepted or a statement of EXPECTED was not sent.
+    """
+    parser = argparse.ArgumentParser(description="Check the query plans of every statement that the screens run.")
+    parser.add_argument("--database", help="use this database, it is generated first when it does not exist")
+    parser.add_argument("--users", type=int, default=20000, help="users of a generated database (default 20000)")
+    parser.add_argument("--tweets", type=int, default=200000, help="tweets of a generated database (default 200000)")
+    parser.add_argument("--all", action="store_true", help="also print every statement with its plan")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.database or os.path.join(directory, "plans.db")
+        try:
+            if not os.path.exists(path):
+                print(f"Generating {args.users} users and {args.tweets} tweets in {path}")
+                generate_database(path, args.users, args.tweets)
+            conn = db.open_db(path, load_extension=False)
+            try:
+                statements = collect_statements(conn)
+                if args.all:
+                    for (query, shape), sql in sorted(statements.items()):
+                        print(f"{query}: {sql}")
+                        for line in explain(conn, sql):
+                            print(f"    {line}")
+                found = check_plans(conn, statements)
+                missing = missing_statements(statements)
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+
+    failed = [item for item in found if item[4] is None]
+    for query, problem, line, sql, reason in found:
+        status = f"accepted, {reason}" if reason else "FAILED"
+        print(f"{query}: {line} ({status})")
+        if not reason:
+            print(f"    {' '.join(sql.split())}")
+    for what in missing:
+        print(f"NOT CHECKED: {what}, the workload did not run it")
+    print(f"{len(statements)} statements of {len({query for query, shape in statements})} queries checked, "
+          f"{len(failed)} problems")
+    return 1 if failed or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
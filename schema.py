@@ -0,0 +1,238 @@
+# schema.py
+# The tables of the application (the same statements that prj-sample.db was created with) and the secondary indexes
+# that the screens' queries rely on. The indexes are kept apart from the tables so that bulk loads can drop them,
+# load, and build them once at the end.
+#
+# Tweets and retweets also have a ts column, the moment they were posted as whole seconds since 1970-01-01 (of the same
+# wall clock that tdate and ttime are written in), so that the timelines can be ordered by one indexed integer. Older
+# databases get the column added and filled in when they are opened for writing (see add_timestamps). Retweets used to
+# only have a date, so the ts of an old retweet is the midnight that starts it.
+import calendar
+
+TABLES = [
+    ("users", """CREATE TABLE IF NOT EXISTS users (
+    usr         int PRIMARY KEY,
+    name        text,
+    email       text,
+    phone       int,
+    pwd         text
+)"""),
+    ("follows", """CREATE TABLE IF NOT EXISTS follows (
+    flwer       int,
+    flwee       int,
+    start_date  date,
+    PRIMARY KEY (flwer, flwee),
+    FOREIGN KEY (flwer) REFERENCES users(usr) ON DELETE CASCADE,
+    FOREIGN KEY (flwee) REFERENCES users(usr) ON DELETE CASCADE
+)"""),
+    ("tweets", """CREATE TABLE IF NOT EXISTS tweets (
+    tid         int,
+    writer_id   int,
+    text        text,
+    tdate       date,
+    ttime       time,
+    replyto_tid int,
+    ts          int,
+    PRIMARY KEY (tid),
+    FOREIGN KEY (writer_id) REFERENCES users(usr) ON DELETE CASCADE,
+    FOREIGN KEY (replyto_tid) REFERENCES tweets(tid) ON DELETE CASCADE
+)"""),
+    ("hashtag_mentions", """CREATE TABLE IF NOT EXISTS hashtag_mentions (
+    tid         int,
+    term        text,
+    PRIMARY KEY (tid, term),
+    FOREIGN KEY (tid) REFERENCES tweets(tid) ON DELETE CASCADE
+)"""),
+    ("retweets", """CREATE TABLE IF NOT EXISTS retweets (
+    tid           int,
+    retweeter_id  int,
+    writer_id     int,
+    spam          int,
+    rdate         date,
+    ts            int,
+    PRIMARY KEY (tid, retweeter_id),
+    FOREIGN KEY (tid) REFERENCES tweets(tid) ON DELETE CASCADE,
+    FOREIGN KEY (retweeter_id) REFERENCES users(usr) ON DELETE CASCADE,
+    FOREIGN KEY (writer_id) REFERENCES users(usr) ON DELETE CASCADE
+)"""),
+    ("lists", """CREATE TABLE IF NOT EXISTS lists (
+    owner_id    int,
+    lname       text,
+    PRIMARY KEY (owner_id, lname),
+    FOREIGN KEY (owner_id) REFERENCES users(usr) ON DELETE CASCADE
+)"""),
+    ("include", """CREATE TABLE IF NOT EXISTS include (
+    owner_id    int,
+    lname       text,
+    tid         int,
+    PRIMARY KEY (owner_id, lname, tid),
+    FOREIGN KEY (owner_id, lname) REFERENCES lists(owner_id, lname) ON DELETE CASCADE,
+    FOREIGN KEY (tid) REFERENCES tweets(tid) ON DELETE CASCADE
+)"""),
+]
+
+# the table names, in an order where every table comes after the tables that its foreign keys point to
+TABLE_ORDER = [name for name, sql in TABLES]
+
+# how the ts of the rows that were written before the column existed is worked out
+TIMESTAMP_SOURCES = {
+    "tweets": "CAST(strftime('%s', tdate || ' ' || ttime) AS INTEGER)",
+    "retweets": "CAST(strftime('%s', rdate) AS INTEGER)",
+}
+
+SECONDARY_INDEXES = [
+    # a user's own tweets (profile, feed), newest first, and the replies of a tweet (tweet details)
+    ("idx_tweets_writer_ts", "CREATE INDEX IF NOT EXISTS idx_tweets_writer_ts ON tweets (writer_id, ts)"),
+    ("idx_tweets_replyto", "CREATE INDEX IF NOT EXISTS idx_tweets_replyto ON tweets (replyto_tid)"),
+    # a user's retweets (profile, feed), newest first
+    ("idx_retweets_retweeter_ts",
+     "CREATE INDEX IF NOT EXISTS idx_retweets_retweeter_ts ON retweets (retweeter_id, ts)"),
+    # the followers of a user, the primary key already covers the users that someone follows
+    ("idx_follows_flwee", "CREATE INDEX IF NOT EXISTS idx_follows_flwee ON follows (flwee)"),
+    # the tweet search compares LOWER(term), so the index has to be on the same expression
+    ("idx_hashtag_mentions_term",
+     "CREATE INDEX IF NOT EXISTS idx_hashtag_mentions_term ON hashtag_mentions (LOWER(term))"),
+]
+
+# the indexes on ts, and the indexes on tdate and rdate that they replaced
+TIMESTAMP_INDEXES = ["idx_tweets_writer_ts", "idx_retweets_retweeter_ts"]
+REPLACED_INDEXES = ["idx_tweets_writer", "idx_retweets_retweeter"]
+
+
+def timestamp_of(moment):
+    """
+    Gets the ts of a moment, the same number that TIMESTAMP_SOURCES works out from its date and time.
+    Inputs:
+        moment (datetime.datetime): the moment, without a time zone.
+    Returns:
+        int: the ts.
+    """
+    return calendar.timegm(moment.timetuple())
+
+
+def timestamp_of_text(date, time):
+    """
+    Gets the ts of a date and a time as the rows of the queries hold them, the same number that TIMESTAMP_SOURCES
+    works out in SQL.
+    Inputs:
+        date (str or datetime.date): "YYYY-MM-DD".
+        time (str or datetime.time): "HH:MM:SS".
+    Returns:
+        int: the ts.
+    """
+    date, time = str(date), str(time)
+    return calendar.timegm((int(date[:4]), int(date[5:7]), int(date[8:10]),
+                            int(time[:2]), int(time[3:5]), int(time[6:8])))
+
+
+def create_schema(conn):
+    """
+    Creates every table and secondary index that does not exist yet.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        None
+    """
+    for name, sql in TABLES:
+        conn.execute(sql)
+    add_timestamps(conn)
+    create_secondary_indexes(conn)
+    conn.commit()
+
+
+def add_timestamps(conn, database="main"):
+    """
+    Adds the ts column to the tweets and retweets of a database that was created before it existed, fills it in for
+    every row and replaces the indexes on tdate and rdate with the indexes on ts. Tables that already have the column,
+    or do not exist, are left alone.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        database (str): the schema name of the database.
+    Returns:
+        bool: True if a column was added, the caller commits.
+    """
+    added = False
+    for table in TIMESTAMP_SOURCES:
+        columns = table_columns(conn, table, database)
+        if columns and "ts" not in columns:
+            conn.execute(f"ALTER TABLE {database}.{table} ADD COLUMN ts int")
+            added = True
+    if added:
+        fill_timestamps(conn, database)
+        for name in REPLACED_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {database}.{name}")
+        for name, sql in SECONDARY_INDEXES:
+            if name in TIMESTAMP_INDEXES:
+                conn.execute(sql.replace("EXISTS ", f"EXISTS {database}.", 1))
+    return added
+
+
+def missing_timestamps(conn, database="main"):
+    """
+    Checks whether a database was created before the ts column existed, so that add_timestamps has work to do.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        database (str): the schema name of the database.
+    Returns:
+        bool: True if the tweets or the retweets have no ts column.
+    """
+    for table in TIMESTAMP_SOURCES:
+        columns = table_columns(conn, table, database)
+        if columns and "ts" not in columns:
+            return True
+    return False
+
+
+def fill_timestamps(conn, database="main"):
+    """
+    Works out the ts of the tweets and retweets that do not have one, such as rows loaded from a file without it.
+    Tables without the column are left alone.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        database (str): the schema name of the database.
+    Returns:
+        int: the number of rows filled in.
+    """
+    before = conn.total_changes
+    for table, source in TIMESTAMP_SOURCES.items():
+        if "ts" in table_columns(conn, table, database):
+            conn.execute(f"UPDATE {database}.{table} SET ts = {source} WHERE ts IS NULL")
+    return conn.total_changes - before
+
+
+def drop_secondary_indexes(conn):
+    """
+    Drops the secondary indexes, so that a bulk load does not have to keep them up to date row by row.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        None
+    """
+    for name, sql in SECONDARY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def create_secondary_indexes(conn):
+    """
+    Builds every secondary index that does not exist yet.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        None
+    """
+    for name, sql in SECONDARY_INDEXES:
+        conn.execute(sql)
+
+
+def table_columns(conn, table, database=None):
+    """
+    Gets the column names of a table, in the order they were declared.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        table (str): the name of the table.
+        database (str or None): the schema name of the database, the first one that has the table when None.
+    Returns:
+        list of str: the column names, empty if the table does not exist.
+    """
+    prefix = f"{database}." if database else ""
+    return [row[1] for row in conn.execute(f'PRAGMA {prefix}table_info("{table}")')]
@@ -2,11 +2,12 @@
 
 import tkinter as tk
 from tkinter import messagebox
-import re
-import datetime
 import sqlite3  # Ensure sqlite3 is imported
 
 from .screen import Screen
+from .hashtag_suggestions import HashtagSuggestions
+import queries
+from exceptions import InvalidHashtagException, DuplicateHashtagException
 
 class ComposeTweetScreen(Screen):
     """
@@ -46,6 +47,7 @@ class ComposeTweetScreen(Screen):
         # creates a text field that allows users to input their tweet
         self.tweet_entry = tk.Text(self.app.root, height=5, width=40)
         self.tweet_entry.pack(pady=10)
+        HashtagSuggestions(self.app, self.tweet_entry)
 
         # gives the user navigation and posting buttons
         tk.Button(self.app.root, text="Post Tweet", command=self.submit_tweet).pack(pady=5)
@@ -67,51 +69,20 @@ class ComposeTweetScreen(Screen):
             messagebox.showwarning("Warning", "Tweet cannot be empty")
             return
 
-        # Extract hashtags with the # symbol included
-        # uses regular expressions to find and extract all text that is within each hashtag
-        # the hashtag sign at the front matches with a hashtag in the text, the \w matches a character that is a part of
-        # the term, the + allows you to continue matching until you hit another pound or whitespace
-        hashtags = re.findall(r'#\w+', text)
-        # set allows us to get rid of all duplicates
-        unique_hashtags = set(map(str.lower, hashtags))  # Case-insensitive comparison
-        # Ensure no standalone '#' is present
-
-        if '#' in text.split():
-            messagebox.showerror("Invalid Hashtag", "Hashtags cannot be a single '#' character. Please enter a valid hashtag (e.g. #example)")
+        # Extract hashtags with the # symbol included, a lone '#' and repeated hashtags are rejected
+        try:
+            hashtags = queries.extract_hashtags(text)
+        except InvalidHashtagException as e:
+            messagebox.showerror("Invalid Hashtag", e.message)
             return
-            
-        if len(hashtags) != len(unique_hashtags):
-            messagebox.showerror("Duplicate Hashtags", "You cannot enter the same hashtag multiple times.")
+        except DuplicateHashtagException as e:
+            messagebox.showerror("Duplicate Hashtags", e.message)
             return
 
-        # Proceed if no duplicates
-        hashtags = unique_hashtags  # Use the unique set for database insertion
-
-        cursor = self.app.conn.cursor()
         try:
-            # we want a unique tid for the tweets, so clearly we would do so by selecting a tid that is 1 more than the
-            # maximum
-            cursor.execute("SELECT MAX(tid) FROM tweets")
-            result = cursor.fetchone()
-            new_tid = int(result[0]) + 1 if result[0] else 1
-
-            # finds the current date and time
-            tdate = datetime.date.today().strftime('%Y-%m-%d')
-            ttime = datetime.datetime.now().strftime('%H:%M:%S')
-
-            cursor.execute("""
-                INSERT INTO tweets (tid, writer_id, text, tdate, ttime) 
-                VALUES (?, ?, ?, ?, ?)
-            """, (new_tid, self.user_id, text, tdate, ttime))
-
-            # Insert each unique hashtag
-            for term in hashtags:
-                cursor.execute("""
-                    INSERT INTO hashtag_mentions (tid, term) 
-                    VALUES (?, ?)
-                """, (new_tid, term.lower()))  # Ensure hashtags are stored in lowercase
-
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.post_tweet, self.user_id, text, hashtags)
+            if hashtags:
+                self.app.hashtag_completer.refresh()
             messagebox.showinfo("Tweet Posted", "Your tweet has been posted successfully.")
             self.app.back()
         except sqlite3.IntegrityError as e:
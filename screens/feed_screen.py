@@ -1,7 +1,40 @@
 # screens/feed_screen.py
 import tkinter as tk
 from tkinter import messagebox
+from compact_rows import CompactRows, FEED_ROW
+from paging import KeysetPager
+import trace_hooks
+from ui_latency import timed_action
 from .screen import Screen
+from .virtual_list import VirtualList
+
+# how often the feed checks for new tweets, in milliseconds
+POLL_MILLISECONDS = 10000
+
+
+def feed_key(item):
+    """
+    Gets what identifies a feed item, a retweet has the id of the tweet it retweets.
+    Inputs:
+        item (tuple): a row of queries.load_feed.
+    Returns:
+        tuple: (tid, writer_id, status)
+    """
+    return item[0], item[4], item[6]
+
+
+def describe_feed_item(item):
+    """
+    Gets the line that the feed shows for an item.
+    Inputs:
+        item (tuple): a row of queries.load_feed.
+    Returns:
+        str: the line.
+    """
+    tid, text, tdate, ttime, user_id, user_name, status = item
+    if status == 'tweeted':
+        return f"{user_name} {tid} (Date: {tdate} {ttime}) {status}: {text}"
+    return f"{user_name} {tid} (Date: {tdate}) {status}: {text}"
 
 
 class FeedScreen(Screen):
@@ -22,6 +55,7 @@ class FeedScreen(Screen):
         """
         self.app = app
         self.user_id = int(user_id)
+        self.poll_id = None
         self.build_user_interface()
 
     def build_user_interface(self):
@@ -37,26 +71,29 @@ class FeedScreen(Screen):
             None
         """
         self.app.clear_screen()
+        # a rebuilt screen starts its own polling
+        if self.poll_id is not None:
+            self.app.root.after_cancel(self.poll_id)
+            self.poll_id = None
 
-        self.current_screen_index = 0
-        self.feed_items = []
+        self.feed_list = None
+        # the keys of the items that the polls found, a page read later leaves them out as they are shown already
+        self.new_keys = set()
+        # the items that were posted after the feed was loaded and have not been shown yet
+        self.new_items = CompactRows(FEED_ROW)
 
         # Build the feed interface
         tk.Label(self.app.root, text="Your Feed", font=("Arial", 18)).pack(pady=10)
 
+        # the banner is only shown when there are new items, clicking it puts them on top of the feed
+        self.banner_frame = tk.Frame(self.app.root)
+        self.banner_frame.pack()
+        self.new_items_button = tk.Button(self.banner_frame, command=self.show_new_feed_items)
+
         # creates a feed frame, a collection of GUI elements on the screen that allows us to view the elements of the
-        # feed (by grouping together on a frame, it makes it easier to scroll through the feed elements too)
+        # feed, it holds a list that scrolls through the whole feed and reads it a page at a time
         self.feed_frame = tk.Frame(self.app.root)
-        self.feed_frame.pack(pady=5)
-
-        # creates a frame that allows us to navigate the feed items
-        self.nav_frame = tk.Frame(self.app.root)
-        self.nav_frame.pack(pady=5)
-
-        self.prev_button = tk.Button(self.nav_frame, text="Previous", command=self.show_prev_feed_items)
-        self.prev_button.pack(side=tk.LEFT)
-        self.more_button = tk.Button(self.nav_frame, text="More", command=self.show_more_feed_items)
-        self.more_button.pack(side=tk.LEFT)
+        self.feed_frame.pack(pady=5, fill=tk.BOTH, expand=True)
 
         # Buttons to navigate to main menu or logout
         tk.Button(self.app.root, text="Back to Main Menu", command=lambda: self.app.back()).pack(pady=5)
@@ -72,126 +109,79 @@ class FeedScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
-
         # Get the list of users the current user is following
-        cursor.execute("""
-            SELECT flwee FROM follows WHERE flwer = ?
-        """, (self.user_id,))
-        followed_users = [row[0] for row in cursor.fetchall()]
+        followed_users = self.app.queries.get_followed_users(self.app.conn, self.user_id)
 
         if not followed_users:
             tk.Label(self.feed_frame, text="You are not following any users yet.", font=("Arial", 14)).pack(pady=10)
             tk.Button(self.feed_frame, text="Search Users to Follow",
                       command=lambda: self.app.show_search_users_screen(self.user_id)).pack(pady=5)
-            # when the web page is being loaded for the first time, we must remember to disable the buttons
-            self.prev_button.config(state=tk.DISABLED)
-            self.more_button.config(state=tk.DISABLED)
             return
 
-        # Fetch tweets from followed users
-        cursor.execute("""
-            SELECT tid, text, tdate, ttime, writer_id, name, status FROM
-            (SELECT t.tid, t.text, t.tdate, t.ttime, t.writer_id, u.name, 'tweeted' AS status
-            FROM tweets t
-            JOIN users u ON t.writer_id = u.usr
-            WHERE EXISTS (SELECT flwee FROM follows WHERE  flwee=t.writer_id AND flwer = ?)
-            
-            UNION
-            
-            SELECT rt.tid, t.text, rt.rdate AS tdate, TIME('00:00:00') AS ttime, rt.retweeter_id AS writer_id, u.name,  'retweeted' AS status
-            FROM retweets rt
-            JOIN tweets t ON rt.tid = t.tid
-            JOIN users u ON rt.retweeter_id = u.usr
-            WHERE EXISTS (SELECT flwee FROM follows WHERE flwee=rt.retweeter_id AND flwer = ?)
-            )
-            ORDER BY tdate DESC, ttime desc, tid
-        """, (self.user_id, self.user_id))
-        self.feed_items = [(tid, text, str(tdate), str(ttime), writer_id, name, status) for
-                  tid, text, tdate, ttime, writer_id, name, status in cursor.fetchall()]
-
-        # does the initial loading of the feed items
-        self.show_feed_items()
-
-        self.update_button_state()
-
-    def show_feed_items(self):
-        """
-        This function is solely responsible for displaying all the items that are queried and staged to display in the
-        feed_items list
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        # Clear previous feed items
-        for widget in self.feed_frame.winfo_children():
-            widget.destroy()
-
-        self.start_index = 5 * self.current_screen_index
-
-        # Display the next batch of feed items
-        self.end_index = min(self.start_index + 5, len(self.feed_items))
-
-        # loops through all feed items that need to be displayed
-        for i in range(self.start_index, self.end_index):
+        # anything above the mark is new, it is taken first so that a tweet posted meanwhile shows up twice rather
+        # than never, and the duplicate is dropped by its key
+        self.mark = self.app.queries.get_feed_mark(self.app.conn)
 
-            # extracts all the information from each item tuple
-            item = self.feed_items[i]
-            tid, text, tdate, ttime, user_id, user_name, status = item
-            if status == 'tweeted':
-                display_text = f"{user_name} {tid} (Date: {tdate} {ttime}) {status}: {text}"
-            else:
-                display_text = f"{user_name} {tid} (Date: {tdate}) {status}: {text}"
+        # the list reads the first page of the feed, and the next ones as it is scrolled down. Only the newest part of
+        # the feed is read, which on a partitioned database means only the newest tiers
+        pager = KeysetPager(self.fetch_feed_items, FEED_ROW, keep=lambda item: feed_key(item) not in self.new_keys)
+        self.feed_list = VirtualList(self.feed_frame, pager, describe_feed_item,
+                                     lambda item: self.view_tweet(item[0]), width=600)
+        # a tweet posted between the mark and the first page is in both, and can only be in the first page
+        self.first_page_keys = {feed_key(item) for item in pager.rows}
+        self.poll_id = self.app.root.after(POLL_MILLISECONDS, self.poll_new_feed_items)
 
-            # gives the user the option to click on and navigate to the other tweet's interface
-            button = tk.Button(self.feed_frame, text=display_text, wraplength=450, justify=tk.LEFT,
-                               command=lambda tid=tid: self.view_tweet(tid))
-            button.pack(pady=2, fill=tk.X)
-
-    def show_more_feed_items(self):
+    def fetch_feed_items(self, after, limit):
         """
-        Displays feed items on the next page
+        Queries a page of the feed.
         Inputs:
-            None
+            after (tuple or None): the last item of the previous page, None for the first page.
+            limit (int): the most items to return.
         Returns:
-             None
+            list of tuple: the items, see queries.load_feed.
         """
-        self.current_screen_index += 1
-        self.show_feed_items()
-        self.update_button_state()
+        if after is not None:
+            trace_hooks.record("load_more", self.user_id, list="feed")
+        return self.app.queries.load_feed(self.app.conn, self.user_id, limit=limit, after=after)
 
-    def show_prev_feed_items(self):
+    @timed_action
+    def poll_new_feed_items(self):
         """
-        Shows the feed items on the previous page
+        Checks for the items that were added to the feed since the last check and shows how many there are in the
+        banner. It runs every POLL_MILLISECONDS until the screen is left.
         Inputs:
             None
         Returns:
-             None
-        """
-        self.current_screen_index -= 1
-        self.show_feed_items()
-        self.update_button_state()
-
-    def update_button_state(self):
+            None
         """
-        Ensures that we don't overstep the boundaries of the returned list of items
+        self.poll_id = None
+        if not self.banner_frame.winfo_exists():
+            return
+        trace_hooks.record("poll", self.user_id)
+        items, self.mark = self.app.queries.load_new_feed_items(self.app.conn, self.user_id, self.mark)
+        new_items = CompactRows(FEED_ROW, (item for item in items if feed_key(item) not in self.first_page_keys
+                                           and feed_key(item) not in self.new_keys))
+        self.new_keys.update(feed_key(item) for item in new_items)
+        self.new_items = new_items + self.new_items
+        if self.new_items:
+            count = len(self.new_items)
+            self.new_items_button.config(text=f"{count} new tweet{'s' if count > 1 else ''}")
+            self.new_items_button.pack(pady=5)
+        self.poll_id = self.app.root.after(POLL_MILLISECONDS, self.poll_new_feed_items)
+
+    @timed_action
+    def show_new_feed_items(self):
+        """
+        Puts the new items on top of the feed and scrolls back to them, the items that were loaded stay as they are.
         Inputs:
             None
         Returns:
-             None
+            None
         """
-        # Update "More" button state
-        if (self.current_screen_index + 1) * 5 >= len(self.feed_items):
-            self.more_button.config(state=tk.DISABLED)
-        else:
-            self.more_button.config(state=tk.NORMAL)
-
-        # Update "Previous" button state
-        if self.current_screen_index == 0:
-            self.prev_button.config(state=tk.DISABLED)
-        else:
-            self.prev_button.config(state=tk.NORMAL)
+        self.feed_list.pager.prepend(self.new_items)
+        self.new_items = CompactRows(FEED_ROW)
+        self.new_items_button.pack_forget()
+        self.feed_list.rows_changed(scroll_to_top=True)
 
     def view_tweet(self, tweet_id):
         """
@@ -0,0 +1,82 @@
+# screens/hashtag_suggestions.py
+import re
+import tkinter as tk
+
+# the hashtag that the cursor is at the end of
+TYPED_HASHTAG = re.compile(r'#\w*$')
+
+
+class HashtagSuggestions:
+    """
+    A row of buttons under a text box that suggests hashtags while one is being typed. Clicking a suggestion replaces
+    what has been typed of the hashtag with it. Works with both tk.Text and tk.Entry widgets.
+    """
+
+    def __init__(self, app, widget, separator=" ", limit=5):
+        """
+        Creates the row of suggestions right under the widget and starts watching what is typed into it.
+        Inputs:
+            app (App object): The app instance, its hashtag_completer gives the suggestions.
+            widget (tk.Text or tk.Entry): the text box, it must already be packed.
+            separator (str): what is typed after a chosen suggestion.
+            limit (int): the most suggestions shown at once.
+        Returns:
+            None
+        """
+        self.app = app
+        self.widget = widget
+        self.separator = separator
+        self.limit = limit
+        self.frame = tk.Frame(app.root)
+        self.frame.pack(after=widget)
+        widget.bind("<KeyRelease>", lambda event: self.update_suggestions(), add="+")
+
+    def typed_hashtag(self):
+        """
+        Gets the hashtag that is being typed, the text right before the cursor if it is one.
+        Inputs:
+            None
+        Returns:
+            str or None: the hashtag so far, including the '#'.
+        """
+        if isinstance(self.widget, tk.Text):
+            before_cursor = self.widget.get("insert linestart", "insert")
+        else:
+            before_cursor = self.widget.get()[:self.widget.index(tk.INSERT)]
+        match = TYPED_HASHTAG.search(before_cursor)
+        return match.group() if match else None
+
+    def update_suggestions(self):
+        """
+        Shows the suggestions for the hashtag that is being typed, or none when the cursor is not in one.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        for widget in self.frame.winfo_children():
+            widget.destroy()
+        typed = self.typed_hashtag()
+        if typed is None:
+            return
+        for term in self.app.hashtag_completer.suggest(typed, self.limit):
+            if term != typed.lower():
+                tk.Button(self.frame, text=term, command=lambda term=term: self.choose(typed, term)).pack(side=tk.LEFT)
+
+    def choose(self, typed, term):
+        """
+        Replaces the hashtag that is being typed with a suggestion.
+        Inputs:
+            typed (str): what had been typed of the hashtag.
+            term (str): the suggestion.
+        Returns:
+            None
+        """
+        if isinstance(self.widget, tk.Text):
+            self.widget.delete(f"insert - {len(typed)} chars", "insert")
+        else:
+            cursor = self.widget.index(tk.INSERT)
+            self.widget.delete(cursor - len(typed), cursor)
+        self.widget.insert(tk.INSERT, term + self.separator)
+        self.widget.focus_set()
+        self.update_suggestions()
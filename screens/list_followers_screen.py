@@ -1,7 +1,11 @@
 # screens/list_followers_screen.py
 import tkinter as tk
 from tkinter import messagebox
+from compact_rows import USER_ROW
+from paging import KeysetPager
+import trace_hooks
 from .screen import Screen
+from .virtual_list import VirtualList
 
 class ListFollowersScreen(Screen):
     """
@@ -34,23 +38,11 @@ class ListFollowersScreen(Screen):
         """
         self.app.clear_screen()
 
-        self.current_screen_index = 0
-        self.followers = []
-
         tk.Label(self.app.root, text="Followers", font=("Arial", 18)).pack(pady=10)
 
+        # the followers scroll in a list that reads them a page at a time
         self.followers_frame = tk.Frame(self.app.root)
-        self.followers_frame.pack(pady=5)
-
-        self.nav_frame = tk.Frame(self.app.root)
-        self.nav_frame.pack(pady=5)
-
-        self.prev_button = tk.Button(self.nav_frame, text="Previous", command=self.show_prev_followers)
-        self.prev_button.pack(side=tk.LEFT)
-        self.prev_button.config(state=tk.DISABLED)  # Disabled initially
-        self.more_button = tk.Button(self.nav_frame, text="More", command=self.show_followers)
-        self.more_button.pack(side=tk.LEFT)
-        self.more_button.config(state=tk.DISABLED)  # Disabled initially
+        self.followers_frame.pack(pady=5, fill=tk.BOTH, expand=True)
 
         self.back_button = tk.Button(self.app.root, text="Back", command=lambda: self.app.back())
         tk.Button(self.app.root, text="Back to Main Menu", command=lambda: self.app.back_to_main_menu()).pack()
@@ -66,84 +58,28 @@ class ListFollowersScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
-        cursor.execute("""
-            SELECT u.usr, u.name FROM users u
-            JOIN follows f ON u.usr = f.flwer
-            WHERE f.flwee = ?
-            ORDER BY u.name
-        """, (self.user_id,))
-        self.followers = cursor.fetchall()
+        pager = KeysetPager(self.fetch_followers, USER_ROW)
+        pager.load_more()
 
-        if not self.followers:
+        if not len(pager):
             messagebox.showinfo("No Followers", "You have no followers.")
             return
 
-        self.show_followers()
-
-        self.update_button_state()
+        self.followers_list = VirtualList(self.followers_frame, pager, lambda user: f"{user[1]} (ID: {user[0]})",
+                                          lambda user: self.view_follower(user[0]))
 
-    def show_followers(self):
+    def fetch_followers(self, after, limit):
         """
-        This function is solely responsible for displaying all the items that are queried and staged to display in the
-        followers list.
+        Queries a page of the followers.
         Inputs:
-            None
+            after (tuple or None): the last follower of the previous page, None for the first page.
+            limit (int): the most followers to return.
         Returns:
-            None
+            list of tuple: the followers, see queries.list_followers.
         """
-        # Show next 5 followers
-        self.start_index = 5 * self.current_screen_index
-        self.end_index = min(self.start_index + 5, len(self.followers))
-        for i in range(self.start_index, self.end_index):
-            usr_id, name = self.followers[i]
-            button = tk.Button(self.followers_frame, text=f"{name} (ID: {usr_id})",
-                               command=lambda uid=usr_id: self.view_follower(uid))
-            button.pack(pady=2, fill=tk.X)
-
-    def show_more_followers(self):
-        """
-        Loads the next list of followers
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        self.current_screen_index += 1
-        self.show_followers()
-        self.update_button_state()
-
-    def show_prev_followers(self):
-        """
-        Shows the previous list of followers
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        self.current_screen_index -= 1
-        self.show_followers()
-        self.update_button_state()
-
-    def update_button_state(self):
-        """
-        Switches off the buttons when they are not needed
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        # Update "More" button state
-        if (self.current_screen_index + 1) * 5 >= len(self.followers):
-            self.more_button.config(state=tk.DISABLED)
-        else:
-            self.more_button.config(state=tk.NORMAL)
-
-        # Update "Previous" button state
-        if self.current_screen_index == 0:
-            self.prev_button.config(state=tk.DISABLED)
-        else:
-            self.prev_button.config(state=tk.NORMAL)
+        if after is not None:
+            trace_hooks.record("load_more", self.user_id, list="followers")
+        return self.app.queries.list_followers(self.app.conn, self.user_id, limit=limit, after=after)
 
     def view_follower(self, follower_id):
         """
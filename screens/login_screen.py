@@ -68,9 +68,7 @@ class LoginScreen(Screen):
 
         user_id = int(user_id)  # Convert to integer
 
-        cursor = self.app.conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE usr = ? AND pwd = ?", (user_id, password))
-        user = cursor.fetchone()
+        user = self.app.queries.authenticate(self.app.conn, user_id, password)
         if user:
             # adds main menu to the stack
             self.app.show_main_menu(user_id)
@@ -51,6 +51,8 @@ class MainMenuScreen(Screen):
             pady=5)
         tk.Button(self.app.root, text="List Followers", command=lambda: self.app.show_list_followers_screen(self.user_id)).pack(
             pady=5)
+        tk.Button(self.app.root, text="Trending Hashtags", command=lambda: self.app.show_trending_screen(self.user_id)).pack(
+            pady=5)
         tk.Button(self.app.root, text="Logout", command=lambda: self.app.logout()).pack(pady=10)
 
     def get_user_name(self):
@@ -61,11 +63,4 @@ class MainMenuScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
-
-        cursor.execute("""
-            SELECT name FROM users
-            WHERE usr = ?
-        """, (self.user_id,))
-
-        self.name = cursor.fetchone()[0]
+        self.name = self.app.queries.get_user_name(self.app.conn, self.user_id)
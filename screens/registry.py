@@ -0,0 +1,34 @@
+# screens/registry.py
+# Where every screen class is, so that the app only imports a screen the first time it is shown. The login window
+# then only waits for the login screen; the screens behind it (and the modules they use) are imported on navigation.
+import importlib
+
+# screen class name -> the module it is in
+SCREEN_MODULES = {
+    "LoginScreen": "screens.login_screen",
+    "SignupScreen": "screens.signup_screen",
+    "MainMenuScreen": "screens.main_menu_screen",
+    "FeedScreen": "screens.feed_screen",
+    "SearchTweetsScreen": "screens.search_tweets_screen",
+    "SearchUsersScreen": "screens.search_users_screen",
+    "UserProfileScreen": "screens.user_profile_screen",
+    "UserTweetsScreen": "screens.user_tweets_screen",
+    "TweetDetailScreen": "screens.tweet_detail_screen",
+    "ComposeTweetScreen": "screens.compose_tweet_screen",
+    "ReplyTweetScreen": "screens.reply_tweet_screen",
+    "ListFollowersScreen": "screens.list_followers_screen",
+    "TrendingScreen": "screens.trending_screen",
+}
+
+
+def screen_class(name):
+    """
+    Gets a screen class, importing its module if it has not been imported yet.
+    Inputs:
+        name (str): the name of the class, a key of SCREEN_MODULES.
+    Raises:
+        KeyError: If there is no such screen.
+    Returns:
+        type: the class.
+    """
+    return getattr(importlib.import_module(SCREEN_MODULES[name]), name)
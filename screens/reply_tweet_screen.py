@@ -3,8 +3,8 @@ import tkinter as tk
 from tkinter import messagebox
 import sqlite3
 import re
-import datetime
 from .screen import Screen
+from .hashtag_suggestions import HashtagSuggestions
 
 class ReplyTweetScreen(Screen):
     """
@@ -44,6 +44,7 @@ class ReplyTweetScreen(Screen):
 
         self.reply_entry = tk.Text(self.app.root, height=5, width=40)
         self.reply_entry.pack(pady=10)
+        HashtagSuggestions(self.app, self.reply_entry)
 
         tk.Button(self.app.root, text="Post Reply", command=self.post_reply).pack(pady=5)
         tk.Button(self.app.root, text="Back",
@@ -85,28 +86,12 @@ class ReplyTweetScreen(Screen):
         # Proceed if no duplicates
         hashtags = unique_hashtags  # Use the unique set for database insertion
 
-        cursor = self.app.conn.cursor()
         try:
             # Insert reply as a new tweet with replyto_tid field
-            cursor.execute("SELECT MAX(tid) FROM tweets")
-            result = cursor.fetchone()
-            new_tid = str(int(result[0]) + 1) if result[0] else '1'
-            tdate = datetime.date.today().strftime('%Y-%m-%d')
-            ttime = datetime.datetime.now().strftime('%H:%M:%S')
-
-            cursor.execute("""
-                INSERT INTO tweets (tid, writer_id, text, tdate, ttime, replyto_tid)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (new_tid, self.user_id, reply_text, tdate, ttime, self.tweet_id))
-            
-            # Insert each unique hashtag
-            for term in hashtags:
-                cursor.execute("""
-                    INSERT INTO hashtag_mentions (tid, term) 
-                    VALUES (?, ?)
-                """, (new_tid, term.lower()))  # Ensure hashtags are stored in lowercase
-
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.post_tweet, self.user_id, reply_text, hashtags,
+                                         replyto_tid=self.tweet_id)
+            if hashtags:
+                self.app.hashtag_completer.refresh()
             messagebox.showinfo("Success", "Reply posted successfully.")
             self.app.back()
         except sqlite3.Error as e:
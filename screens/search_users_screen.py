@@ -1,7 +1,12 @@
 # screens/search_users_screen.py
 import tkinter as tk
 from tkinter import messagebox
+from compact_rows import USER_ROW
+from paging import KeysetPager
+import trace_hooks
+from ui_latency import timed_action
 from .screen import Screen
+from .virtual_list import VirtualList
 
 class SearchUsersScreen(Screen):
     """
@@ -33,8 +38,7 @@ class SearchUsersScreen(Screen):
         """
         self.app.clear_screen()
 
-        self.current_screen_index = 0
-        self.users = []
+        self.users_list = None
 
         tk.Label(self.app.root, text="Search Users", font=("Arial", 18)).pack(pady=10)
 
@@ -44,27 +48,22 @@ class SearchUsersScreen(Screen):
 
         self.keyword_entry.bind("<Return>", lambda event: self.search_users())
 
+        # the fuzzy mode also finds names that are a few typos away from a keyword
+        self.fuzzy = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.app.root, text="Also match misspelled names", variable=self.fuzzy).pack()
+
         self.search_button = tk.Button(self.app.root, text="Search", command=self.search_users)
         self.search_button.pack(pady=5)
 
+        # the matches scroll in a list that reads them a page at a time
         self.users_frame = tk.Frame(self.app.root)
-        self.users_frame.pack(pady=5)
-
-        self.nav_frame = tk.Frame(self.app.root)
-        self.nav_frame.pack(pady=5)
-
-        self.prev_button = tk.Button(self.nav_frame, text="Previous", command=self.show_prev_users)
-        self.prev_button.pack(side=tk.LEFT)
-        self.prev_button.config(state=tk.DISABLED)  # Disabled initially
-
-        self.more_button = tk.Button(self.nav_frame, text="More", command=self.show_more_users)
-        self.more_button.pack(side=tk.LEFT)
-        self.more_button.config(state=tk.DISABLED)  # Disabled initially
+        self.users_frame.pack(pady=5, fill=tk.BOTH, expand=True)
 
         self.back_button = tk.Button(self.app.root, text="Back",
                                      command=lambda: self.app.back())
         self.back_button.pack(pady=5)
 
+    @timed_action
     def search_users(self):
         """
         This function allows the user to take input from the search, and then query the database to extract all users
@@ -79,15 +78,8 @@ class SearchUsersScreen(Screen):
             messagebox.showwarning("Warning", "Please enter a keyword.")
             return
 
-        # Clear previous results
-        for widget in self.users_frame.winfo_children():
-            widget.destroy()
-        self.current_screen_index = 0  # Reset index
-        self.users = []
-        self.more_button.config(state=tk.DISABLED)
-
         # Split search string into keywords separated by comma and convert it to lower case, using list comprehension
-        keywords = ['%' + keyword.lower().strip() + '%' for keyword in keyword.strip().split(',') if keyword.strip() and keyword.strip() != '']
+        keywords = [keyword.lower().strip() for keyword in keyword.strip().split(',') if keyword.strip() and keyword.strip() != '']
 
         if  keywords is None or len(keywords) == 0 or  "" in keywords or None in keywords:
             messagebox.showwarning("Warning", "Please enter keyword for search separated by comma.")
@@ -101,94 +93,40 @@ class SearchUsersScreen(Screen):
             messagebox.showwarning("Warning", "Please remove duplicate keyword from search. Search keywords are not case sensitive.")
             return
 
-        # we use list comprehension to create a list of parameterized query conditional statements. The join makes a
-        # compact and easy way to both get the "OR" connective in between the keywords without getting them at the ends
-        search_condition = " OR ".join([" LOWER(name) LIKE ? " for keyword in keywords])
-
-        # the query first orders the user names by order of increasing length. Then if the lenghs are tied, we break the
-        # tie in lexicographic order by using name, and then lexicographically sort by the user id
-        query_for_sql = "SELECT usr, name FROM users  WHERE " + search_condition + " ORDER BY LENGTH(name), name, usr"
-
-        cursor = self.app.conn.cursor()
-
-        # run the parameterized query and also pass in the parameters
-        cursor.execute(query_for_sql, tuple(keywords))
-        matches = cursor.fetchall()
-
-        self.users = matches
-
-        if not self.users:
+        trace_hooks.record("user_search", self.user_id, keywords=keywords, fuzzy=bool(self.fuzzy.get()))
+        # matches are ordered by the length of the name, then the name, then the user id
+        if self.fuzzy.get():
+            # names closer to a keyword come first, the order above breaks the ties, so every match is ranked at once
+            users = self.app.user_name_index.search(keywords, self.app.queries.search_users(self.app.conn, keywords))
+            pager = KeysetPager.of_rows(USER_ROW, users)
+        else:
+            self.keywords = keywords
+            pager = KeysetPager(self.fetch_users, USER_ROW)
+            pager.load_more()
+
+        if self.users_list is not None:
+            # the matches of the previous search go either way
+            self.users_list.set_pager(pager)
+        if not len(pager):
             messagebox.showinfo("No Results", "No users found.")
             return
 
-        self.show_users()
-
-        self.update_button_state()
-
-    def show_users(self):
-        """
-        Displays the next set of users based on the current index.
-        Inputs:
-            None
-        Returns:
-            None
-        """
-        # Clear previous results
-        for widget in self.users_frame.winfo_children():
-            widget.destroy()
-
-        # Show next 5 users
-        self.start_index = 5 * self.current_screen_index
-        self.end_index = min(self.start_index + 5, len(self.users))
-        for i in range(self.start_index, self.end_index):
-            usr_id, name = self.users[i]
-            button = tk.Button(self.users_frame, text=f"{name} (ID: {usr_id})",
-                               command=lambda uid=usr_id: self.view_user(uid))
-            button.pack(pady=2, fill=tk.X)
-
-    def show_prev_users(self):
-        """
-        Shows the previous list of users
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        self.current_screen_index -= 1
-        self.show_users()
-        self.update_button_state()
-
-    def show_more_users(self):
-        """
-        Loads the next list of users
-        Inputs:
-            None
-        Returns:
-             None
-        """
-        self.current_screen_index += 1
-        self.show_users()
-        self.update_button_state()
+        if self.users_list is None:
+            self.users_list = VirtualList(self.users_frame, pager, lambda user: f"{user[1]} (ID: {user[0]})",
+                                          lambda user: self.view_user(user[0]))
 
-    def update_button_state(self):
+    def fetch_users(self, after, limit):
         """
-        Switches off the buttons when they are not needed
+        Runs the search for a page of matches.
         Inputs:
-            None
+            after (tuple or None): the last user of the previous page, None for the first page.
+            limit (int): the most users to return.
         Returns:
-             None
+            list of tuple: the users, see queries.search_users.
         """
-        # Update the "Previous" button state
-        if self.current_screen_index == 0:
-            self.prev_button.config(state=tk.DISABLED)
-        else:
-            self.prev_button.config(state=tk.NORMAL)
-
-        # Update the "More" button state
-        if (self.current_screen_index + 1) * 5 >= len(self.users):
-            self.more_button.config(state=tk.DISABLED)
-        else:
-            self.more_button.config(state=tk.NORMAL)
+        if after is not None:
+            trace_hooks.record("load_more", self.user_id, list="users")
+        return self.app.queries.search_users(self.app.conn, self.keywords, limit=limit, after=after)
 
     def view_user(self, target_user_id):
         """
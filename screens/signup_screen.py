@@ -86,12 +86,6 @@ class SignupScreen(Screen):
             return
 
         # Proceed with sign-up if all validations pass
-        cursor = self.app.conn.cursor()
-        cursor.execute("SELECT MAX(usr) FROM users")
-        result = cursor.fetchone()
-        new_usr = str(int(result[0]) + 1) if result[0] else '1'
-        cursor.execute("INSERT INTO users (usr, name, email, phone, pwd) VALUES (?, ?, ?, ?, ?)",
-                       (new_usr, name, email.lower(), phone, password))
-        self.app.conn.commit()
+        new_usr = self.app.write_queue.execute(self.app.queries.create_user, name, email, phone, password)
         messagebox.showinfo("Sign Up Successful", f"Account created successfully! Your user ID is: {new_usr}")
         self.app.back()
@@ -0,0 +1,70 @@
+# screens/trending_screen.py
+import tkinter as tk
+from ui_latency import timed_action
+from .screen import Screen
+
+
+class TrendingScreen(Screen):
+    """
+    A class that displays the hashtags that are mentioned the most right now, recent mentions counting the most.
+    """
+
+    # the number of hashtags shown
+    TOP_HASHTAGS = 10
+
+    def __init__(self, app, user_id):
+        """
+        The constructor for the TrendingScreen class, this constructor initializes and declares all Tkinter objects to
+        show the trending hashtags.
+        Inputs:
+            app (App object): The app instance.
+            user_id (int): The ID of the current user.
+        Returns:
+            None
+        """
+        self.app = app
+        self.user_id = int(user_id)
+        self.build_user_interface()
+
+    def build_user_interface(self):
+        """
+        An inherited method from the Screen class that is specialized to be able to display the user interface of the
+        application. This specific screen shows the top hashtags, with how many times each one was mentioned this hour
+        and today.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.app.clear_screen()
+
+        tk.Label(self.app.root, text="Trending Hashtags", font=("Arial", 18)).pack(pady=10)
+
+        self.hashtags_frame = tk.Frame(self.app.root)
+        self.hashtags_frame.pack(pady=5)
+
+        tk.Button(self.app.root, text="Refresh", command=self.load_hashtags).pack(pady=5)
+        tk.Button(self.app.root, text="Back", command=lambda: self.app.back()).pack(pady=5)
+
+        self.load_hashtags()
+
+    @timed_action
+    def load_hashtags(self):
+        """
+        Reads the trending hashtags and lists them.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        for widget in self.hashtags_frame.winfo_children():
+            widget.destroy()
+
+        hashtags = self.app.queries.get_trending_hashtags(self.app.conn, self.TOP_HASHTAGS)
+        if not hashtags:
+            tk.Label(self.hashtags_frame, text="Nothing is trending yet.").pack(pady=2)
+            return
+
+        for rank, (term, score, this_hour, today) in enumerate(hashtags, start=1):
+            display_text = f"{rank}. {term}   score {score:.2f}   ({this_hour} this hour, {today} today)"
+            tk.Label(self.hashtags_frame, text=display_text, anchor=tk.W).pack(pady=2, fill=tk.X)
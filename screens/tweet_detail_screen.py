@@ -1,7 +1,6 @@
 # screens/tweet_detail_screen.py
 import tkinter as tk
 from tkinter import messagebox
-import datetime
 import sqlite3
 from .screen import Screen
 
@@ -38,37 +37,19 @@ class TweetDetailScreen(Screen):
         """
         self.app.clear_screen()
 
-        cursor = self.app.conn.cursor()
-
         # Get tweet details
-        cursor.execute("""
-            SELECT text, tdate, ttime, writer_id FROM tweets WHERE tid = ?
-        """, (self.tweet_id,))
-        self.tweet = cursor.fetchone()
+        self.tweet = self.app.queries.get_tweet(self.app.conn, self.tweet_id)
         if not self.tweet:
             messagebox.showerror("Error", "Tweet not found.")
             self.app.show_search_tweets_screen(self.user_id)
             return
         self.text, self.tdate, self.ttime, self.writer_id = self.tweet
 
-        # Determine if the tweet is a retweet
-        cursor.execute("""
-            SELECT COUNT(*) FROM retweets WHERE tid = ? AND retweeter_id = ?
-        """, (self.tweet_id, self.user_id))
-        is_retweet = cursor.fetchone()[0] > 0
+        # Determine if the tweet is a retweet, and get the number of retweets, spam retweets and replies
+        is_retweet, num_retweets, num_retweet_spams, num_replies = self.app.queries.get_tweet_stats(
+            self.app.conn, self.tweet_id, self.user_id)
         display_type = "Retweet" if is_retweet else "Tweet"
 
-        # Get number of retweets
-        cursor.execute("SELECT COUNT(*) FROM retweets WHERE tid = ?", (self.tweet_id,))
-        num_retweets = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM retweets WHERE tid = ? AND spam=1", (self.tweet_id,))
-        num_retweet_spams = cursor.fetchone()[0]
-
-        # Get number of replies
-        cursor.execute("SELECT COUNT(*) FROM tweets WHERE replyto_tid = ?", (self.tweet_id,))
-        num_replies = cursor.fetchone()[0]
-
         # Display tweet details in the specified order
         tk.Label(self.app.root, text="Tweet Details", font=("Arial", 18)).pack(pady=10)
 
@@ -100,23 +81,9 @@ class TweetDetailScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
         try:
-            # Insert into retweets table including rdate for consistency
-            cursor.execute(
-                """
-                INSERT INTO retweets (tid, retweeter_id, writer_id, spam, rdate) 
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (
-                    tweet_id,
-                    self.user_id,
-                    self.writer_id,  # Original writer's ID
-                    0,  # Assuming 0 for non-spam
-                    datetime.date.today().strftime('%Y-%m-%d')  # rdate
-                )
-            )
-            self.app.conn.commit()
+            # Insert into retweets table, with the original writer's ID and 0 for non-spam
+            self.app.write_queue.execute(self.app.queries.retweet, tweet_id, self.user_id, self.writer_id)
             messagebox.showinfo("Success", "Tweet retweeted successfully.")
             self.app.reload()
 
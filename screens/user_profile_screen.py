@@ -3,7 +3,8 @@
 import tkinter as tk
 from tkinter import messagebox
 import sqlite3
-import datetime
+from compact_rows import CompactRows, TWEET_ROW
+from ui_latency import timed_action
 from .screen import Screen
 
 class UserProfileScreen(Screen):
@@ -43,32 +44,13 @@ class UserProfileScreen(Screen):
         self.tweets_per_page = 3
         self.tweets = []
 
-        cursor = self.app.conn.cursor()
-
-        # Get user information
-        cursor.execute("SELECT name FROM users WHERE usr = ?", (self.target_user_id,))
-        result = cursor.fetchone()
-        if not result:
+        # Get user information, the combined tweet and retweet count, and the follower and following counts
+        summary = self.app.queries.get_profile_summary(self.app.conn, self.target_user_id)
+        if not summary:
             messagebox.showerror("Error", "User not found.")
             self.app.show_search_users_screen(self.user_id)
             return
-        name = result[0]
-
-        # Get profile details with combined tweet and retweet count using UNION
-        cursor.execute("""
-            SELECT COUNT(*) FROM (
-                SELECT tid FROM tweets WHERE writer_id = ?
-                UNION ALL
-                SELECT tid FROM retweets WHERE retweeter_id = ?
-            )
-        """, (self.target_user_id, self.target_user_id))
-        num_tweets = cursor.fetchone()[0]
-
-        # Get follower and following counts
-        cursor.execute("SELECT COUNT(*) FROM follows WHERE flwer = ?", (self.target_user_id,))
-        num_following = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM follows WHERE flwee = ?", (self.target_user_id,))
-        num_followers = cursor.fetchone()[0]
+        name, num_tweets, num_following, num_followers = summary
 
         # Display profile info
         tk.Label(self.app.root, text=f"User Profile: {name} (ID: {self.target_user_id})", font=("Arial", 18)).pack(pady=10)
@@ -76,8 +58,7 @@ class UserProfileScreen(Screen):
         tk.Label(self.app.root, text=info_text).pack(pady=5)
 
         # Follow/Unfollow button
-        cursor.execute("SELECT 1 FROM follows WHERE flwer = ? AND flwee = ?", (self.user_id, self.target_user_id))
-        is_following = cursor.fetchone() is not None
+        is_following = self.app.queries.is_following(self.app.conn, self.user_id, self.target_user_id)
 
         if self.target_user_id == self.user_id:
             follow_button = tk.Button(self.app.root, text="You cannot follow yourself", state=tk.DISABLED)
@@ -112,13 +93,7 @@ class UserProfileScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
-        cursor.execute("""
-            SELECT writer_id, tid, text, tdate, ttime FROM tweets
-            WHERE writer_id = ?
-            ORDER BY tdate DESC, ttime DESC
-        """, (self.target_user_id,))
-        self.tweets = cursor.fetchall()
+        self.tweets = CompactRows(TWEET_ROW, self.app.queries.get_user_tweets(self.app.conn, self.target_user_id))
         self.show_tweets()
         self.update_button_state()
 
@@ -155,6 +130,7 @@ class UserProfileScreen(Screen):
             button.pack(pady=2, fill=tk.X)
 
 
+    @timed_action
     def show_prev_tweets(self):
         """
         Shows the previous list of tweets
@@ -166,6 +142,7 @@ class UserProfileScreen(Screen):
         self.current_screen_page -= 1
         self.show_tweets()
         self.update_button_state()
+    @timed_action
     def show_more_tweets(self):
         """
         Loads the next list of tweets
@@ -208,11 +185,8 @@ class UserProfileScreen(Screen):
             messagebox.showerror("Error", "You cannot follow yourself.")
             return
 
-        cursor = self.app.conn.cursor()
         try:
-            cursor.execute("INSERT INTO follows (flwer, flwee, start_date) VALUES (?, ?, ?)", 
-                           (self.user_id, self.target_user_id, datetime.date.today().strftime('%Y-%m-%d')))
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.follow_user, self.user_id, self.target_user_id)
             messagebox.showinfo("Success", "You are now following this user.")
             self.more_button.config(state=tk.NORMAL)  # Re-enable if needed
 
@@ -231,11 +205,8 @@ class UserProfileScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
         try:
-            cursor.execute("DELETE FROM follows WHERE flwer = ? AND flwee = ?", 
-                           (self.user_id, self.target_user_id))
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.unfollow_user, self.user_id, self.target_user_id)
             messagebox.showinfo("Success", "You have unfollowed this user.")
             self.more_button.config(state=tk.NORMAL)  # Re-enable if needed
 
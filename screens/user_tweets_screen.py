@@ -1,6 +1,7 @@
 # screens/user_tweets_screen.py
 import tkinter as tk
 from tkinter import messagebox
+import sqlite3
 from .screen import Screen
 
 class UserTweetsScreen(Screen):
@@ -28,22 +29,15 @@ class UserTweetsScreen(Screen):
         # self.current_screen_index = 0
         # self.tweets = []
 
-        cursor = self.app.conn.cursor()
-        cursor.execute("SELECT name FROM users WHERE usr = ?", (self.target_user_id,))
-        result = cursor.fetchone()
-        if not result:
+        name = self.app.queries.get_user_name(self.app.conn, self.target_user_id)
+        if name is None:
             messagebox.showerror("Error", "User not found.")
             self.app.show_main_menu(self.user_id)
             return
-        name = result[0]
 
         # Get profile details
-        cursor.execute("SELECT COUNT(*) FROM tweets WHERE writer_id = ?", (self.target_user_id,))
-        num_tweets = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM follows WHERE flwer = ?", (self.target_user_id,))
-        num_following = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM follows WHERE flwee = ?", (self.target_user_id,))
-        num_followers = cursor.fetchone()[0]
+        num_tweets = self.app.queries.count_user_tweets(self.app.conn, self.target_user_id)
+        num_following, num_followers = self.app.queries.get_follow_counts(self.app.conn, self.target_user_id)
 
         # Display profile info
         tk.Label(self.app.root, text=f"User Profile: {name} (ID: {self.target_user_id})", font=("Arial", 18)).pack(
@@ -52,8 +46,7 @@ class UserTweetsScreen(Screen):
         tk.Label(self.app.root, text=info_text).pack(pady=5)
 
         # Follow/Unfollow button
-        cursor.execute("SELECT 1 FROM follows WHERE flwer = ? AND flwee = ?", (self.user_id, self.target_user_id))
-        is_following = cursor.fetchone() is not None
+        is_following = self.app.queries.is_following(self.app.conn, self.user_id, self.target_user_id)
 
         if self.target_user_id == self.user_id:
             follow_button = tk.Button(self.app.root, text="You cannot follow yourself", state=tk.DISABLED)
@@ -68,16 +61,10 @@ class UserTweetsScreen(Screen):
         tweets_frame = tk.Frame(self.app.root)
         tweets_frame.pack(pady=5)
 
-        cursor.execute("""
-                    SELECT tid, text, tdate, ttime FROM tweets
-                    WHERE writer_id = ?
-                    ORDER BY tdate DESC, ttime DESC
-                    LIMIT 3
-                """, (self.target_user_id,))
-        tweets = cursor.fetchall()
+        tweets = self.app.queries.get_user_tweets(self.app.conn, self.target_user_id, limit=3)
 
         if tweets:
-            for tid, text, tdate, ttime in tweets:
+            for writer_id, tid, text, tdate, ttime in tweets:
                 display_text = f"{text} (Date: {tdate} {ttime})"
                 button = tk.Button(tweets_frame, text=display_text, wraplength=450, justify=tk.LEFT,
                                    command=lambda tid=tid: self.app.show_tweet_detail_screen(self.user_id, tid))
@@ -101,11 +88,8 @@ class UserTweetsScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
         try:
-            cursor.execute("INSERT INTO follows (flwer, flwee, start_date) VALUES (?, ?, ?)",
-                           (self.user_id, self.target_user_id, datetime.date.today().strftime('%Y-%m-%d')))
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.follow_user, self.user_id, self.target_user_id)
             messagebox.showinfo("Success", "You are now following this user.")
             self.follow_button.config(text="Unfollow", command=self.unfollow_user)
 
@@ -124,11 +108,8 @@ class UserTweetsScreen(Screen):
         Returns:
             None
         """
-        cursor = self.app.conn.cursor()
         try:
-            cursor.execute("DELETE FROM follows WHERE flwer = ? AND flwee = ?",
-                           (self.user_id, self.target_user_id))
-            self.app.conn.commit()
+            self.app.write_queue.execute(self.app.queries.unfollow_user, self.user_id, self.target_user_id)
             messagebox.showinfo("Success", "You have unfollowed this user.")
             self.follow_button.config(text="Follow", command=self.follow_user)
 
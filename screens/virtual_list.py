@@ -0,0 +1,224 @@
+# screens/virtual_list.py
+import tkinter as tk
+from ui_latency import timed_action
+
+# the height of a row in pixels, every row is one line of text
+ROW_HEIGHT = 26
+# how many rows before the end of the loaded rows the next page is asked for
+LOAD_AHEAD = 20
+# how many pixels a click of the mouse wheel scrolls
+WHEEL_PIXELS = 3 * ROW_HEIGHT
+
+
+class VirtualList:
+    """
+    A scrolling list drawn on a canvas that only has items for the rows that can be seen. When it scrolls, the same
+    few rectangles and texts are moved and given the text of other rows, so scrolling through 100,000 rows costs the
+    same as scrolling through 10. Its rows come from a paging.KeysetPager, which is asked for more while the end of
+    what it has read is in sight.
+    """
+
+    def __init__(self, parent, pager, describe, on_select, width=500, height=10 * ROW_HEIGHT):
+        """
+        Creates the list and packs it into its parent, the first page is loaded if the pager has no rows yet.
+        Inputs:
+            parent (tk widget): where the list goes.
+            pager (paging.KeysetPager): the rows.
+            describe (function): gets the text of a row.
+            on_select (function): called with a row when it is clicked or Return is pressed on it.
+            width (int): the width of the list in pixels.
+            height (int): the height of the list in pixels.
+        Returns:
+            None
+        """
+        self.pager = pager
+        self.describe = describe
+        self.on_select = on_select
+        # the pixel of the whole list that is at the top of the canvas
+        self.offset = 0
+        self.selected = None
+        # one (rectangle, text, row index) per row that fits on the canvas
+        self.pool = []
+
+        self.frame = tk.Frame(parent)
+        self.frame.pack(pady=5, fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self.frame, width=width, height=height, highlightthickness=0,
+                                background="white", takefocus=True)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<Button-1>", self.click)
+        # Windows and macOS send MouseWheel, X11 sends buttons 4 and 5
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_pixels(-WHEEL_PIXELS if event.delta > 0
+                                                                          else WHEEL_PIXELS))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_pixels(-WHEEL_PIXELS))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_pixels(WHEEL_PIXELS))
+        self.canvas.bind("<Up>", lambda event: self.move_selection(-1))
+        self.canvas.bind("<Down>", lambda event: self.move_selection(1))
+        self.canvas.bind("<Prior>", lambda event: self.yview("scroll", -1, "pages"))
+        self.canvas.bind("<Next>", lambda event: self.yview("scroll", 1, "pages"))
+        self.canvas.bind("<Home>", lambda event: self.yview("moveto", 0))
+        self.canvas.bind("<End>", lambda event: self.yview("moveto", 1))
+        self.canvas.bind("<Return>", lambda event: self.choose(self.selected))
+
+        if not len(pager):
+            pager.load_more()
+        self.redraw()
+
+    def set_pager(self, pager):
+        """
+        Shows other rows, from the top.
+        Inputs:
+            pager (paging.KeysetPager): the rows.
+        Returns:
+            None
+        """
+        self.pager = pager
+        self.offset = 0
+        self.selected = None
+        if not len(pager):
+            pager.load_more()
+        self.redraw(force=True)
+
+    def rows_changed(self, scroll_to_top=False):
+        """
+        Shows the rows of the pager again after some were put in front of them.
+        Inputs:
+            scroll_to_top (bool): whether to go back to the first row.
+        Returns:
+            None
+        """
+        if scroll_to_top:
+            self.offset = 0
+        self.selected = None
+        self.redraw(force=True)
+
+    def total_height(self):
+        return len(self.pager) * ROW_HEIGHT
+
+    def view_height(self):
+        return max(self.canvas.winfo_height(), 1)
+
+    def yview(self, *args):
+        """
+        Scrolls the list, this is the command of the scrollbar.
+        Inputs:
+            args: ("moveto", fraction) or ("scroll", count, "units" or "pages").
+        Returns:
+            None
+        """
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.total_height())
+        elif args[0] == "scroll":
+            step = self.view_height() - ROW_HEIGHT if args[2] == "pages" else ROW_HEIGHT
+            self.scroll_pixels(int(args[1]) * step)
+
+    def scroll_pixels(self, pixels):
+        self.scroll_to(self.offset + pixels)
+
+    @timed_action
+    def scroll_to(self, offset):
+        """
+        Puts a pixel of the list at the top of the canvas, as far as the rows go.
+        Inputs:
+            offset (float): the pixel.
+        Returns:
+            None
+        """
+        self.offset = int(max(0, min(offset, self.total_height() - self.view_height())))
+        self.redraw()
+
+    def redraw(self, force=False):
+        """
+        Gives the items of the canvas the rows that are in sight, making or deleting items only when the canvas was
+        resized, and asks for the next page when the end of the loaded rows is near.
+        Inputs:
+            force (bool): whether to give every item its text again even if its row did not change.
+        Returns:
+            None
+        """
+        first = self.offset // ROW_HEIGHT
+        if not self.pager.done and first + self.view_height() // ROW_HEIGHT + LOAD_AHEAD >= len(self.pager):
+            self.pager.load_more()
+        self.offset = max(0, min(self.offset, self.total_height() - self.view_height()))
+        first = self.offset // ROW_HEIGHT
+
+        width = max(self.canvas.winfo_width(), 1)
+        needed = self.view_height() // ROW_HEIGHT + 2
+        while len(self.pool) < needed:
+            rectangle = self.canvas.create_rectangle(0, 0, 0, 0, outline="#dddddd")
+            text = self.canvas.create_text(0, 0, anchor=tk.W)
+            self.pool.append([rectangle, text, None])
+        while len(self.pool) > needed:
+            rectangle, text, index = self.pool.pop()
+            self.canvas.delete(rectangle, text)
+
+        for slot, item in enumerate(self.pool):
+            rectangle, text, shown = item
+            index = first + slot
+            top = index * ROW_HEIGHT - self.offset
+            if index >= len(self.pager):
+                self.canvas.itemconfigure(rectangle, state=tk.HIDDEN)
+                self.canvas.itemconfigure(text, state=tk.HIDDEN)
+                item[2] = None
+                continue
+            self.canvas.coords(rectangle, 0, top, width - 1, top + ROW_HEIGHT)
+            self.canvas.coords(text, 6, top + ROW_HEIGHT // 2)
+            if force or shown != index:
+                # a row is one line, so the line breaks of a tweet become spaces
+                line = self.describe(self.pager[index]).replace("\n", " ")
+                self.canvas.itemconfigure(text, text=line, state=tk.NORMAL)
+                item[2] = index
+            self.canvas.itemconfigure(rectangle, state=tk.NORMAL,
+                                      fill="#cce0ff" if index == self.selected else "white")
+
+        total = self.total_height()
+        if total <= self.view_height():
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + self.view_height()) / total)
+
+    def row_at(self, y):
+        """
+        Gets the index of the row at a height of the canvas.
+        Inputs:
+            y (int): the height in pixels.
+        Returns:
+            int or None: the index, None below the last row.
+        """
+        index = (self.offset + y) // ROW_HEIGHT
+        return index if 0 <= index < len(self.pager) else None
+
+    def click(self, event):
+        self.canvas.focus_set()
+        index = self.row_at(event.y)
+        if index is not None:
+            self.selected = index
+            self.choose(index)
+
+    @timed_action
+    def move_selection(self, step):
+        """
+        Selects the row above or below the selected one and scrolls it into sight.
+        Inputs:
+            step (int): -1 for the row above, 1 for the row below.
+        Returns:
+            None
+        """
+        if not len(self.pager):
+            return
+        index = 0 if self.selected is None else max(0, min(self.selected + step, len(self.pager) - 1))
+        self.selected = index
+        top = index * ROW_HEIGHT
+        if top < self.offset:
+            self.scroll_to(top)
+        elif top + ROW_HEIGHT > self.offset + self.view_height():
+            self.scroll_to(top + ROW_HEIGHT - self.view_height())
+        else:
+            self.redraw()
+
+    def choose(self, index):
+        if index is not None:
+            self.on_select(self.pager[index])
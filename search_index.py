@@ -0,0 +1,471 @@
+# search_index.py
+# An in-memory inverted index for the tweet search. Every word of a tweet's text and every hashtag it mentions is a
+# token, and each token maps to the sorted array of the ids of the tweets that contain it. A search is then a few
+# intersections, unions and differences of those arrays instead of a regular expression run over every tweet, which
+# also makes AND and NOT searches possible:
+#
+#     sunny beach, #holiday -rain
+#
+# Keywords separated by commas are OR'd as before. Inside a keyword, words separated by spaces must all be in the tweet
+# (AND) and a word starting with '-' must not be (NOT). A single word matches exactly the tweets that the regular
+# expression search of queries.build_tweet_search_query matches.
+#
+# The index is built from the whole database (all the partitions included) the first time it is searched, and it
+# catches up on the tweets written since then before every search. Tweets posted through IndexedQueries are added as
+# soon as they are written.
+#
+# Usage: python search_index.py database.db "sunny beach, #holiday -rain" [--limit N]
+import argparse
+import bisect
+import heapq
+import re
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+
+import db
+import queries
+from exceptions import InvalidSearchQueryException, NonexistentDatabaseException
+
+# a word of the text, as the \W boundaries of the regular expression search cut it
+WORD = re.compile(r'\w+')
+
+# how many tweet ids go into one IN (...) when the rows of the results are read
+FETCH_BATCH = 500
+
+
+def tokenize(text):
+    """
+    Gets the word tokens of the text of a tweet.
+    Inputs:
+        text (str): the text.
+    Returns:
+        set of str: the lowercased words.
+    """
+    return set(WORD.findall((text or '').lower()))
+
+
+def _gallop(postings, target, low):
+    """
+    Finds where target is, or would go, in a sorted array, looking ahead in steps that double in size. Walking a short
+    array against a long one this way skips most of the long one.
+    Inputs:
+        postings (array): the sorted tweet ids.
+        target (int): the tweet id to look for.
+        low (int): the first index that can hold target, every value before it is smaller.
+    Returns:
+        int: the index of the first value >= target.
+    """
+    step = 1
+    high = low
+    while high < len(postings) and postings[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+    return bisect.bisect_left(postings, target, low, min(high, len(postings)))
+
+
+def intersect(first, second):
+    """
+    Gets the tweet ids that are in both sorted arrays.
+    Inputs:
+        first (array), second (array): the sorted tweet ids.
+    Returns:
+        array: the sorted tweet ids in both.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    result = array('q')
+    i = 0
+    for tid in first:
+        i = _gallop(second, tid, i)
+        if i == len(second):
+            break
+        if second[i] == tid:
+            result.append(tid)
+    return result
+
+
+def difference(first, second):
+    """
+    Gets the tweet ids of the first sorted array that are not in the second.
+    Inputs:
+        first (array), second (array): the sorted tweet ids.
+    Returns:
+        array: the sorted tweet ids.
+    """
+    result = array('q')
+    i = 0
+    for tid in first:
+        i = _gallop(second, tid, i)
+        if i == len(second) or second[i] != tid:
+            result.append(tid)
+    return result
+
+
+def union(arrays):
+    """
+    Gets the tweet ids that are in any of the sorted arrays.
+    Inputs:
+        arrays (list of array): the sorted tweet ids.
+    Returns:
+        array: the sorted tweet ids, without duplicates.
+    """
+    if len(arrays) == 1:
+        return array('q', arrays[0])
+    result = array('q')
+    for tid in heapq.merge(*arrays):
+        if not result or result[-1] != tid:
+            result.append(tid)
+    return result
+
+
+def parse_query(keywords):
+    """
+    Turns the keywords of the search screen into clauses, see the top of this file for the syntax.
+    Inputs:
+        keywords (list of str): the lowercased keywords, as split on commas by the search screen.
+    Raises:
+        InvalidSearchQueryException: If a word has nothing to search for, or a keyword only has negated words.
+    Returns:
+        list of tuple: one (required, excluded) pair per keyword, where both are lists of terms and a term is the list
+        of tokens that a tweet must all contain ("#tag" for a hashtag).
+    """
+    clauses = []
+    for keyword in keywords:
+        required = []
+        excluded = []
+        for word in keyword.lower().split():
+            negated = word.startswith('-')
+            if negated:
+                word = word[1:]
+            if word.startswith('#'):
+                if word == '#':
+                    raise InvalidSearchQueryException(keyword, "enter a hashtag after '#'")
+                term = [word]
+            else:
+                # a word with punctuation inside ("don't") needs all of its pieces
+                term = WORD.findall(word)
+                if not term:
+                    raise InvalidSearchQueryException(keyword, f"'{word}' has no letters or digits to search for")
+            (excluded if negated else required).append(term)
+        if not required:
+            raise InvalidSearchQueryException(keyword, "at least one word must not start with '-'")
+        clauses.append((required, excluded))
+    return clauses
+
+
+class InvertedIndex:
+    """
+    The tokens of every tweet, mapped to the sorted ids of the tweets that contain them, and the date and time of every
+    tweet to sort the results by. The writer thread adds to it while the interface searches it, so both hold a lock.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty index, see build.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.postings = {}
+        # tid -> its ts, see schema.py
+        self.timestamps = {}
+        # the highest tweet id read from the database, refresh reads the tweets after it
+        self.last_tid = None
+        # tweets added by add_tweet that no refresh has seen committed yet: tid -> tokens
+        self.unconfirmed = {}
+        # True while no tweet has an earlier ts than a tweet with a lower id, which is how the app hands out ids, so the
+        # newest tweets are simply the ones with the highest ids
+        self.timestamps_follow_ids = True
+        self.max_tid = -1
+        self.lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self.last_tid is not None
+
+    def build(self, conn):
+        """
+        Reads every tweet and hashtag mention of the database into the index, replacing what it held.
+        Inputs:
+            conn (sqlite3.Connection): a connection that sees all the tweets (with the partitions attached).
+        Returns:
+            None
+        """
+        postings = {}
+        timestamps = {}
+        for tid, text, ts in conn.execute("SELECT tid, text, ts FROM tweets"):
+            timestamps[tid] = ts
+            for token in tokenize(text):
+                postings.setdefault(token, []).append(tid)
+        for tid, term in conn.execute("SELECT tid, term FROM hashtag_mentions"):
+            if tid in timestamps:
+                postings.setdefault(term.lower(), []).append(tid)
+        in_id_order = [timestamps[tid] for tid in sorted(timestamps)]
+        with self.lock:
+            self.postings = {token: array('q', sorted(set(tids))) for token, tids in postings.items()}
+            self.timestamps = timestamps
+            self.last_tid = self.max_tid = max(timestamps, default=-1)
+            self.unconfirmed = {}
+            self.timestamps_follow_ids = all(earlier <= later for earlier, later in zip(in_id_order, in_id_order[1:]))
+
+    def _add(self, tid, ts, tokens):
+        """
+        Adds one tweet, the caller holds the lock.
+        Inputs:
+            tid (int): the tweet.
+            ts (int): its ts.
+            tokens (set of str): its words and hashtags.
+        Returns:
+            None
+        """
+        self.timestamps[tid] = ts
+        if tid < self.max_tid or (self.max_tid in self.timestamps and ts < self.timestamps[self.max_tid]):
+            self.timestamps_follow_ids = False
+        self.max_tid = max(self.max_tid, tid)
+        for token in tokens:
+            tids = self.postings.setdefault(token, array('q'))
+            # new tweets get the highest id so far, appending keeps the array sorted
+            if not tids or tids[-1] < tid:
+                tids.append(tid)
+                continue
+            i = bisect.bisect_left(tids, tid)
+            if tids[i] != tid:
+                tids.insert(i, tid)
+
+    def _remove(self, tid, tokens):
+        """
+        Takes one tweet out again, the caller holds the lock.
+        Inputs:
+            tid (int): the tweet.
+            tokens (set of str): the tokens it was added with.
+        Returns:
+            None
+        """
+        self.timestamps.pop(tid, None)
+        for token in tokens:
+            tids = self.postings.get(token)
+            if tids:
+                i = bisect.bisect_left(tids, tid)
+                if i < len(tids) and tids[i] == tid:
+                    del tids[i]
+
+    def add_tweet(self, tid, text, ts, hashtags):
+        """
+        Adds a tweet that has just been written. It may still be rolled back, so the next refresh checks that it was
+        committed and takes it out again otherwise.
+        Inputs:
+            tid (int): the id of the tweet.
+            text (str): its text.
+            ts (int): its ts.
+            hashtags (iterable of str): its hashtags, with the leading '#'.
+        Returns:
+            None
+        """
+        tokens = tokenize(text) | {term.lower() for term in hashtags}
+        with self.lock:
+            if not self.built:
+                # the build will read it from the database
+                return
+            self._add(tid, ts, tokens)
+            self.unconfirmed[tid] = tokens
+
+    def refresh(self, conn):
+        """
+        Catches up on the tweets that were committed since the index last read the database, by this app or by any
+        other writer, and drops the tweets added by add_tweet that were never committed.
+        Inputs:
+            conn (sqlite3.Connection): a connection that sees all the tweets.
+        Returns:
+            None
+        """
+        if not self.built:
+            self.build(conn)
+            return
+        with self.lock:
+            last_tid = self.last_tid
+        rows = conn.execute("SELECT tid, text, ts FROM tweets WHERE tid > ?", (last_tid,)).fetchall()
+        tokens = {tid: tokenize(text) for tid, text, ts in rows}
+        for tid, term in conn.execute("SELECT tid, term FROM hashtag_mentions WHERE tid > ?", (last_tid,)):
+            if tid in tokens:
+                tokens[tid].add(term.lower())
+        with self.lock:
+            # what add_tweet put in is read again from the database, if it is there
+            for tid, unconfirmed_tokens in self.unconfirmed.items():
+                self._remove(tid, unconfirmed_tokens)
+            self.unconfirmed = {}
+            for tid, text, ts in rows:
+                self._add(tid, ts, tokens[tid])
+            self.last_tid = max(tokens, default=last_tid)
+
+    def _term(self, term):
+        """
+        Gets the tweets that contain every token of a term, the caller holds the lock.
+        Inputs:
+            term (list of str): the tokens.
+        Returns:
+            array: the sorted tweet ids.
+        """
+        arrays = sorted((self.postings.get(token, array('q')) for token in term), key=len)
+        result = arrays[0]
+        # the shortest array first keeps every intersection as small as it can be
+        for tids in arrays[1:]:
+            if not result:
+                break
+            result = intersect(result, tids)
+        return result
+
+    def match(self, keywords):
+        """
+        Gets the tweets that match a search.
+        Inputs:
+            keywords (list of str): the lowercased keywords, see parse_query.
+        Raises:
+            InvalidSearchQueryException: If the keywords cannot be parsed.
+        Returns:
+            array: the sorted ids of the matching tweets.
+        """
+        clauses = parse_query(keywords)
+        with self.lock:
+            matches = []
+            for required, excluded in clauses:
+                result = self._term([token for term in required for token in term])
+                for term in excluded:
+                    if not result:
+                        break
+                    result = difference(result, self._term(term))
+                matches.append(result)
+            return union(matches)
+
+    def newest_first(self, tids, limit=None, after=None):
+        """
+        Sorts tweets like ORDER BY ts DESC, with the newer tweet id first on a tie.
+        Inputs:
+            tids (array): the sorted tweet ids, as match returns them.
+            limit (int or None): only keep this many, all of them when None.
+            after (tuple or None): a (-ts, -tid) position (see queries.search_position), only the tweets after it are
+            kept.
+        Returns:
+            list of int: the tweet ids.
+        """
+        with self.lock:
+            if after is not None:
+                if self.timestamps_follow_ids:
+                    # the tweets after a position are exactly the ones with a lower id
+                    tids = tids[:bisect.bisect_left(tids, -after[1])]
+                else:
+                    timestamps = self.timestamps
+                    tids = [tid for tid in tids if (-timestamps[tid], -tid) > after]
+            if self.timestamps_follow_ids:
+                return list(reversed(tids if limit is None else tids[max(0, len(tids) - limit):]))
+            # walking the ids from the highest down keeps the newer id first among tweets with the same ts, since both
+            # sorts are stable
+            newest = reversed(tids)
+            if limit is None:
+                return sorted(newest, key=self.timestamps.__getitem__, reverse=True)
+            return heapq.nlargest(limit, newest, key=self.timestamps.__getitem__)
+
+    def search(self, conn, keywords, limit=None, after=None):
+        """
+        Runs a tweet search on the index and reads the rows of the results.
+        Inputs:
+            conn (sqlite3.Connection): a connection that sees all the tweets.
+            keywords (list of str): the lowercased keywords, see parse_query.
+            limit (int or None): the most rows to return, all of them when None.
+            after (tuple or None): a row of the results, only the rows after it are returned.
+        Raises:
+            InvalidSearchQueryException: If the keywords cannot be parsed.
+        Returns:
+            list of tuple: (writer_id, tid, text, tdate, ttime) rows, newest first.
+        """
+        self.refresh(conn)
+        position = None if after is None else queries.search_position(after)
+        tids = self.newest_first(self.match(keywords), limit, position)
+        rows = {}
+        for start in range(0, len(tids), FETCH_BATCH):
+            batch = tids[start:start + FETCH_BATCH]
+            placeholders = ", ".join("?" for tid in batch)
+            query = f"SELECT writer_id, tid, text, tdate, ttime FROM tweets WHERE tid IN ({placeholders})"
+            for row in conn.execute(query, batch):
+                rows[row[1]] = row
+        return [rows[tid] for tid in tids if tid in rows]
+
+
+class IndexedQueries:
+    """
+    Stands in for a queries module in the app, with the tweet search running on an InvertedIndex and new tweets added
+    to the index as they are posted.
+    """
+    SEARCH_HELP = "Enter Keywords (comma-separated), words with spaces must all match, -word excludes"
+
+    def __init__(self, index, base=queries):
+        """
+        Inputs:
+            index (InvertedIndex): the index to search and update.
+            base (module or object): what everything else is delegated to, queries or a ParallelQueries.
+        Returns:
+            None
+        """
+        self.index = index
+        self.base = base
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def search_tweets(self, conn, keywords, limit=None, after=None):
+        """See InvertedIndex.search."""
+        return self.index.search(conn, keywords, limit, after)
+
+    def post_tweet(self, conn, writer_id, text, hashtags, replyto_tid=None, new_tid=None):
+        """See queries.post_tweet, the tweet (or reply) is also added to the index."""
+        tid = self.base.post_tweet(conn, writer_id, text, hashtags, replyto_tid, new_tid)
+        ts = conn.execute("SELECT ts FROM tweets WHERE tid = ?", (tid,)).fetchone()[0]
+        self.index.add_tweet(tid, text, ts, hashtags)
+        return tid
+
+
+def main(argv=None):
+    """
+    Builds the index of a database and runs one search on it.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Search tweets with an inverted index (AND, OR and NOT).")
+    parser.add_argument("database")
+    parser.add_argument("keywords", help="comma-separated keywords, space-separated words are AND'd, -word is NOT")
+    parser.add_argument("--limit", type=int, help="only get the first N results")
+    args = parser.parse_args(argv)
+    keywords = [keyword.lower().strip() for keyword in args.keywords.split(",") if keyword.strip()]
+
+    try:
+        conn = db.open_db(args.database, "read-only", load_extension=False, attach_partitions=True)
+    except (NonexistentDatabaseException, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    try:
+        index = InvertedIndex()
+        start = time.perf_counter()
+        index.build(conn)
+        print(f"indexed {len(index.timestamps)} tweets, {len(index.postings)} tokens in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        start = time.perf_counter()
+        rows = index.search(conn, keywords, args.limit)
+        print(f"{len(rows)} tweets in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for writer_id, tid, text, tdate, ttime in rows[:20]:
+            print(f"  {tid} {tdate} {ttime} user {writer_id}: {text}")
+    except InvalidSearchQueryException as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,545 @@
+# session_trace.py
+# Records what a user does in the app as a session trace, and replays traces without a window to time them against any
+# database. A session trace is a navigation trace of benchmarks.py, one JSON object per line in the order it happened:
+#   {"screen": "tweet_detail", "user_id": 12, "target": 345, "seconds": 4.0}
+# with more kinds of steps than the benchmark generates:
+#   - every screen that is shown (login, signup, main_menu, feed, search_tweets, search_users, user_profile,
+#     user_tweets, tweet_detail, compose_tweet, reply_tweet, list_followers, trending), and the screen that Back,
+#     Back to Main Menu or a reload shows again, with the user or the tweet that it is about as target,
+#   - the searches, {"screen": "tweet_search", "keywords": [...]} and {"screen": "user_search", "keywords": [...],
+#     "fuzzy": false},
+#   - the next page of a scrolling list, {"screen": "load_more", "list": "feed"} (feed, tweets, users or followers),
+#   - the checks of the feed for new tweets, {"screen": "poll"},
+#   - the writes: follow, unfollow, post (with its text and hashtags, and the tweet it replies to as target), retweet
+#     and create_user (a sign up, nothing the user typed is kept).
+# seconds is how long the user stayed before the next step.
+#
+# The app records a trace with --record-trace FILE, its screens report the steps through trace_hooks.py. The replay
+# runs the queries that the screens run for every step, on one connection and in a transaction that is rolled back, so
+# the database is left as it was (a sharded store commits every write, so its writes are skipped). It prints the time
+# of the steps per kind of step, and --report keeps them as JSON; `compare` lists the kinds of step that got slower
+# between two reports, so the same trace can be replayed on two builds of the app or on a database before and after a
+# change to its schema.
+#
+# Usage: python session_trace.py replay database.db trace.jsonl [--repeat 3] [--steps] [--report report.json]
+#        python session_trace.py compare baseline.json current.json [--percentile p90] [--tolerance 1.25]
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import db
+import queries
+import sharded_queries
+import trace_hooks
+import ui_latency
+from compact_rows import FEED_ROW, TWEET_ROW, USER_ROW
+from exceptions import InvalidSearchQueryException, NonexistentDatabaseException
+from fuzzy_search import FuzzyNameIndex
+from paging import KeysetPager
+from sharding import ShardRouter, is_sharded
+
+# the number of hashtags that the trending screen shows, see TrendingScreen.TOP_HASHTAGS
+TOP_HASHTAGS = 10
+
+
+class TraceRecorder:
+    """
+    Writes the steps of a session to a trace file as they happen. A step is written once the next one starts, which
+    is when its seconds are known, and the file is flushed after every line so that a crash keeps the trace.
+    """
+
+    def __init__(self, path, clock=time.monotonic):
+        """
+        Opens the trace, a file that exists is added to.
+        Inputs:
+            path (str): the trace file.
+            clock (function): gets the time in seconds.
+        Returns:
+            None
+        """
+        self.file = open(path, "a")
+        self.clock = clock
+        # the last step and when it started, it is written when the next one starts
+        self.pending = None
+        # the navigations that are running, the steps inside one are part of the screen that it shows
+        self.depth = 0
+
+    def record(self, screen, user_id, target=None, **fields):
+        """
+        Starts a step, and writes the one before it.
+        Inputs:
+            screen (str): the kind of step.
+            user_id (int or None): the user that is logged in, None before the login.
+            target (int or None): the user or the tweet that the step is about.
+            fields: the other fields of the step, they have to be JSON.
+        Returns:
+            None
+        """
+        now = self.clock()
+        self.write_pending(now)
+        step = {"screen": screen, "user_id": user_id, "target": target}
+        step.update(fields)
+        self.pending = (step, now)
+
+    def write_pending(self, now):
+        if self.pending is None:
+            return
+        step, started = self.pending
+        step["seconds"] = round(now - started, 2)
+        self.file.write(json.dumps(step) + "\n")
+        self.file.flush()
+        self.pending = None
+
+    def close(self):
+        """
+        Writes the last step and closes the file.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.write_pending(self.clock())
+        self.file.close()
+
+
+def post_step(writer_id, text, hashtags, replyto_tid=None, new_tid=None):
+    return "post", writer_id, replyto_tid, {"text": text, "hashtags": sorted(hashtags)}
+
+
+def retweet_step(tweet_id, retweeter_id, writer_id, spam=0):
+    return "retweet", retweeter_id, tweet_id, {"writer_id": writer_id}
+
+
+def follow_step(follower_id, followee_id):
+    return "follow", follower_id, followee_id, {}
+
+
+def unfollow_step(follower_id, followee_id):
+    return "unfollow", follower_id, followee_id, {}
+
+
+def create_user_step(name, email, phone, password, new_usr=None):
+    return "create_user", None, None, {}
+
+
+# write function of queries -> the step it is recorded as, made from its arguments without the connection
+WRITE_STEPS = {
+    "post_tweet": post_step,
+    "retweet": retweet_step,
+    "follow_user": follow_step,
+    "unfollow_user": unfollow_step,
+    "create_user": create_user_step,
+}
+
+
+class RecordedWrites:
+    """
+    Stands in for the write queue of the app (or the ShardRouter of a sharded store) and records every write that
+    succeeds as a step. Everything else is passed on to what it wraps.
+    """
+
+    def __init__(self, base):
+        """
+        Inputs:
+            base (WriteQueue or ShardRouter): what the writes are passed on to.
+        Returns:
+            None
+        """
+        self.base = base
+
+    def execute(self, operation, *args, **kwargs):
+        result = self.base.execute(operation, *args, **kwargs)
+        if operation.__name__ in WRITE_STEPS:
+            screen, user_id, target, fields = WRITE_STEPS[operation.__name__](*args, **kwargs)
+            trace_hooks.record(screen, user_id, target, **fields)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+
+def read_trace(path):
+    """
+    Reads a session trace.
+    Inputs:
+        path (str): the JSON-lines file.
+    Raises:
+        ValueError: If a line is not a step of a known kind.
+    Returns:
+        list of dict: the steps.
+    """
+    trace = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            step = json.loads(line)
+            if step.get("screen") not in STEPS or "user_id" not in step:
+                raise ValueError(f"{path}:{number}: not a step of a known kind")
+            trace.append(step)
+    return trace
+
+
+class Replay:
+    """
+    What a replay keeps from one step to the next, like the screens of the app keep it: the lists that can be
+    scrolled further and the mark of the feed that the checks for new tweets start from.
+    """
+
+    def __init__(self, conn, lookups, writes=True):
+        """
+        Inputs:
+            conn (sqlite3.Connection or ShardRouter): the database.
+            lookups (module): queries, or sharded_queries for a ShardRouter.
+            writes (bool): whether the steps that write are run, they are skipped when False.
+        Returns:
+            None
+        """
+        self.conn = conn
+        self.lookups = lookups
+        self.writes = writes
+        # list -> the KeysetPager of the list that a load_more step scrolls
+        self.pagers = {}
+        self.mark = None
+        self.user_names = FuzzyNameIndex(lambda after_usr: lookups.get_user_names(conn, after_usr))
+
+    def show_list(self, name, fetch, shape):
+        """
+        Reads the first page of a list, the one that load_more steps then scroll.
+        Inputs:
+            name (str): the list.
+            fetch (function): called as fetch(after, limit), see KeysetPager.
+            shape (str): the shape of its rows.
+        Returns:
+            None
+        """
+        self.pagers[name] = KeysetPager(fetch, shape)
+        self.pagers[name].load_more()
+
+
+def show_nothing(replay, step):
+    # the screen reads nothing when it is shown
+    pass
+
+
+def show_main_menu(replay, step):
+    replay.lookups.get_user_name(replay.conn, step["user_id"])
+
+
+def show_feed(replay, step):
+    conn, lookups, user_id = replay.conn, replay.lookups, step["user_id"]
+    if not lookups.get_followed_users(conn, user_id):
+        return
+    replay.mark = lookups.get_feed_mark(conn)
+    replay.show_list("feed", lambda after, limit: lookups.load_feed(conn, user_id, limit=limit, after=after),
+                     FEED_ROW)
+
+
+def show_user_profile(replay, step):
+    conn, lookups = replay.conn, replay.lookups
+    if not lookups.get_profile_summary(conn, step["target"]):
+        return
+    lookups.is_following(conn, step["user_id"], step["target"])
+    lookups.get_user_tweets(conn, step["target"])
+
+
+def show_user_tweets(replay, step):
+    conn, lookups = replay.conn, replay.lookups
+    if lookups.get_user_name(conn, step["target"]) is None:
+        return
+    lookups.count_user_tweets(conn, step["target"])
+    lookups.get_follow_counts(conn, step["target"])
+    lookups.is_following(conn, step["user_id"], step["target"])
+    lookups.get_user_tweets(conn, step["target"], limit=3)
+
+
+def show_tweet_detail(replay, step):
+    if replay.lookups.get_tweet(replay.conn, step["target"]):
+        replay.lookups.get_tweet_stats(replay.conn, step["target"], step["user_id"])
+
+
+def show_list_followers(replay, step):
+    conn, lookups, user_id = replay.conn, replay.lookups, step["user_id"]
+    replay.show_list("followers", lambda after, limit: lookups.list_followers(conn, user_id, limit=limit, after=after),
+                     USER_ROW)
+
+
+def show_trending(replay, step):
+    replay.lookups.get_trending_hashtags(replay.conn, TOP_HASHTAGS)
+
+
+def search_tweets(replay, step):
+    conn, lookups, keywords = replay.conn, replay.lookups, step["keywords"]
+    try:
+        replay.show_list("tweets", lambda after, limit: lookups.search_tweets(conn, keywords, limit=limit, after=after),
+                         TWEET_ROW)
+    except InvalidSearchQueryException:
+        # the app turns it into a warning
+        pass
+
+
+def search_users(replay, step):
+    conn, lookups, keywords = replay.conn, replay.lookups, step["keywords"]
+    if step.get("fuzzy"):
+        replay.user_names.search(keywords, lookups.search_users(conn, keywords))
+        replay.pagers.pop("users", None)
+    else:
+        replay.show_list("users", lambda after, limit: lookups.search_users(conn, keywords, limit=limit, after=after),
+                         USER_ROW)
+
+
+def load_more(replay, step):
+    pager = replay.pagers.get(step["list"])
+    if pager is not None:
+        pager.load_more()
+
+
+def poll(replay, step):
+    if replay.mark is not None:
+        items, replay.mark = replay.lookups.load_new_feed_items(replay.conn, step["user_id"], replay.mark)
+
+
+def follow(replay, step):
+    replay.lookups.follow_user(replay.conn, step["user_id"], step["target"])
+
+
+def unfollow(replay, step):
+    replay.lookups.unfollow_user(replay.conn, step["user_id"], step["target"])
+
+
+def post(replay, step):
+    # the traces that benchmarks.py generates have no text
+    replay.lookups.post_tweet(replay.conn, step["user_id"], step.get("text", "replayed tweet"),
+                              step.get("hashtags", []), replyto_tid=step["target"])
+
+
+def retweet(replay, step):
+    writer_id = step.get("writer_id")
+    if writer_id is None:
+        tweet = replay.lookups.get_tweet(replay.conn, step["target"])
+        writer_id = tweet[3] if tweet else None
+    replay.lookups.retweet(replay.conn, step["target"], step["user_id"], writer_id)
+
+
+def create_user(replay, step):
+    replay.lookups.create_user(replay.conn, "Replayed User", "replayed@example.com", "555-0100", "replayed")
+
+
+# kind of step -> what the app asks of the database for it
+STEPS = {
+    "login": show_nothing,
+    "signup": show_nothing,
+    "main_menu": show_main_menu,
+    "feed": show_feed,
+    "search_tweets": show_nothing,
+    "search_users": show_nothing,
+    "user_profile": show_user_profile,
+    "user_tweets": show_user_tweets,
+    "tweet_detail": show_tweet_detail,
+    "compose_tweet": show_nothing,
+    "reply_tweet": show_nothing,
+    "list_followers": show_list_followers,
+    "trending": show_trending,
+    "tweet_search": search_tweets,
+    "user_search": search_users,
+    "load_more": load_more,
+    "poll": poll,
+    "follow": follow,
+    "unfollow": unfollow,
+    "post": post,
+    "retweet": retweet,
+    "create_user": create_user,
+}
+WRITES = {"follow", "unfollow", "post", "retweet", "create_user"}
+
+
+def replay_trace(conn, lookups, trace, writes=True, clock=time.perf_counter):
+    """
+    Runs every step of a trace once, then rolls back what the steps wrote.
+    Inputs:
+        conn (sqlite3.Connection or ShardRouter): the database.
+        lookups (module): queries, or sharded_queries for a ShardRouter.
+        trace (list of dict): the steps.
+        writes (bool): whether the steps that write are run.
+        clock (function): gets the time in seconds.
+    Returns:
+        list of float or None: the seconds of every step, None for a step that was skipped or could not be run on
+        this database.
+    """
+    replay = Replay(conn, lookups, writes)
+    times = []
+    try:
+        for step in trace:
+            if step["screen"] in WRITES and not writes:
+                times.append(None)
+                continue
+            start = clock()
+            try:
+                STEPS[step["screen"]](replay, step)
+            except sqlite3.IntegrityError:
+                # a recorded trace can follow someone that this database already has as followed
+                times.append(None)
+                continue
+            times.append(clock() - start)
+    finally:
+        if writes:
+            conn.rollback()
+    return times
+
+
+def summarize(trace, times):
+    """
+    Summarises the times of the steps per kind of step.
+    Inputs:
+        trace (list of dict): the steps.
+        times (list of float or None): their seconds, see replay_trace.
+    Returns:
+        dict: kind -> {"count": n, "total": {"p50": ms, "p90": ms, "p99": ms, "max": ms}, "sum": ms}, in the shape
+        that ui_latency.compare reads.
+    """
+    kinds = {}
+    for step, seconds in zip(trace, times):
+        if seconds is not None:
+            kinds.setdefault(step["screen"], []).append(seconds * 1000)
+    result = {}
+    for kind, values in sorted(kinds.items()):
+        values.sort()
+        total = {label: round(ui_latency.percentile(values, percent), 3) for label, percent in ui_latency.PERCENTILES}
+        total["max"] = round(values[-1], 3)
+        result[kind] = {"count": len(values), "total": total, "sum": round(sum(values), 3)}
+    return result
+
+
+def format_summary(summary):
+    """
+    Formats a summary as a table.
+    Inputs:
+        summary (dict): see summarize.
+    Returns:
+        str: the table.
+    """
+    labels = [label for label, percent in ui_latency.PERCENTILES] + ["max"]
+    lines = [f"{'step':<16}{'count':>7}" + "".join(f"{label + ' ms':>10}" for label in labels) + f"{'sum ms':>11}"]
+    for kind, entry in summary.items():
+        lines.append(f"{kind:<16}{entry['count']:>7}" + "".join(f"{entry['total'][label]:>10.3f}" for label in labels)
+                     + f"{entry['sum']:>11.1f}")
+    return "\n".join(lines)
+
+
+def open_database(path):
+    """
+    Opens a database or a sharded store for a replay.
+    Inputs:
+        path (str): the database file or the store directory.
+    Raises:
+        NonexistentDatabaseException: If there is no database at path.
+    Returns:
+        tuple: (connection or ShardRouter, the queries module for it, whether writes can be rolled back)
+    """
+    if is_sharded(path):
+        return ShardRouter(path, load_extension=False), sharded_queries, False
+    return db.open_db(path, load_extension=False), queries, True
+
+
+def replay_command(args):
+    """
+    Replays a trace, prints its times and writes the report.
+    Inputs:
+        args (argparse.Namespace): the parsed command line.
+    Returns:
+        int: the exit code.
+    """
+    trace = read_trace(args.trace)
+    conn, lookups, writes = open_database(args.database)
+    try:
+        # one run to warm up the page cache of the database, then the fastest time of every step over --repeat runs
+        replay_trace(conn, lookups, trace, writes)
+        times = replay_trace(conn, lookups, trace, writes)
+        for i in range(args.repeat - 1):
+            times = [None if best is None or again is None else min(best, again)
+                     for best, again in zip(times, replay_trace(conn, lookups, trace, writes))]
+    finally:
+        conn.close()
+
+    if args.steps:
+        for number, (step, seconds) in enumerate(zip(trace, times), start=1):
+            shown = "skipped" if seconds is None else f"{seconds * 1000:.3f} ms"
+            print(f"{number:>6}  {step['screen']:<16}{shown:>14}  user {step['user_id']}  target {step['target']}")
+    summary = summarize(trace, times)
+    print(format_summary(summary))
+    skipped = sum(seconds is None for seconds in times)
+    print(f"{len(trace)} steps, {sum(seconds for seconds in times if seconds is not None) * 1000:.1f} ms"
+          + (f", {skipped} skipped" if skipped else ""))
+    if args.report:
+        report = {"database": args.database, "trace": args.trace, "summary": summary,
+                  "steps": [[step["screen"], None if seconds is None else round(seconds * 1000, 3)]
+                            for step, seconds in zip(trace, times)]}
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def compare_command(args):
+    """
+    Compares two replay reports.
+    Inputs:
+        args (argparse.Namespace): the parsed command line.
+    Returns:
+        int: the exit code, 1 when a kind of step got slower.
+    """
+    summaries = []
+    for path in (args.baseline, args.current):
+        with open(path) as f:
+            summaries.append(json.load(f)["summary"])
+    slower = ui_latency.compare(summaries[0], summaries[1], "total", args.percentile, args.tolerance, args.floor_ms)
+    for kind, before, after in slower:
+        print(f"{kind}: {args.percentile} {before:.3f} ms -> {after:.3f} ms")
+    if not slower:
+        print("No step got slower.")
+    return 1 if slower else 0
+
+
+def main(argv=None):
+    """
+    Replays a trace, or compares two replays.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Replay the session traces that the app records, and compare them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="time the steps of a trace on a database")
+    replay_parser.add_argument("database", help="the database file or sharded store, it is left as it was")
+    replay_parser.add_argument("trace", help="the session trace")
+    replay_parser.add_argument("--repeat", type=int, default=3, help="runs of the trace, the fastest of each step counts")
+    replay_parser.add_argument("--steps", action="store_true", help="also print the time of every step")
+    replay_parser.add_argument("--report", help="write the times to this JSON file")
+    compare_parser = commands.add_parser("compare", help="list the kinds of step that got slower")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--percentile", choices=[label for label, percent in ui_latency.PERCENTILES] + ["max"],
+                                default="p90")
+    compare_parser.add_argument("--tolerance", type=float, default=1.25)
+    compare_parser.add_argument("--floor-ms", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.command == "replay" and args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    paths = [args.trace] if args.command == "replay" else [args.baseline, args.current]
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"Error: File does not exist: {path}", file=sys.stderr)
+            return 1
+    try:
+        return replay_command(args) if args.command == "replay" else compare_command(args)
+    except (NonexistentDatabaseException, ValueError, KeyError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
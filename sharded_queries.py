@@ -0,0 +1,365 @@
+# sharded_queries.py
+# The functions of queries for a sharded store (see sharding.py). Every function has the same name, arguments and
+# results as its counterpart in queries, except that it takes a ShardRouter where queries takes a connection, so the
+# screens can use either module. Lookups of one user go to the shard of that user, everything else runs on the shards
+# at once and the results are merged in the order the single-database query would have returned them.
+import heapq
+import itertools
+
+import queries
+import schema
+
+# pure functions that do not touch the database
+extract_hashtags = queries.extract_hashtags
+SEARCH_HELP = queries.SEARCH_HELP
+
+
+def authenticate(router, user_id, password):
+    """See queries.authenticate."""
+    shard = router.shard_of(user_id)
+    return None if shard is None else router.read(shard, queries.authenticate, user_id, password)
+
+
+def get_user_name(router, user_id):
+    """See queries.get_user_name."""
+    shard = router.shard_of(user_id)
+    return None if shard is None else router.read(shard, queries.get_user_name, user_id)
+
+
+def create_user(router, name, email, phone, password):
+    """
+    See queries.create_user. The id comes from the directory and the user is placed on a shard before the row is
+    written.
+    """
+    new_usr = router.next_id("usr")
+    shard = router.place_user(new_usr)
+    return router.write(shard, queries.create_user, name, email, phone, password, new_usr=new_usr)
+
+
+def get_followed_users(router, user_id):
+    """See queries.get_followed_users, a user's follows are on their own shard."""
+    shard = router.shard_of(user_id)
+    return [] if shard is None else router.read(shard, queries.get_followed_users, user_id)
+
+
+def _feed_rows(conn, user_ids, limit=None, after=None):
+    """
+    Gets the tweets and the retweets of some users that live on the shard of conn, each in the order of the feed. The
+    text of a retweeted tweet is on the shard of its writer, so retweets come back without it.
+    Inputs:
+        conn (sqlite3.Connection): a shard.
+        user_ids (list of int): the users.
+        limit (int or None): the most tweets and the most retweets to return, all of them when None.
+        after (tuple or None): a row of the feed, only the rows that come after it are returned.
+    Returns:
+        tuple: (tweets as (tid, text, tdate, ttime, writer_id, name, status) rows,
+                retweets as (tid, rdate, rtime, retweeter_id, name, writer_id) rows, rtime coming from the ts)
+    """
+    placeholders = ", ".join("?" for user_id in user_ids)
+    tweet_condition, retweet_condition, after_parameters = "", "", []
+    if after is not None:
+        negated_ts, tid, writer_id, status = queries.feed_position(after)
+        tweet_condition = "AND (t.ts < ? OR (t.ts = ? AND (t.tid, t.writer_id, 'tweeted') > (?, ?, ?)))"
+        retweet_condition = "AND (rt.ts < ? OR (rt.ts = ? AND (rt.tid, rt.retweeter_id, 'retweeted') > (?, ?, ?)))"
+        after_parameters = [-negated_ts, -negated_ts, tid, writer_id, status]
+    # a negative LIMIT means no limit in SQLite
+    limit = -1 if limit is None else limit
+    tweets = conn.execute(f"""
+        SELECT t.tid, t.text, t.tdate, t.ttime, t.writer_id, u.name, 'tweeted' AS status
+        FROM tweets t
+        JOIN users u ON t.writer_id = u.usr
+        WHERE t.writer_id IN ({placeholders}) {tweet_condition}
+        ORDER BY t.ts DESC, t.tid, t.writer_id
+        LIMIT ?
+    """, list(user_ids) + after_parameters + [limit]).fetchall()
+    retweets = conn.execute(f"""
+        SELECT rt.tid, rt.rdate, TIME(rt.ts, 'unixepoch'), rt.retweeter_id, u.name, rt.writer_id
+        FROM retweets rt
+        JOIN users u ON rt.retweeter_id = u.usr
+        WHERE rt.retweeter_id IN ({placeholders}) {retweet_condition}
+        ORDER BY rt.ts DESC, rt.tid, rt.retweeter_id
+        LIMIT ?
+    """, list(user_ids) + after_parameters + [limit]).fetchall()
+    return tweets, retweets
+
+
+def _tweet_texts(conn, tweet_ids):
+    """
+    Gets the text of some tweets that live on the shard of conn.
+    Inputs:
+        conn (sqlite3.Connection): a shard.
+        tweet_ids (list of int): the tweets.
+    Returns:
+        dict: tid -> text.
+    """
+    placeholders = ", ".join("?" for tweet_id in tweet_ids)
+    return dict(conn.execute(f"SELECT tid, text FROM tweets WHERE tid IN ({placeholders})", tweet_ids).fetchall())
+
+
+def load_feed(router, user_id, limit=None, after=None):
+    """
+    See queries.load_feed. The followed users are grouped by shard and each shard returns the first limit of their
+    tweets and of their retweets after the given row, then the text of every retweeted tweet is fetched from the shard
+    of its writer and the first limit rows of all of them make the page. Retweets of tweets that no longer exist are
+    only dropped once their text is looked up, so when a shard cut its retweets above the end of the page, the shards
+    are read again with twice the limit.
+    """
+    groups = router.group_by_shard(get_followed_users(router, user_id))
+    if not groups:
+        return []
+    shards = list(groups)
+    shard_limit = limit
+    while True:
+        results = list(router.executor.map(
+            lambda shard: router.read(shard, _feed_rows, groups[shard], shard_limit, after), shards))
+
+        rows = set()
+        retweets = []
+        for tweets, shard_retweets in results:
+            rows.update(tweets)
+            retweets.extend(shard_retweets)
+        _add_retweets(router, rows, retweets)
+        feed = queries.order_feed(rows)[:limit]
+
+        # where the retweets of every shard that had more than the limit were cut, in the order of the feed
+        cuts = [(-schema.timestamp_of_text(rdate, rtime), tid, retweeter_id, 'retweeted') for
+                tweets, shard_retweets in results if limit is not None and len(shard_retweets) == shard_limit
+                for tid, rdate, rtime, retweeter_id, name, writer_id in shard_retweets[-1:]]
+        if not cuts or (len(feed) == limit and queries.feed_position(feed[-1]) <= min(cuts)):
+            break
+        shard_limit *= 2
+    return [(tid, text, str(tdate), str(ttime), writer_id, name, status) for
+            tid, text, tdate, ttime, writer_id, name, status in feed]
+
+
+def _add_retweets(router, rows, retweets):
+    """
+    Fetches the text of retweeted tweets from the shards of their writers and adds the retweets to feed rows.
+    Inputs:
+        router (ShardRouter): the store.
+        rows (set of tuple): the feed rows, the retweets are added to it.
+        retweets (list of tuple): (tid, rdate, rtime, retweeter_id, name, writer_id) rows, see _feed_rows.
+    Returns:
+        None
+    """
+    # like the JOIN of the single-database query, retweets of tweets that no longer exist are dropped
+    texts = {}
+    wanted = router.group_by_shard({retweet[5] for retweet in retweets})
+    for shard, writer_ids in wanted.items():
+        writer_ids = set(writer_ids)
+        tweet_ids = list({retweet[0] for retweet in retweets if retweet[5] in writer_ids})
+        texts.update(router.read(shard, _tweet_texts, tweet_ids))
+    # the writer_id of a retweet is only what the retweeter was shown, the tweet can be on another shard
+    missing = list({retweet[0] for retweet in retweets} - set(texts))
+    if missing:
+        for shard_texts in router.scatter(_tweet_texts, missing):
+            texts.update(shard_texts)
+    for tid, rdate, rtime, retweeter_id, name, writer_id in retweets:
+        if tid in texts:
+            rows.add((tid, texts[tid], rdate, rtime, retweeter_id, name, 'retweeted'))
+
+
+def _new_feed_rows(conn, user_ids, mark):
+    """
+    Gets the tweets and the retweets of some users that were written to the shard of conn since a mark was taken.
+    Inputs:
+        conn (sqlite3.Connection): a shard.
+        user_ids (list of int): the users, can be empty.
+        mark (tuple): the mark of the shard, see queries.get_feed_mark.
+    Returns:
+        tuple: (tweets and retweets like _feed_rows returns them, the new mark of the shard)
+    """
+    new_mark = queries.get_feed_mark(conn)
+    if not user_ids:
+        return [], [], new_mark
+    placeholders = ", ".join("?" for user_id in user_ids)
+    tweets = conn.execute(f"""
+        SELECT t.tid, t.text, t.tdate, t.ttime, t.writer_id, u.name, 'tweeted' AS status
+        FROM main.tweets t
+        JOIN users u ON t.writer_id = u.usr
+        WHERE t.tid > ? AND t.tid <= ? AND t.writer_id IN ({placeholders})
+    """, [mark[0], new_mark[0]] + user_ids).fetchall()
+    retweets = conn.execute(f"""
+        SELECT rt.tid, rt.rdate, TIME(rt.ts, 'unixepoch'), rt.retweeter_id, u.name, rt.writer_id
+        FROM main.retweets rt
+        JOIN users u ON rt.retweeter_id = u.usr
+        WHERE rt.rowid > ? AND rt.rowid <= ? AND rt.retweeter_id IN ({placeholders})
+    """, [mark[1], new_mark[1]] + user_ids).fetchall()
+    return tweets, retweets, new_mark
+
+
+def get_feed_mark(router):
+    """See queries.get_feed_mark, the mark holds the mark of every shard."""
+    return tuple(router.scatter(queries.get_feed_mark))
+
+
+def load_new_feed_items(router, user_id, mark):
+    """See queries.load_new_feed_items, every shard is read from its own mark."""
+    groups = router.group_by_shard(get_followed_users(router, user_id))
+    results = list(router.executor.map(
+        lambda shard: router.read(shard, _new_feed_rows, groups.get(shard, []), mark[shard]), range(router.shards)))
+    rows = set()
+    retweets = []
+    for tweets, shard_retweets, shard_mark in results:
+        rows.update(tweets)
+        retweets.extend(shard_retweets)
+    _add_retweets(router, rows, retweets)
+    feed = [(tid, text, str(tdate), str(ttime), writer_id, name, status) for
+            tid, text, tdate, ttime, writer_id, name, status in queries.order_feed(rows)]
+    return feed, tuple(shard_mark for tweets, shard_retweets, shard_mark in results)
+
+
+def search_tweets(router, keywords, limit=None, after=None):
+    """
+    See queries.search_tweets. A tweet and its hashtag mentions are on the same shard, so every shard runs the whole
+    search and the newest-first results are merged.
+    """
+    results = router.scatter(queries.search_tweets, keywords, limit, after)
+    merged = heapq.merge(*results, key=queries.search_position)
+    return list(itertools.islice(merged, limit))
+
+
+def search_users(router, keywords, limit=None, after=None):
+    """See queries.search_users, the results of the shards are merged on LENGTH(name), name, usr."""
+    results = router.scatter(queries.search_users, keywords, limit, after)
+    return list(itertools.islice(heapq.merge(*results, key=queries.user_search_position), limit))
+
+
+def get_user_names(router, after_usr=-1):
+    """See queries.get_user_names, every user is on one shard."""
+    return list(heapq.merge(*router.scatter(queries.get_user_names, after_usr)))
+
+
+def get_tweet(router, tweet_id):
+    """See queries.get_tweet, the tweet is looked up by primary key on every shard."""
+    for tweet in router.scatter(queries.get_tweet, tweet_id):
+        if tweet is not None:
+            return tweet
+    return None
+
+
+def _retweet_and_reply_counts(conn, tweet_id):
+    """
+    Counts the retweets, spam retweets and replies of a tweet that are on the shard of conn.
+    Inputs:
+        conn (sqlite3.Connection): a shard.
+        tweet_id (int): the tweet.
+    Returns:
+        tuple: (num_retweets, num_retweet_spams, num_replies)
+    """
+    return conn.execute("""
+        SELECT (SELECT COUNT(*) FROM retweets WHERE tid = ?),
+               (SELECT COUNT(*) FROM retweets WHERE tid = ? AND spam = 1),
+               (SELECT COUNT(*) FROM tweets WHERE replyto_tid = ?)
+    """, (tweet_id, tweet_id, tweet_id)).fetchone()
+
+
+def get_tweet_stats(router, tweet_id, user_id):
+    """See queries.get_tweet_stats, retweets and replies are made by users on every shard so they are summed."""
+    shard = router.shard_of(user_id)
+    is_retweet = shard is not None and router.read(shard, queries.get_tweet_stats, tweet_id, user_id)[0]
+    counts = router.scatter(_retweet_and_reply_counts, tweet_id)
+    num_retweets, num_retweet_spams, num_replies = (sum(column) for column in zip(*counts))
+    return is_retweet, num_retweets, num_retweet_spams, num_replies
+
+
+def _count_followers(conn, user_id):
+    """
+    Counts the followers of a user that are on the shard of conn.
+    Inputs:
+        conn (sqlite3.Connection): a shard.
+        user_id (int): the followed user.
+    Returns:
+        int: the number of followers.
+    """
+    return conn.execute("SELECT COUNT(*) FROM follows WHERE flwee = ?", (user_id,)).fetchone()[0]
+
+
+def get_follow_counts(router, user_id):
+    """See queries.get_follow_counts, followers can be on any shard."""
+    shard = router.shard_of(user_id)
+    num_following = 0 if shard is None else router.read(shard, queries.get_follow_counts, user_id)[0]
+    return num_following, sum(router.scatter(_count_followers, user_id))
+
+
+def get_profile_summary(router, user_id):
+    """See queries.get_profile_summary, only the followers are counted on every shard."""
+    shard = router.shard_of(user_id)
+    summary = None if shard is None else router.read(shard, queries.get_profile_summary, user_id)
+    if summary is None:
+        return None
+    name, num_tweets, num_following, local_followers = summary
+    return name, num_tweets, num_following, get_follow_counts(router, user_id)[1]
+
+
+def is_following(router, follower_id, followee_id):
+    """See queries.is_following, the follow is on the shard of the follower."""
+    shard = router.shard_of(follower_id)
+    return shard is not None and router.read(shard, queries.is_following, follower_id, followee_id)
+
+
+def get_user_tweets(router, user_id, limit=None):
+    """See queries.get_user_tweets."""
+    shard = router.shard_of(user_id)
+    return [] if shard is None else router.read(shard, queries.get_user_tweets, user_id, limit)
+
+
+def count_user_tweets(router, user_id):
+    """See queries.count_user_tweets."""
+    shard = router.shard_of(user_id)
+    return 0 if shard is None else router.read(shard, queries.count_user_tweets, user_id)
+
+
+def list_followers(router, user_id, limit=None, after=None):
+    """See queries.list_followers, each follower is on the same shard as their follow so the shards are merged."""
+    results = router.scatter(queries.list_followers, user_id, limit, after)
+    return list(itertools.islice(heapq.merge(*results, key=queries.follower_position), limit))
+
+
+def get_hashtag_counts(router, after_tid=-1):
+    """See queries.get_hashtag_counts, the counts of the shards are added up."""
+    totals = {}
+    for rows in router.scatter(queries.get_hashtag_counts, after_tid):
+        for term, mentions, last_tid in rows:
+            total_mentions, total_last_tid = totals.get(term, (0, last_tid))
+            totals[term] = (total_mentions + mentions, max(total_last_tid, last_tid))
+    return [(term, mentions, last_tid) for term, (mentions, last_tid) in totals.items()]
+
+
+def get_trending_hashtags(router, limit=10, now=None):
+    """
+    See queries.get_trending_hashtags. Every shard counts the mentions of its own writers, so the scores and counts of
+    the shards are added up. A term only counts on the shards where it is among the top few, which can leave out a
+    term that is spread thinly over many shards.
+    """
+    totals = {}
+    for rows in router.scatter(queries.get_trending_hashtags, limit * 4, now):
+        for term, score, this_hour, today in rows:
+            total = totals.get(term, (0.0, 0, 0))
+            totals[term] = (total[0] + score, total[1] + this_hour, total[2] + today)
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+    return [(term, score, this_hour, today) for term, (score, this_hour, today) in ranked]
+
+
+def post_tweet(router, writer_id, text, hashtags, replyto_tid=None):
+    """See queries.post_tweet, the id comes from the directory and the tweet goes to the shard of its writer."""
+    shard = router.shard_of_existing(writer_id)
+    return router.write(shard, queries.post_tweet, writer_id, text, hashtags, replyto_tid,
+                        new_tid=router.next_id("tid"))
+
+
+def retweet(router, tweet_id, retweeter_id, writer_id, spam=0):
+    """See queries.retweet, the retweet goes to the shard of the retweeter."""
+    return router.write(router.shard_of_existing(retweeter_id), queries.retweet, tweet_id, retweeter_id, writer_id,
+                        spam)
+
+
+def follow_user(router, follower_id, followee_id):
+    """See queries.follow_user, the follow goes to the shard of the follower."""
+    router.shard_of_existing(followee_id)
+    return router.write(router.shard_of_existing(follower_id), queries.follow_user, follower_id, followee_id)
+
+
+def unfollow_user(router, follower_id, followee_id):
+    """See queries.unfollow_user."""
+    return router.write(router.shard_of_existing(follower_id), queries.unfollow_user, follower_id, followee_id)
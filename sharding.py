@@ -0,0 +1,599 @@
+# sharding.py
+# An optional storage mode that splits the data over several SQLite files (shards) so that each one has its own writer.
+# Every user lives on one shard together with everything they own: their users row, the tweets they wrote and the
+# hashtag mentions of those tweets, their retweets, the follows they made, and their lists. A small directory database
+# next to the shards records which shard each user is on and hands out the user and tweet ids, which have to be unique
+# across all the shards.
+#
+# A sharded store is a directory:
+#     directory.db    shard_config, user_shards (usr -> shard) and id_sequences
+#     shard_0.db ...  the usual tables, holding only the rows of the users placed on that shard
+#
+# Rows on one shard can point to rows on another (a follow of a user on a different shard, a retweet of their tweet),
+# so SQLite cannot check foreign keys across shards and the writers run with foreign keys off.
+#
+# Usage: python sharding.py create STORE_DIR --shards 4 [--from prj-sample.db]
+#        python sharding.py status STORE_DIR
+#        python sharding.py rebalance STORE_DIR [--add-shards N] [--move USER --to SHARD] [--dry-run]
+#
+# Users should only be moved while nothing else has the store open: the routers of running programs remember where
+# every user is.
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import schema
+from exceptions import NonexistentDatabaseException
+from write_queue import WriteQueue
+
+DIRECTORY_FILE = "directory.db"
+
+DIRECTORY_TABLES = [
+    "CREATE TABLE IF NOT EXISTS shard_config (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS user_shards (usr INTEGER PRIMARY KEY, shard INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)",
+]
+
+# the rows that belong to the users listed in temp.moving, per table. {src} is the schema the rows are read from.
+# The tables are in the order their rows can be deleted in, hashtag_mentions has to go before the tweets it is found by
+USER_ROWS = [
+    ("hashtag_mentions", "tid IN (SELECT tid FROM {src}.tweets WHERE writer_id IN (SELECT usr FROM temp.moving))"),
+    ("include", "owner_id IN (SELECT usr FROM temp.moving)"),
+    ("lists", "owner_id IN (SELECT usr FROM temp.moving)"),
+    ("follows", "flwer IN (SELECT usr FROM temp.moving)"),
+    ("retweets", "retweeter_id IN (SELECT usr FROM temp.moving)"),
+    ("tweets", "writer_id IN (SELECT usr FROM temp.moving)"),
+    ("users", "usr IN (SELECT usr FROM temp.moving)"),
+]
+
+
+def shard_path(store, shard):
+    """
+    Gets the file of a shard.
+    Inputs:
+        store (str): the directory of the sharded store.
+        shard (int): the number of the shard.
+    Returns:
+        str: the path of the shard file.
+    """
+    return os.path.join(store, f"shard_{shard}.db")
+
+
+def is_sharded(path):
+    """
+    Tells a sharded store apart from a single database file.
+    Inputs:
+        path (str): the path given on the command line.
+    Returns:
+        bool: True if path is a directory with a shard directory database in it.
+    """
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, DIRECTORY_FILE))
+
+
+def open_directory(store):
+    """
+    Opens the directory database of a store. Its transactions are tiny, so they are managed by hand.
+    Inputs:
+        store (str): the directory of the sharded store.
+    Returns:
+        sqlite3.Connection: the connection.
+    """
+    conn = sqlite3.connect(os.path.join(store, DIRECTORY_FILE), isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL").fetchone()
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def shard_count(directory):
+    """
+    Reads the number of shards of a store.
+    Inputs:
+        directory (sqlite3.Connection): the directory database.
+    Returns:
+        int: the number of shards.
+    """
+    return directory.execute("SELECT value FROM shard_config WHERE key = 'shards'").fetchone()[0]
+
+
+class ShardRouter:
+    """
+    Takes the place of the single connection for a sharded store: it finds the shard of a user, runs a function on the
+    shards that are needed, and hands out ids. Every shard has one reader connection and its own WriteQueue, and a
+    thread pool runs the reads of a scatter-gather on all the shards at once. The functions of sharded_queries take a
+    router where the functions of queries take a connection.
+    """
+
+    def __init__(self, store, profile=db.DEFAULT_PROFILE, load_extension=True):
+        """
+        Opens the directory, a reader and a writer for every shard.
+        Inputs:
+            store (str): the directory of the sharded store.
+            profile (str): the connection profile of the shard connections.
+            load_extension (bool): whether to load the regexp extension into the readers.
+        Raises:
+            NonexistentDatabaseException: If store is not a sharded store or a shard file is missing.
+        Returns:
+            None
+        """
+        if not is_sharded(store):
+            raise NonexistentDatabaseException(store)
+        self.store = store
+        self.directory = open_directory(store)
+        self.directory_lock = threading.Lock()
+        self.shards = shard_count(self.directory)
+        # usr -> shard, users only move when the store is closed so the answers can be kept
+        self.placement = {}
+        self.readers = []
+        self.reader_locks = []
+        self.write_queues = []
+        for shard in range(self.shards):
+            path = shard_path(store, shard)
+            self.readers.append(db.open_db(path, profile, load_extension=load_extension, check_same_thread=False))
+            self.reader_locks.append(threading.Lock())
+            writer = db.open_db(path, profile, load_extension=False, check_same_thread=False)
+            # rows refer to users and tweets on other shards, which this file cannot see
+            writer.execute("PRAGMA foreign_keys = OFF")
+            self.write_queues.append(WriteQueue(writer))
+        self.executor = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix="shard")
+
+    def close(self):
+        """
+        Commits the pending writes and closes every connection.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=True)
+        for write_queue in self.write_queues:
+            write_queue.close()
+        for conn in self.readers:
+            conn.close()
+        self.directory.close()
+
+    def shard_of(self, user_id):
+        """
+        Finds the shard of a user.
+        Inputs:
+            user_id (int or str): the id of the user.
+        Returns:
+            int or None: the shard, or None if there is no such user.
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        if user_id not in self.placement:
+            with self.directory_lock:
+                row = self.directory.execute("SELECT shard FROM user_shards WHERE usr = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            self.placement[user_id] = row[0]
+        return self.placement[user_id]
+
+    def shard_of_existing(self, user_id):
+        """
+        Finds the shard of a user that a write is about to touch.
+        Inputs:
+            user_id (int or str): the id of the user.
+        Raises:
+            sqlite3.IntegrityError: If there is no such user, like the foreign key check of a single database would.
+        Returns:
+            int: the shard.
+        """
+        shard = self.shard_of(user_id)
+        if shard is None:
+            raise sqlite3.IntegrityError(f"FOREIGN KEY constraint failed: no user {user_id}")
+        return shard
+
+    def group_by_shard(self, user_ids):
+        """
+        Splits a list of users by the shard they are on, unknown users are left out.
+        Inputs:
+            user_ids (iterable of int): the ids of the users.
+        Returns:
+            dict: shard -> list of user ids.
+        """
+        groups = {}
+        for user_id in user_ids:
+            shard = self.shard_of(user_id)
+            if shard is not None:
+                groups.setdefault(shard, []).append(user_id)
+        return groups
+
+    def next_id(self, name):
+        """
+        Hands out the next user or tweet id. The directory is shared by every process using the store, so the counter
+        is read and bumped in one immediate transaction.
+        Inputs:
+            name (str): "usr" or "tid".
+        Returns:
+            int: an id that no shard has used yet.
+        """
+        with self.directory_lock:
+            self.directory.execute("BEGIN IMMEDIATE")
+            try:
+                next_id = self.directory.execute("UPDATE id_sequences SET next_id = next_id + 1 WHERE name = ? "
+                                                 "RETURNING next_id - 1", (name,)).fetchone()[0]
+                self.directory.execute("COMMIT")
+            except BaseException:
+                self.directory.execute("ROLLBACK")
+                raise
+        return next_id
+
+    def place_user(self, user_id):
+        """
+        Picks the shard of a new user and records it.
+        Inputs:
+            user_id (int): the id of the new user, see next_id.
+        Returns:
+            int: the shard.
+        """
+        shard = user_id % self.shards
+        with self.directory_lock:
+            self.directory.execute("INSERT INTO user_shards (usr, shard) VALUES (?, ?)", (user_id, shard))
+        self.placement[user_id] = shard
+        return shard
+
+    def read(self, shard, function, *args):
+        """
+        Runs a read function from queries on one shard.
+        Inputs:
+            shard (int): the shard.
+            function (function): called as function(conn, *args).
+        Returns:
+            object: whatever the function returned.
+        """
+        with self.reader_locks[shard]:
+            return function(self.readers[shard], *args)
+
+    def scatter(self, function, *args, shards=None):
+        """
+        Runs a read function from queries on several shards at once.
+        Inputs:
+            function (function): called as function(conn, *args) on every shard.
+            shards (iterable of int or None): the shards to run it on, all of them when None.
+        Returns:
+            list: the result of every shard, in the order of shards.
+        """
+        shards = list(range(self.shards)) if shards is None else list(shards)
+        if len(shards) == 1:
+            return [self.read(shards[0], function, *args)]
+        return list(self.executor.map(lambda shard: self.read(shard, function, *args), shards))
+
+    def write(self, shard, operation, *args, **kwargs):
+        """
+        Runs a write function from queries through the write queue of one shard and waits for its commit.
+        Inputs:
+            shard (int): the shard.
+            operation (function): called as operation(conn, *args, **kwargs).
+        Returns:
+            object: whatever the operation returned.
+        """
+        return self.write_queues[shard].execute(operation, *args, **kwargs)
+
+    def execute(self, operation, *args, **kwargs):
+        """
+        Runs a write function from sharded_queries, so that the router can stand in for the WriteQueue of the app.
+        Inputs:
+            operation (function): called as operation(router, *args, **kwargs).
+        Returns:
+            object: whatever the operation returned.
+        """
+        return operation(self, *args, **kwargs)
+
+
+def copy_users(conn, source, users):
+    """
+    Copies every row of some users from an attached database into the main database of conn. Rows that are already
+    there are replaced, so a move that was interrupted can simply be run again.
+    Inputs:
+        conn (sqlite3.Connection): a connection to the target shard, with the source attached.
+        source (str): the schema name the source is attached as.
+        users (list of int): the ids of the users.
+    Returns:
+        int: the number of rows copied.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS moving (usr INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.moving")
+    conn.executemany("INSERT INTO temp.moving (usr) VALUES (?)", [(user_id,) for user_id in users])
+    before = conn.total_changes
+    without_timestamps = False
+    for table, condition in reversed(USER_ROWS):
+        # a source from before the ts columns leaves them to fill_timestamps
+        source_columns = set(schema.table_columns(conn, table, source))
+        without_timestamps = without_timestamps or (table in schema.TIMESTAMP_SOURCES and "ts" not in source_columns)
+        columns = ", ".join(f'"{column}"' for column in schema.table_columns(conn, table, "main")
+                            if column in source_columns)
+        conn.execute(f'INSERT OR REPLACE INTO main."{table}" ({columns}) '
+                     f'SELECT {columns} FROM {source}."{table}" WHERE {condition.format(src=source)}')
+    copied = conn.total_changes - before
+    if without_timestamps:
+        schema.fill_timestamps(conn)
+    return copied
+
+
+def delete_users(conn, source, users):
+    """
+    Deletes every row of some users from an attached database.
+    Inputs:
+        conn (sqlite3.Connection): a connection with the source attached.
+        source (str): the schema name the source is attached as.
+        users (list of int): the ids of the users.
+    Returns:
+        None
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS moving (usr INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.moving")
+    conn.executemany("INSERT INTO temp.moving (usr) VALUES (?)", [(user_id,) for user_id in users])
+    for table, condition in USER_ROWS:
+        conn.execute(f'DELETE FROM {source}."{table}" WHERE {condition.format(src=source)}')
+
+
+def open_shard(path):
+    """
+    Opens a shard file for the maintenance commands, creating its tables if needed.
+    Inputs:
+        path (str): the shard file.
+    Returns:
+        sqlite3.Connection: the connection.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL").fetchone()
+    conn.execute("PRAGMA busy_timeout = 5000")
+    schema.create_schema(conn)
+    return conn
+
+
+def create_store(store, shards, source_path=None):
+    """
+    Creates a sharded store, optionally filled with the users of a single database file. Users are placed by
+    usr modulo the number of shards.
+    Inputs:
+        store (str): the directory to create the store in.
+        shards (int): the number of shards.
+        source_path (str or None): a database file to split over the shards.
+    Raises:
+        ValueError: If the directory already holds a store or the source does not exist.
+    Returns:
+        list of int: the number of users on every shard.
+    """
+    if is_sharded(store):
+        raise ValueError(f"{store} already holds a sharded store")
+    if source_path is not None and not os.path.isfile(source_path):
+        raise ValueError(f"Database does not exist: {source_path}")
+    os.makedirs(store, exist_ok=True)
+
+    counts = []
+    placement = []
+    next_usr, next_tid = 1, 1
+    for shard in range(shards):
+        conn = open_shard(shard_path(store, shard))
+        users = []
+        if source_path is not None:
+            conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+            users = [row[0] for row in conn.execute("SELECT usr FROM source.users WHERE usr % ? = ?",
+                                                    (shards, shard))]
+            copy_users(conn, "source", users)
+            next_usr = max(next_usr, conn.execute("SELECT IFNULL(MAX(usr), 0) + 1 FROM source.users").fetchone()[0])
+            next_tid = max(next_tid, conn.execute("SELECT IFNULL(MAX(tid), 0) + 1 FROM source.tweets").fetchone()[0])
+            conn.commit()
+            conn.execute("DETACH DATABASE source")
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.close()
+        counts.append(len(users))
+        placement.extend((user_id, shard) for user_id in users)
+
+    directory = open_directory(store)
+    directory.execute("BEGIN")
+    for sql in DIRECTORY_TABLES:
+        directory.execute(sql)
+    directory.execute("INSERT INTO shard_config (key, value) VALUES ('shards', ?)", (shards,))
+    directory.executemany("INSERT INTO user_shards (usr, shard) VALUES (?, ?)", placement)
+    directory.executemany("INSERT INTO id_sequences (name, next_id) VALUES (?, ?)",
+                          [("usr", next_usr), ("tid", next_tid)])
+    directory.execute("COMMIT")
+    directory.close()
+    return counts
+
+
+def add_shards(store, count):
+    """
+    Adds empty shards to a store, users only go to them once they are moved there or newly created.
+    Inputs:
+        store (str): the directory of the sharded store.
+        count (int): the number of shards to add.
+    Returns:
+        int: the new number of shards.
+    """
+    directory = open_directory(store)
+    shards = shard_count(directory)
+    for shard in range(shards, shards + count):
+        open_shard(shard_path(store, shard)).close()
+    directory.execute("UPDATE shard_config SET value = ? WHERE key = 'shards'", (shards + count,))
+    directory.close()
+    return shards + count
+
+
+def move_user(store, directory, user_id, target):
+    """
+    Moves a user and everything they own to another shard. The rows are copied and committed first, then the
+    directory is pointed at the new shard, and only then are the old rows deleted, so running the move again after a
+    crash finishes it.
+    Inputs:
+        store (str): the directory of the sharded store.
+        directory (sqlite3.Connection): the directory database.
+        user_id (int): the id of the user.
+        target (int): the shard to move to.
+    Raises:
+        ValueError: If the user or the target shard does not exist.
+    Returns:
+        int: the number of rows moved.
+    """
+    row = directory.execute("SELECT shard FROM user_shards WHERE usr = ?", (user_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"No user {user_id}")
+    if not 0 <= target < shard_count(directory):
+        raise ValueError(f"No shard {target}")
+    source = row[0]
+    if source == target:
+        return 0
+
+    conn = sqlite3.connect(shard_path(store, target))
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("ATTACH DATABASE ? AS source", (shard_path(store, source),))
+    try:
+        moved = copy_users(conn, "source", [user_id])
+        conn.commit()
+        directory.execute("UPDATE user_shards SET shard = ? WHERE usr = ?", (target, user_id))
+        delete_users(conn, "source", [user_id])
+        conn.commit()
+    finally:
+        conn.close()
+    return moved
+
+
+def shard_loads(store, directory):
+    """
+    Measures how much every user stores, as one for the user plus their tweets and retweets.
+    Inputs:
+        store (str): the directory of the sharded store.
+        directory (sqlite3.Connection): the directory database.
+    Returns:
+        list of dict: per shard, usr -> load.
+    """
+    loads = []
+    for shard in range(shard_count(directory)):
+        conn = sqlite3.connect(shard_path(store, shard))
+        loads.append(dict(conn.execute("""
+            SELECT u.usr, 1 + (SELECT COUNT(*) FROM tweets WHERE writer_id = u.usr)
+                            + (SELECT COUNT(*) FROM retweets WHERE retweeter_id = u.usr)
+            FROM users u
+        """).fetchall()))
+        conn.close()
+    return loads
+
+
+def plan_rebalance(loads):
+    """
+    Plans moves that even out the load of the shards. Each step moves, from the heaviest shard to the lightest, the
+    biggest user that still leaves the heaviest shard at least as heavy as the lightest one will be.
+    Inputs:
+        loads (list of dict): per shard, usr -> load, see shard_loads. It is not changed.
+    Returns:
+        list of tuple: (usr, from shard, to shard) moves, in order.
+    """
+    loads = [dict(shard) for shard in loads]
+    totals = [sum(shard.values()) for shard in loads]
+    moves = []
+    while True:
+        heaviest = max(range(len(loads)), key=lambda shard: totals[shard])
+        lightest = min(range(len(loads)), key=lambda shard: totals[shard])
+        gap = totals[heaviest] - totals[lightest]
+        candidates = [(load, user_id) for user_id, load in loads[heaviest].items() if load <= gap // 2]
+        if not candidates:
+            return moves
+        load, user_id = max(candidates)
+        del loads[heaviest][user_id]
+        loads[lightest][user_id] = load
+        totals[heaviest] -= load
+        totals[lightest] += load
+        moves.append((user_id, heaviest, lightest))
+
+
+def print_status(store):
+    """
+    Prints the users, tweets and file size of every shard.
+    Inputs:
+        store (str): the directory of the sharded store.
+    Returns:
+        None
+    """
+    directory = open_directory(store)
+    print(f"{'shard':<8}{'users':>10}{'tweets':>10}{'retweets':>10}{'bytes':>14}")
+    for shard in range(shard_count(directory)):
+        path = shard_path(store, shard)
+        conn = sqlite3.connect(path)
+        users, tweets, retweets = conn.execute("SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM tweets), "
+                                               "(SELECT COUNT(*) FROM retweets)").fetchone()
+        conn.close()
+        print(f"{shard:<8}{users:>10}{tweets:>10}{retweets:>10}{os.path.getsize(path):>14}")
+    directory.close()
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the create, status or rebalance command.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Create, inspect and rebalance a sharded store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="create a store, optionally split from a single database")
+    create.add_argument("store", help="the directory to create the store in")
+    create.add_argument("--shards", type=int, default=4, help="number of shards (default 4)")
+    create.add_argument("--from", dest="source", help="a database file to split over the shards")
+    status = commands.add_parser("status", help="show what every shard holds")
+    status.add_argument("store")
+    rebalance = commands.add_parser("rebalance", help="move users between shards, only while the store is not in use")
+    rebalance.add_argument("store")
+    rebalance.add_argument("--add-shards", type=int, default=0, help="add this many empty shards first")
+    rebalance.add_argument("--move", type=int, metavar="USER", help="move one user instead of evening out the shards")
+    rebalance.add_argument("--to", type=int, metavar="SHARD", help="the shard to --move the user to")
+    rebalance.add_argument("--dry-run", action="store_true", help="only print the moves")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        if args.shards < 1:
+            parser.error("--shards must be at least 1")
+        try:
+            counts = create_store(args.store, args.shards, args.source)
+        except (ValueError, sqlite3.Error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"created {args.store} with {args.shards} shards, users per shard: {counts}")
+        print_status(args.store)
+        return 0
+
+    if not is_sharded(args.store):
+        print(f"Error: {args.store} is not a sharded store", file=sys.stderr)
+        return 1
+    if args.command == "status":
+        print_status(args.store)
+        return 0
+
+    if (args.move is None) != (args.to is None):
+        parser.error("--move and --to go together")
+    if args.add_shards and not args.dry_run:
+        print(f"now {add_shards(args.store, args.add_shards)} shards")
+    directory = open_directory(args.store)
+    if args.move is not None:
+        moves = [(args.move, None, args.to)]
+    else:
+        moves = plan_rebalance(shard_loads(args.store, directory))
+    try:
+        for user_id, source, target in moves:
+            if args.dry_run:
+                print(f"would move user {user_id} from shard {source} to shard {target}")
+                continue
+            rows = move_user(args.store, directory, user_id, target)
+            print(f"moved user {user_id} to shard {target} ({rows} rows)")
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        directory.close()
+    print(f"{len(moves)} moves")
+    print_status(args.store)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
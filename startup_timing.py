@@ -0,0 +1,65 @@
+# startup_timing.py
+# Times the start of the app, phase by phase, up to the login window and then up to the database being ready. The app
+# shows the login window before it opens the database, so how long the window takes does not depend on the size of
+# the database; the report shows both. `python main.py database.db --startup-timing` prints it once the database is
+# open.
+import time
+
+
+class StartupTimer:
+    """
+    The moments at which the phases of the start of the app ended.
+    """
+
+    def __init__(self, started=None, clock=time.perf_counter):
+        """
+        Starts the timer.
+        Inputs:
+            started (float or None): when the app started by clock, such as a reading taken before the imports, now
+            when None.
+            clock (function): gets the time in seconds.
+        Returns:
+            None
+        """
+        self.clock = clock
+        self.started = clock() if started is None else started
+        # (phase, seconds since started when it ended), in the order they ended
+        self.marks = []
+
+    def mark(self, phase):
+        """
+        Records that a phase has ended.
+        Inputs:
+            phase (str): the name of the phase.
+        Returns:
+            None
+        """
+        self.marks.append((phase, self.clock() - self.started))
+
+    def elapsed(self, phase):
+        """
+        Gets when a phase ended.
+        Inputs:
+            phase (str): the name of the phase.
+        Returns:
+            float or None: the seconds since the start, None if the phase has not ended.
+        """
+        for name, seconds in self.marks:
+            if name == phase:
+                return seconds
+        return None
+
+    def report(self):
+        """
+        Formats the phases as a table, how long each one took and when it ended.
+        Inputs:
+            None
+        Returns:
+            str: the report.
+        """
+        lines = [f"{'phase':<24}{'took ms':>10}{'at ms':>10}"]
+        previous = 0.0
+        for phase, seconds in self.marks:
+            lines.append(f"{phase:<24}{(seconds - previous) * 1000:>10.1f}{seconds * 1000:>10.1f}")
+            previous = seconds
+        return "\n".join(lines)
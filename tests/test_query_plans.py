@@ -0,0 +1,97 @@
+# tests/test_query_plans.py
+# Fails when a statement that the screens run reads a large table in full or sorts in a temporary B-tree where an
+# index should have been used, see query_plans.py. The database is generated once for the whole module.
+#
+# Usage: python -m pytest tests/test_query_plans.py   or   python -m unittest tests.test_query_plans
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import db
+import queries
+import query_plans
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the names in queries that the screens use that do not run SQL
+NOT_SQL = {"SEARCH_HELP", "extract_hashtags"}
+
+
+def queries_of_the_app():
+    """
+    Finds every query that the app calls, from the source of the screens and of main.py.
+    Inputs:
+        None
+    Returns:
+        set of str: the names of the queries.
+    """
+    names = set()
+    sources = [os.path.join(ROOT, "main.py")] + [os.path.join(ROOT, "screens", name)
+                                                 for name in os.listdir(os.path.join(ROOT, "screens"))
+                                                 if name.endswith(".py")]
+    for path in sources:
+        with open(path) as f:
+            names.update(re.findall(r"\bqueries\.(\w+)", f.read()))
+    # such as the cache of the CachedQueries that stands in for the queries
+    return {name for name in names if hasattr(queries, name)} - NOT_SQL
+
+
+class QueryPlanTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        path = os.path.join(cls.directory, "plans.db")
+        query_plans.generate_database(path, users=10000, tweets=100000)
+        cls.conn = db.open_db(path, load_extension=False)
+        cls.statements = query_plans.collect_statements(cls.conn)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        shutil.rmtree(cls.directory)
+
+    def test_no_query_scans_or_sorts_where_an_index_should_apply(self):
+        failed = [item for item in query_plans.check_plans(self.conn, self.statements) if item[4] is None]
+        message = "\n".join(f"{query}: {line}\n    {' '.join(sql.split())}" for query, problem, line, sql, reason
+                            in failed)
+        self.assertEqual(failed, [], "plans that read a large table in full or sort without an index:\n" + message)
+
+    def test_every_query_of_the_app_is_checked(self):
+        checked = {query for query, shape in self.statements}
+        self.assertEqual(queries_of_the_app() - checked, set(),
+                         "queries that the workload of query_plans.py does not run")
+
+    def test_every_expected_statement_is_collected(self):
+        self.assertEqual(query_plans.missing_statements(self.statements), [],
+                         "statements that the workload of query_plans.py was expected to run")
+
+    def test_hashtags_are_stored_with_their_hash(self):
+        terms = [row[0] for row in self.conn.execute("SELECT DISTINCT term FROM hashtag_mentions")]
+        self.assertTrue(terms)
+        self.assertTrue(all(term.startswith("#") for term in terms), terms)
+
+    def test_a_full_scan_is_found_through_an_alias(self):
+        sql = "SELECT t.tid FROM tweets t WHERE LOWER(t.text) = 'x'"
+        problems = query_plans.plan_problems(sql, query_plans.explain(self.conn, sql))
+        self.assertIn("SCAN tweets", [problem for problem, line in problems])
+
+    def test_a_sort_without_an_index_is_found(self):
+        sql = "SELECT usr FROM users WHERE usr < 100 ORDER BY email"
+        problems = query_plans.plan_problems(sql, query_plans.explain(self.conn, sql))
+        self.assertIn("TEMP B-TREE", [problem for problem, line in problems])
+
+    def test_an_indexed_lookup_has_no_problem(self):
+        sql = "SELECT tid FROM tweets WHERE writer_id = 1 ORDER BY ts DESC LIMIT 3"
+        self.assertEqual(query_plans.plan_problems(sql, query_plans.explain(self.conn, sql)), [])
+
+    def test_a_scan_is_only_accepted_in_the_statement_it_is_meant_for(self):
+        hashtag_search = "SELECT T.tid FROM tweets T JOIN hashtag_mentions H ON H.tid = T.tid WHERE LOWER(H.term) = '#a'"
+        self.assertIsNone(query_plans.accepted_reason("search_tweets", "SCAN tweets", hashtag_search))
+        word_search = "SELECT T.tid FROM tweets T WHERE regexp_like(LOWER(T.text), 'a')"
+        self.assertIsNotNone(query_plans.accepted_reason("search_tweets", "SCAN tweets", word_search))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# trace_hooks.py
+# The hooks through which the app and its screens report the steps of a session to the recorder of session_trace.py.
+# They are kept apart from it so that the app can be decorated with them without importing the replay, which needs
+# most of the modules of the app; session_trace.py is only imported when a trace is recorded.
+import functools
+
+# the recorder that the app reports to, None when it is not recording
+active = None
+
+# screen class -> the step that shows it
+SCREEN_STEPS = {
+    "LoginScreen": "login",
+    "SignupScreen": "signup",
+    "MainMenuScreen": "main_menu",
+    "FeedScreen": "feed",
+    "SearchTweetsScreen": "search_tweets",
+    "SearchUsersScreen": "search_users",
+    "UserProfileScreen": "user_profile",
+    "UserTweetsScreen": "user_tweets",
+    "TweetDetailScreen": "tweet_detail",
+    "ComposeTweetScreen": "compose_tweet",
+    "ReplyTweetScreen": "reply_tweet",
+    "ListFollowersScreen": "list_followers",
+    "TrendingScreen": "trending",
+}
+
+
+def record(screen, user_id, target=None, **fields):
+    """
+    Records a step of the session when the app is recording, and the step is not part of a navigation (the replay
+    runs what a screen does when it is shown as part of the step that shows it).
+    Inputs:
+        screen (str): the kind of step.
+        user_id (int or None): the user that is logged in.
+        target (int or None): the user or the tweet that the step is about.
+        fields: the other fields of the step.
+    Returns:
+        None
+    """
+    if active is not None and not active.depth:
+        active.record(screen, user_id, target, **fields)
+
+
+def record_screen(screen):
+    """
+    Records that a screen is shown.
+    Inputs:
+        screen (Screen): the screen, at the top of the screen stack.
+    Returns:
+        None
+    """
+    target = getattr(screen, "target_user_id", getattr(screen, "tweet_id", None))
+    record(SCREEN_STEPS[type(screen).__name__], getattr(screen, "user_id", None), target)
+
+
+def recorded_navigation(method):
+    """
+    Records the screen that a navigation method of the app leaves at the top of its screen stack, when a recorder is
+    active. A navigation that runs inside another one is left to the outer one.
+    Inputs:
+        method (function): the method.
+    Returns:
+        function: the method, recorded.
+    """
+    @functools.wraps(method)
+    def recorded(app, *args, **kwargs):
+        if active is None:
+            return method(app, *args, **kwargs)
+        active.depth += 1
+        try:
+            result = method(app, *args, **kwargs)
+        finally:
+            active.depth -= 1
+        if len(app.screen_stack):
+            record_screen(app.screen_stack.peek())
+        return result
+    return recorded
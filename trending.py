@@ -0,0 +1,308 @@
+# trending.py
+# Keeps the numbers behind the trending hashtags screen up to date as hashtags are posted, so that showing them is one
+# indexed read instead of a GROUP BY over all of hashtag_mentions. For every term there are
+#   - the number of mentions per hour and per day (hashtag_buckets), for the last HOURLY_BUCKETS_KEPT hours and the last
+#     DAILY_BUCKETS_KEPT days,
+#   - an exponentially decayed count of its mentions (trending_terms), where a mention loses half of its weight every
+#     HALF_LIFE_HOURS hours.
+# Decaying every term whenever anything is posted would rewrite the whole table, so a mention is instead weighted up the
+# later it happens: a mention at hour h adds 2 ** ((h - base) / HALF_LIFE_HOURS). The order of the terms then never
+# changes as time passes, the top terms are a scan of the weight index, and dividing a weight by
+# 2 ** ((now - base) / HALF_LIFE_HOURS) gives the decayed count. When the weights get too large the base moves up to
+# the present and every weight is scaled down, which also drops the terms that have decayed to nothing.
+#
+# The tables are created, and filled from the recent tweets already in the database, the first time a writable
+# connection opens it (see db.open_db), so that posting a hashtag never has to read more than its own rows.
+# bulk_import.py rebuilds them after a load.
+#
+# Usage: python trending.py rebuild database.db
+#        python trending.py top database.db [--limit N]
+import argparse
+import calendar
+import datetime
+import os
+import sqlite3
+import sys
+from collections import Counter
+
+HALF_LIFE_HOURS = 12
+HOURLY_BUCKETS_KEPT = 48
+DAILY_BUCKETS_KEPT = 30
+
+# the base moves up once a new mention would weigh more than 2 ** MAX_EXPONENT
+MAX_EXPONENT = 64
+# after the base has moved, terms with less than this decayed count are dropped
+DROP_BELOW = 0.001
+
+TABLES = [
+    ("trending_state", """CREATE TABLE IF NOT EXISTS trending_state (
+    base_hour   REAL NOT NULL
+)"""),
+    ("trending_terms", """CREATE TABLE IF NOT EXISTS trending_terms (
+    term        TEXT PRIMARY KEY,
+    weight      REAL NOT NULL
+)"""),
+    ("idx_trending_terms_weight", "CREATE INDEX IF NOT EXISTS idx_trending_terms_weight ON trending_terms (weight)"),
+    ("hashtag_buckets", """CREATE TABLE IF NOT EXISTS hashtag_buckets (
+    term        TEXT,
+    granularity TEXT,
+    bucket      TEXT,
+    mentions    INTEGER NOT NULL,
+    PRIMARY KEY (term, granularity, bucket)
+)"""),
+]
+
+
+def parse_time(tdate, ttime):
+    """
+    Reads the date and time of a tweet.
+    Inputs:
+        tdate, ttime: the tdate and ttime columns, as 'YYYY-MM-DD' and 'HH:MM:SS'.
+    Returns:
+        datetime.datetime: the moment of the tweet, in the same local time that post_tweet writes.
+    """
+    return datetime.datetime.fromisoformat(f"{tdate} {ttime}")
+
+
+def hour_of(moment):
+    """
+    Gets the number of hours between 1970 and a moment, both in local time.
+    Inputs:
+        moment (datetime.datetime): the moment.
+    Returns:
+        float: the hours.
+    """
+    return calendar.timegm(moment.timetuple()) / 3600
+
+
+def buckets_of(moment):
+    """
+    Gets the hourly and the daily bucket that a moment falls in.
+    Inputs:
+        moment (datetime.datetime): the moment.
+    Returns:
+        tuple: ('YYYY-MM-DD HH', 'YYYY-MM-DD')
+    """
+    return moment.strftime("%Y-%m-%d %H"), moment.strftime("%Y-%m-%d")
+
+
+def tables_exist(conn):
+    """
+    Checks whether the trending tables have been created in the main database.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+    Returns:
+        bool: True when they exist.
+    """
+    return conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'trending_state'"
+                        ).fetchone() is not None
+
+
+def decay_factor(base_hour, now):
+    """
+    Gets what the stored weights are divided by to get the decayed counts at a moment.
+    Inputs:
+        base_hour (float): the base of the weights, from trending_state.
+        now (datetime.datetime): the moment.
+    Returns:
+        float: the divisor.
+    """
+    return 2 ** ((hour_of(now) - base_hour) / HALF_LIFE_HOURS)
+
+
+def _oldest_buckets(latest):
+    """
+    Gets the oldest hourly and daily buckets that are kept.
+    Inputs:
+        latest (datetime.datetime): the newest mention.
+    Returns:
+        tuple: ('YYYY-MM-DD HH', 'YYYY-MM-DD')
+    """
+    return (buckets_of(latest - datetime.timedelta(hours=HOURLY_BUCKETS_KEPT))[0],
+            buckets_of(latest - datetime.timedelta(days=DAILY_BUCKETS_KEPT))[1])
+
+
+def _move_base(conn, base_hour, new_base_hour, latest):
+    """
+    Scales every weight to a later base and drops the terms that have decayed to nothing, as well as the buckets of
+    every term that are too old to be kept.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        base_hour (float): the current base.
+        new_base_hour (float): the new base.
+        latest (datetime.datetime): the newest mention.
+    Returns:
+        None
+    """
+    conn.execute("UPDATE trending_terms SET weight = weight * ?",
+                 (2 ** ((base_hour - new_base_hour) / HALF_LIFE_HOURS),))
+    conn.execute("DELETE FROM trending_terms WHERE weight < ?", (DROP_BELOW,))
+    conn.execute("UPDATE trending_state SET base_hour = ?", (new_base_hour,))
+    conn.execute("""
+        DELETE FROM hashtag_buckets
+        WHERE (granularity = 'hour' AND bucket < ?) OR (granularity = 'day' AND bucket < ?)
+    """, _oldest_buckets(latest))
+
+
+def _add_mentions(conn, mentions):
+    """
+    Adds hashtag mentions to the counters and forgets the buckets of those terms that are too old to be kept.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        mentions (list of tuple): (term, moment) pairs, the term lowercased with its leading '#'.
+    Returns:
+        None
+    """
+    if not mentions:
+        return
+    base_hour = conn.execute("SELECT base_hour FROM trending_state").fetchone()[0]
+    latest = max(moment for term, moment in mentions)
+    if (hour_of(latest) - base_hour) / HALF_LIFE_HOURS > MAX_EXPONENT:
+        new_base_hour = float(int(hour_of(latest)))
+        _move_base(conn, base_hour, new_base_hour, latest)
+        base_hour = new_base_hour
+
+    weights = Counter()
+    buckets = Counter()
+    for term, moment in mentions:
+        weights[term] += 2 ** ((hour_of(moment) - base_hour) / HALF_LIFE_HOURS)
+        hour, day = buckets_of(moment)
+        buckets[(term, "hour", hour)] += 1
+        buckets[(term, "day", day)] += 1
+    conn.executemany("""
+        INSERT INTO trending_terms (term, weight) VALUES (?, ?)
+        ON CONFLICT (term) DO UPDATE SET weight = weight + excluded.weight
+    """, weights.items())
+    conn.executemany("""
+        INSERT INTO hashtag_buckets (term, granularity, bucket, mentions) VALUES (?, ?, ?, ?)
+        ON CONFLICT (term, granularity, bucket) DO UPDATE SET mentions = mentions + excluded.mentions
+    """, [(term, granularity, bucket, count) for (term, granularity, bucket), count in buckets.items()])
+
+    oldest_hour, oldest_day = _oldest_buckets(latest)
+    conn.executemany("""
+        DELETE FROM hashtag_buckets WHERE term = ? AND
+            ((granularity = 'hour' AND bucket < ?) OR (granularity = 'day' AND bucket < ?))
+    """, [(term, oldest_hour, oldest_day) for term in weights])
+
+
+def rebuild(conn, now=None):
+    """
+    Creates the trending tables if needed and fills them from the hashtag mentions of the last DAILY_BUCKETS_KEPT
+    days, replacing whatever they held. Older mentions would have decayed to nothing anyway. Does not commit.
+    Inputs:
+        conn (sqlite3.Connection): the database connection.
+        now (datetime.datetime or None): the present, datetime.now() when None.
+    Returns:
+        int: the number of mentions counted.
+    """
+    now = now or datetime.datetime.now()
+    for name, sql in TABLES:
+        conn.execute(sql)
+    conn.execute("DELETE FROM trending_state")
+    conn.execute("DELETE FROM trending_terms")
+    conn.execute("DELETE FROM hashtag_buckets")
+    conn.execute("INSERT INTO trending_state (base_hour) VALUES (?)", (float(int(hour_of(now))),))
+
+    since = buckets_of(now - datetime.timedelta(days=DAILY_BUCKETS_KEPT))[1]
+    mentions = []
+    for term, tdate, ttime in conn.execute("""
+        SELECT H.term, T.tdate, T.ttime
+        FROM hashtag_mentions H
+        JOIN tweets T ON T.tid = H.tid
+        WHERE T.tdate >= ?
+    """, (since,)):
+        try:
+            mentions.append((term.lower(), parse_time(tdate, ttime)))
+        except (TypeError, ValueError):
+            # a tweet without a usable date cannot be placed in a bucket
+            continue
+    _add_mentions(conn, mentions)
+    return len(mentions)
+
+
+def create_tables(conn):
+    """
+    Creates the trending tables of a database that does not have them yet and fills them from its recent mentions (see
+    rebuild). Every connection that opens such a database tries this at the same time, so it is done under the write
+    lock and only by the first one. A database without hashtag_mentions, such as one that is about to be loaded, is
+    left alone.
+    Inputs:
+        conn (sqlite3.Connection): a writable connection, not in a transaction.
+    Returns:
+        bool: True if this connection created them.
+    """
+    if tables_exist(conn) or not conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' "
+                                              "AND name = 'hashtag_mentions'").fetchone():
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        created = not tables_exist(conn)
+        if created:
+            rebuild(conn)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return created
+
+
+def record(conn, hashtags, tdate, ttime):
+    """
+    Counts the hashtags of a tweet that has just been inserted, in the same transaction. Nothing is counted in a
+    database without the trending tables, create_tables or rebuild fill them from hashtag_mentions later.
+    Inputs:
+        conn (sqlite3.Connection): the connection that inserted the tweet.
+        hashtags (iterable of str): the hashtags of the tweet, with the leading '#'.
+        tdate (str), ttime (str): the date and time of the tweet.
+    Returns:
+        None
+    """
+    hashtags = {term.lower() for term in hashtags}
+    if not hashtags:
+        return
+    if not tables_exist(conn):
+        return
+    moment = parse_time(tdate, ttime)
+    _add_mentions(conn, [(term, moment) for term in hashtags])
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the rebuild or top command.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(description="Maintain and show the trending hashtags.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild", help="recount the trending tables from hashtag_mentions")
+    rebuild_parser.add_argument("database")
+    top_parser = commands.add_parser("top", help="show the trending hashtags")
+    top_parser.add_argument("database")
+    top_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.database):
+        print(f"Error: Database does not exist: {args.database}", file=sys.stderr)
+        return 1
+    # imported here since queries records through this module
+    import queries
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.command == "rebuild":
+            print(f"{rebuild(conn)} mentions counted")
+            conn.commit()
+        print(f"{'hashtag':<24}{'score':>10}{'this hour':>11}{'today':>8}")
+        for term, score, this_hour, today in queries.get_trending_hashtags(conn, args.limit):
+            print(f"{term:<24}{score:>10.2f}{this_hour:>11}{today:>8}")
+    except sqlite3.Error as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+# ui_latency.py
+# Measures how long the screens take to respond. Every navigation of the app (the show_*_screen methods, back,
+# back_to_main_menu and reload) and every handler that pages, scrolls or searches a list is an action, and each time
+# one runs its time is split in three:
+#   query  - spent in the queries and the write queue, so in SQLite,
+#   build  - the rest of the handler, mostly making and configuring Tk widgets,
+#   layout - the geometry and drawing that Tk does for the new widgets, measured by running its idle tasks right after.
+# The times are kept per action and summarised as percentiles. The app records them with --latency-overlay (F12 shows
+# the last action and its percentiles over the window) or --latency-report FILE (written as JSON when the app exits);
+# `python ui_latency.py compare before.json after.json` lists the actions that got slower between two reports.
+#
+# Usage: python ui_latency.py compare baseline.json current.json [--percentile p90] [--tolerance 1.25]
+#        python ui_latency.py show report.json
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from contextlib import contextmanager
+
+# the parts of an action, in the order of the reports
+PARTS = ["total", "query", "build", "layout"]
+PERCENTILES = [("p50", 50), ("p90", 90), ("p99", 99)]
+
+# the recorder that timed_action reports to, None when the app is not measuring
+active = None
+
+
+def percentile(sorted_values, percent):
+    """
+    Gets a percentile by the nearest-rank method.
+    Inputs:
+        sorted_values (list of float): the values, in increasing order, at least one.
+        percent (float): the percentile, between 0 and 100.
+    Returns:
+        float: the smallest value that at least percent % of the values are less than or equal to.
+    """
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class LatencyRecorder:
+    """
+    The times of the actions, the newest max_samples of each. Actions are only timed on the thread that created the
+    recorder, the thread of the interface.
+    """
+
+    def __init__(self, root=None, clock=time.perf_counter, max_samples=1000):
+        """
+        Creates an empty recorder.
+        Inputs:
+            root (tk.Tk or None): the window, whose idle tasks are run after an action to time the layout. The layout
+            is not timed when None.
+            clock (function): gets the time in seconds.
+            max_samples (int): how many of the latest samples are kept per action.
+        Returns:
+            None
+        """
+        self.root = root
+        self.clock = clock
+        self.max_samples = max_samples
+        self.thread = threading.get_ident()
+        # action -> deque of (total, query, build, layout) in seconds
+        self.samples = {}
+        # the actions that are running, innermost last, as [name, start, query seconds]
+        self.running = []
+        # called with (name, sample) after every action, such as the overlay
+        self.listeners = []
+
+    @contextmanager
+    def action(self, name):
+        """
+        Times an action. An action that runs inside another one is timed on its own, and its time is also part of the
+        one around it; only the outermost action times the layout.
+        Inputs:
+            name (str): the name of the action.
+        Returns:
+            context manager
+        """
+        if threading.get_ident() != self.thread:
+            yield
+            return
+        frame = [name, self.clock(), 0.0]
+        self.running.append(frame)
+        try:
+            yield
+        finally:
+            end = self.clock()
+            self.running.pop()
+            layout = 0.0
+            if not self.running and self.root is not None:
+                try:
+                    self.root.update_idletasks()
+                except Exception:
+                    # the window is gone, the app is closing
+                    pass
+                layout = self.clock() - end
+            query = frame[2]
+            build = max(0.0, end - frame[1] - query)
+            self.add(name, (query + build + layout, query, build, layout))
+
+    def add(self, name, sample):
+        """
+        Keeps the times of one run of an action.
+        Inputs:
+            name (str): the action.
+            sample (tuple): (total, query, build, layout) in seconds.
+        Returns:
+            None
+        """
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.max_samples)
+        self.samples[name].append(sample)
+        for listener in self.listeners:
+            listener(name, sample)
+
+    def add_query_time(self, seconds):
+        """
+        Counts time spent in a query towards the actions that are running.
+        Inputs:
+            seconds (float): the time.
+        Returns:
+            None
+        """
+        for frame in self.running:
+            frame[2] += seconds
+
+    def is_timing(self):
+        """
+        Tells whether a query that starts now is part of an action.
+        Inputs:
+            None
+        Returns:
+            bool: True on the thread of the interface while an action is running.
+        """
+        return bool(self.running) and threading.get_ident() == self.thread
+
+    def summary(self):
+        """
+        Summarises the times of every action.
+        Inputs:
+            None
+        Returns:
+            dict: action -> {"count": n, part: {"p50": ms, "p90": ms, "p99": ms, "max": ms} for every part in PARTS}
+        """
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            entry = {"count": len(samples)}
+            for j, part in enumerate(PARTS):
+                values = sorted(sample[j] * 1000 for sample in samples)
+                entry[part] = {label: round(percentile(values, percent), 3) for label, percent in PERCENTILES}
+                entry[part]["max"] = round(values[-1], 3)
+            result[name] = entry
+        return result
+
+    def write(self, path):
+        """
+        Writes the summary to a JSON file.
+        Inputs:
+            path (str): the file.
+        Returns:
+            None
+        """
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def format_summary(summary):
+    """
+    Formats a summary as a table, the p50 / p90 / p99 of every part in ms.
+    Inputs:
+        summary (dict): see LatencyRecorder.summary.
+    Returns:
+        str: the table.
+    """
+    lines = [f"{'action':<40}{'count':>6}  " + "  ".join(f"{part + ' p50/p90/p99':>24}" for part in PARTS)]
+    for name, entry in summary.items():
+        cells = ["/".join(f"{entry[part][label]:.1f}" for label, percent in PERCENTILES) for part in PARTS]
+        lines.append(f"{name:<40}{entry['count']:>6}  " + "  ".join(f"{cell:>24}" for cell in cells))
+    return "\n".join(lines)
+
+
+def timed_action(method):
+    """
+    Times a method of the app or of a screen as an action named after its class and itself, when a recorder is active.
+    Inputs:
+        method (function): the method.
+    Returns:
+        function: the method, timed.
+    """
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        if active is None:
+            return method(self, *args, **kwargs)
+        with active.action(f"{type(self).__name__}.{method.__name__}"):
+            return method(self, *args, **kwargs)
+    return timed
+
+
+class TimedCalls:
+    """
+    Stands in for the queries (or the write queue) of the app and counts the time of every call made during an action
+    as query time. Everything else is passed on to what it wraps.
+    """
+
+    def __init__(self, recorder, base):
+        """
+        Inputs:
+            recorder (LatencyRecorder): where the time is counted.
+            base (module or object): what the calls are passed on to.
+        Returns:
+            None
+        """
+        self.recorder = recorder
+        self.base = base
+
+    def __getattr__(self, name):
+        value = getattr(self.base, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def timed(*args, **kwargs):
+            if not self.recorder.is_timing():
+                return value(*args, **kwargs)
+            start = self.recorder.clock()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self.recorder.add_query_time(self.recorder.clock() - start)
+        return timed
+
+
+class LatencyOverlay:
+    """
+    A box in the bottom right corner of the window with the times of the last action and its percentiles, shown and
+    hidden with F12. It is placed over the screen rather than packed, so the layout of the screens does not change,
+    and it is made again when a screen clears the window.
+    """
+
+    def __init__(self, root, recorder):
+        """
+        Starts showing the times of the actions of a recorder.
+        Inputs:
+            root (tk.Tk): the window.
+            recorder (LatencyRecorder): the recorder.
+        Returns:
+            None
+        """
+        self.root = root
+        self.recorder = recorder
+        self.label = None
+        self.visible = True
+        self.text = "F12 hides the action times"
+        recorder.listeners.append(self.update)
+        root.bind("<F12>", lambda event: self.toggle())
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.show()
+
+    def update(self, name, sample):
+        """
+        Shows the times of an action that has just ended.
+        Inputs:
+            name (str): the action.
+            sample (tuple): its (total, query, build, layout) in seconds.
+        Returns:
+            None
+        """
+        totals = sorted(other[0] * 1000 for other in self.recorder.samples[name])
+        percentiles = "  ".join(f"{label} {percentile(totals, percent):.1f}" for label, percent in PERCENTILES)
+        self.text = (f"{name}: {sample[0] * 1000:.1f} ms\n"
+                     f"query {sample[1] * 1000:.1f}  build {sample[2] * 1000:.1f}  layout {sample[3] * 1000:.1f}\n"
+                     f"{percentiles} of {len(totals)}")
+        self.show()
+
+    def show(self):
+        if self.label is None or not self.label.winfo_exists():
+            self.label = tk.Label(self.root, justify=tk.LEFT, font=("Courier", 9), background="#ffffe0",
+                                  relief=tk.SOLID, borderwidth=1)
+        if self.visible:
+            self.label.config(text=self.text)
+            self.label.place(relx=1.0, rely=1.0, anchor=tk.SE)
+            self.label.lift()
+        else:
+            self.label.place_forget()
+
+
+def compare(baseline, current, part="total", label="p90", tolerance=1.25, floor_ms=1.0):
+    """
+    Finds the actions that got slower between two summaries.
+    Inputs:
+        baseline (dict): the summary before, see LatencyRecorder.summary.
+        current (dict): the summary after.
+        part (str): the part of the time to compare, one of PARTS.
+        label (str): the percentile to compare, such as "p90".
+        tolerance (float): how many times slower an action may get before it counts.
+        floor_ms (float): times below this are never counted, they are mostly noise.
+    Returns:
+        list of tuple: (action, before ms, after ms) for every action that got slower, the worst first.
+    """
+    slower = []
+    for name, entry in current.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name][part][label], entry[part][label]
+        if after > floor_ms and after > before * tolerance:
+            slower.append((name, before, after))
+    return sorted(slower, key=lambda item: item[2] / max(item[1], 1e-9), reverse=True)
+
+
+def read_summary(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    """
+    Prints a report, or compares two.
+    Inputs:
+        argv (list of str or None): the arguments, sys.argv is used when None.
+    Returns:
+        int: the exit code, 1 when compare finds an action that got slower.
+    """
+    parser = argparse.ArgumentParser(description="Show and compare the action times that the app recorded.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="print a report as a table").add_argument("report")
+    compare_parser = commands.add_parser("compare", help="list the actions that got slower")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--part", choices=PARTS, default="total")
+    compare_parser.add_argument("--percentile", choices=[label for label, percent in PERCENTILES] + ["max"],
+                                default="p90")
+    compare_parser.add_argument("--tolerance", type=float, default=1.25)
+    compare_parser.add_argument("--floor-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    paths = [args.report] if args.command == "show" else [args.baseline, args.current]
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"Error: Report does not exist: {path}", file=sys.stderr)
+            return 1
+    if args.command == "show":
+        print(format_summary(read_summary(args.report)))
+        return 0
+
+    slower = compare(read_summary(args.baseline), read_summary(args.current), args.part, args.percentile,
+                     args.tolerance, args.floor_ms)
+    for name, before, after in slower:
+        print(f"{name}: {args.part} {args.percentile} {before:.1f} ms -> {after:.1f} ms")
+    if not slower:
+        print("No action got slower.")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+# write_queue.py
+# Group commit for the write path. Instead of every action committing (and syncing the file) on its own, the actions
+# are handed to a single writer thread that runs everything that is pending inside one transaction. Each action gets its
+# own savepoint, so one failing action does not undo the others, and its caller only hears back once the transaction
+# that contains it has really been committed.
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# tells the writer thread to finish what is pending and stop
+_STOP = object()
+
+
+class _PendingWrite:
+    """
+    A write waiting in the queue: the function to run on the writer connection and the future of its caller.
+    """
+    def __init__(self, operation, args, kwargs):
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    """
+    Batches writes from any number of threads into shared transactions on one connection.
+
+    An operation is any function taking the connection as its first argument that does not commit, such as
+    queries.post_tweet or queries.follow_user. A batch is committed as soon as max_batch operations are waiting, or
+    max_delay_ms after the first operation of the batch was picked up, whichever happens first.
+    """
+
+    def __init__(self, conn, max_batch=100, max_delay_ms=5):
+        """
+        Starts the writer thread.
+        Inputs:
+            conn (sqlite3.Connection): the connection that the writer thread will own. It must have been opened with
+            check_same_thread=False and must not be used by anything else.
+            max_batch (int): the most operations that go into one transaction.
+            max_delay_ms (float): how long the writer waits for more operations before committing a batch.
+        Returns:
+            None
+        """
+        self.conn = conn
+        # we issue BEGIN/COMMIT ourselves, so the sqlite3 module must not open transactions on its own
+        self.conn.isolation_level = None
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, max_delay_ms / 1000.0)
+        self.pending = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.operations = 0
+        self.failed_commits = 0
+        # seconds spent waiting for the write lock in BEGIN IMMEDIATE, and in COMMIT
+        self.lock_wait_seconds = 0.0
+        self.commit_seconds = 0.0
+
+        self.thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self.thread.start()
+
+    def submit(self, operation, *args, **kwargs):
+        """
+        Queues an operation without waiting for it.
+        Inputs:
+            operation (function): called as operation(conn, *args, **kwargs) inside the batch transaction.
+        Raises:
+            RuntimeError: If the queue has been closed.
+        Returns:
+            concurrent.futures.Future: resolves to the return value of the operation once its batch is committed, or
+            to the exception that the operation (or the commit) raised.
+        """
+        item = _PendingWrite(operation, args, kwargs)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The write queue has been closed")
+            self.pending.put(item)
+        return item.future
+
+    def execute(self, operation, *args, **kwargs):
+        """
+        Queues an operation and waits until it has been committed.
+        Inputs:
+            operation (function): see submit.
+        Raises:
+            Exception: whatever the operation or the commit raised, usually an sqlite3.Error.
+        Returns:
+            object: the return value of the operation.
+        """
+        return self.submit(operation, *args, **kwargs).result()
+
+    def close(self):
+        """
+        Commits everything that is still pending, stops the writer thread and closes its connection.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.put(_STOP)
+        self.thread.join()
+        self.conn.close()
+
+    def stats(self):
+        """
+        Gets counters about the batching so far.
+        Inputs:
+            None
+        Returns:
+            dict: the number of batches and operations, the average batch size, the number of failed commits and the
+            seconds spent waiting for the write lock and committing.
+        """
+        return {
+            "batches": self.batches,
+            "operations": self.operations,
+            "average_batch": self.operations / self.batches if self.batches else 0.0,
+            "failed_commits": self.failed_commits,
+            "lock_wait_seconds": self.lock_wait_seconds,
+            "commit_seconds": self.commit_seconds,
+        }
+
+    def _collect_batch(self, first):
+        """
+        Gathers the operations of the next batch, starting with one that was already taken from the queue.
+        Inputs:
+            first (_PendingWrite): the first operation of the batch.
+        Returns:
+            tuple: (list of _PendingWrite, bool telling whether the queue was asked to stop)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            # whatever is already waiting is taken right away, after that we wait until the deadline
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        """
+        The body of the writer thread.
+        Inputs:
+            None
+        Returns:
+            None
+        """
+        stopping = False
+        while not stopping:
+            first = self.pending.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect_batch(first)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        """
+        Runs a batch of operations in one transaction, each one inside its own savepoint, and then resolves their
+        futures.
+        Inputs:
+            batch (list of _PendingWrite): the operations to run.
+        Returns:
+            None
+        """
+        # callers that cancelled their future before we got to it are skipped
+        batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            # IMMEDIATE takes the write lock now, so that we wait for other processes here (busy_timeout) instead of
+            # failing half way through the batch
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            self.lock_wait_seconds += time.perf_counter() - start
+            self.failed_commits += 1
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        self.lock_wait_seconds += time.perf_counter() - start
+
+        done = []
+        for item in batch:
+            self.conn.execute("SAVEPOINT write_op")
+            try:
+                result = item.operation(self.conn, *item.args, **item.kwargs)
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO write_op")
+                self.conn.execute("RELEASE write_op")
+                item.future.set_exception(e)
+                continue
+            self.conn.execute("RELEASE write_op")
+            done.append((item, result))
+
+        start = time.perf_counter()
+        try:
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.commit_seconds += time.perf_counter() - start
+            self.failed_commits += 1
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            for item, result in done:
+                item.future.set_exception(e)
+            return
+
+        self.commit_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.operations += len(done)
+        for item, result in done:
+            item.future.set_result(result)